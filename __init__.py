@@ -0,0 +1,4 @@
+from .modules.loader import load, cache_info, LoadedProgram, LoadCache, LOAD_CACHE
+from .modules.trace import ring_buffer, render, read_trace, TraceFile
+from .modules.memo import MemoCache
+from .modules.classes import Limits
@@ -1,6 +1,31 @@
 import sys
+import json
 import os.path
 from .modules.program import Program
+from .modules.batch import run_program, run_many, find_programs, summarize
+from .modules.output import OutputWriter, FLUSH_POLICIES
+from .modules.inputs import InputReader
+from .modules.cache import ProgramCache
+from .modules.errors import PseudoLangError
+from .modules.classes import parse_limits
+from .modules.profiler import Profiler
+from .modules.trace import TraceFile, read_trace, render
+from .modules.source import SourceFile
+from .modules.optimizer import LEVELS, listing
+from .modules.memo import MemoCache
+
+def pop_option(arguments, name):
+    # Removes "name value" from the arguments and returns the value
+    value = None
+    while name in arguments:
+        index = arguments.index(name)
+        value = arguments[index + 1] if index + 1 < len(arguments) else ""
+        del arguments[index:index + 2]
+    return value
+
+def print_passes(name, instructions):
+    # The program after every optimizer pass, for -passes
+    print(f"After {name}:\n{listing(instructions)}", file=sys.stderr)
 
 def run():
     arguments = sys.argv.copy()
@@ -12,18 +37,194 @@ def run():
     while DEV in arguments:
         arguments.remove(DEV)
 
+    VM = "-vm"
+    vm_flag = False
+    if VM in arguments:
+        vm_flag = True
+    while VM in arguments:
+        arguments.remove(VM)
+
+    PY = "-py"
+    py_flag = False
+    if PY in arguments:
+        py_flag = True
+    while PY in arguments:
+        arguments.remove(PY)
+
+    STREAM = "-stream"
+    stream_flag = False
+    if STREAM in arguments:
+        stream_flag = True
+    while STREAM in arguments:
+        arguments.remove(STREAM)
+
+    NOCACHE = "-nocache"
+    cache_flag = True
+    if NOCACHE in arguments:
+        cache_flag = False
+    while NOCACHE in arguments:
+        arguments.remove(NOCACHE)
+
+    FLUSH = "-flush"
+    flush_policy = pop_option(arguments, FLUSH)
+    if flush_policy is not None and flush_policy not in FLUSH_POLICIES:
+        print(f"{FLUSH} must be followed by one of: {', '.join(FLUSH_POLICIES)}")
+        return
+
+    INPUT = "-input"
+    input_path = pop_option(arguments, INPUT)
+
+    BATCH = "-batch"
+    batch_directory = pop_option(arguments, BATCH)
+
+    TIMEOUT = "-timeout"
+    timeout = pop_option(arguments, TIMEOUT)
+    try:
+        timeout = 10.0 if timeout is None else float(timeout)
+    except ValueError:
+        print(f"{TIMEOUT} must be followed by a number of seconds")
+        return
+
+    LIMITS = "-limits"
+    limits = pop_option(arguments, LIMITS)
+    if limits is not None:
+        try:
+            limits = parse_limits(limits)
+        except ValueError:
+            print(f"{LIMITS} must be followed by limits such as instructions=1000000,time=5,output=100000,depth=100")
+            return
+
+    PROFILE = "-profile"
+    profile_path = pop_option(arguments, PROFILE)
+    if profile_path == "":
+        print(f"{PROFILE} must be followed by the file to write the profile to")
+        return
+
+    TRACE = "-trace"
+    trace_path = pop_option(arguments, TRACE)
+    if trace_path == "":
+        print(f"{TRACE} must be followed by the file to write the trace to")
+        return
+
+    SHOWTRACE = "-showtrace"
+    showtrace_path = pop_option(arguments, SHOWTRACE)
+
+    TAIL = "-tail"
+    tail = pop_option(arguments, TAIL)
+    try:
+        tail = 0 if tail is None else int(tail)
+    except ValueError:
+        print(f"{TAIL} must be followed by a number of trace records")
+        return
+
+    OPTIMIZE = "-O"
+    level = pop_option(arguments, OPTIMIZE)
+    try:
+        level = 0 if level is None else int(level)
+    except ValueError:
+        level = None
+    if level not in LEVELS:
+        print(f"{OPTIMIZE} must be followed by one of: {', '.join(str(level) for level in LEVELS)}")
+        return
+
+    PASSES = "-passes"
+    passes_flag = False
+    if PASSES in arguments:
+        passes_flag = True
+    while PASSES in arguments:
+        arguments.remove(PASSES)
+    if passes_flag and level == 0:
+        print(f"{PASSES} shows the optimizer passes, so it needs {OPTIMIZE} 1 or higher")
+        return
+
+    MEMO = "-memo"
+    memo_size = pop_option(arguments, MEMO)
+    memo = None
+    if memo_size is not None:
+        try:
+            memo_size = int(memo_size)
+        except ValueError:
+            memo_size = 0
+        if memo_size < 1:
+            print(f"{MEMO} must be followed by the number of FUNCTION results to keep")
+            return
+        memo = MemoCache(memo_size)
+
+    mode = "py" if py_flag else "vm" if vm_flag else "tree"
+    if profile_path is not None:
+        # Lines are timed as the tree walker executes them
+        mode = "tree"
+
+    if input_path is not None and not os.path.exists(input_path):
+        print(f"File '{input_path}' not found")
+        return
+
+    if showtrace_path is not None:
+        if not os.path.exists(showtrace_path):
+            print(f"File '{showtrace_path}' not found")
+            return
+        with open(showtrace_path, "r") as file:
+            render(read_trace(file), OutputWriter(policy=flush_policy))
+        return
+
+    if batch_directory is not None:
+        if not os.path.isdir(batch_directory):
+            print(f"Directory '{batch_directory}' not found")
+            return
+        values = ()
+        if input_path is not None:
+            with open(input_path, "r") as file:
+                values = file.read().splitlines()
+        results = run_many(find_programs(batch_directory), mode, timeout, values, cache_flag, limits, tail, optimize=level)
+        print(json.dumps(summarize(results), indent=2))
+        return
+
     if len(arguments) > 1:
         file_path = arguments[1]
     else:
         file_path = input("Enter file path: ")
 
     if os.path.exists(file_path):
-        with open(file_path, "r") as file:
-            lines = [line.strip() for line in file.readlines()]
+        if stream_flag:
+            # Lines are read as the program runs and read again only when they are shown
+            lines = SourceFile(file_path)
+        else:
+            with open(file_path, "r") as file:
+                lines = [line.strip() for line in file.readlines()]
+
+        reader = None
+        if input_path is not None:
+            with open(input_path, "r") as file:
+                reader = InputReader(file)
 
-        program = Program(lines, dev=dev_flag)
-        program.parse()
-        program.run()
+        cache = ProgramCache() if cache_flag else None
+        trace_file = open(trace_path, "w") if trace_path is not None else None
+        trace = TraceFile(trace_file) if trace_file is not None else None
+        show_passes = print_passes if passes_flag else None
+        program = Program(lines, dev=dev_flag, writer=OutputWriter(policy=flush_policy), reader=reader, cache=cache, limits=limits, trace=trace, optimize=level, show_passes=show_passes, memo=memo)
+        profiler = Profiler(program) if profile_path is not None else None
+        try:
+            if stream_flag:
+                program.run_stream()
+            else:
+                program.parse()
+                run_program(program, mode)
+        except PseudoLangError as error:
+            program.report(error)
+            if dev_flag:
+                print()
+                raise AssertionError() from error
+            exit()
+        finally:
+            if profiler is not None:
+                print(profiler.report(), end="", file=sys.stderr)
+                profiler.write(profile_path)
+            if memo is not None:
+                print(memo.report(), end="", file=sys.stderr)
+            if trace_file is not None:
+                trace_file.close()
+            if stream_flag:
+                lines.close()
     else:
         print(f"File '{file_path}' not found")
 
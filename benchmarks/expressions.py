@@ -0,0 +1,107 @@
+import ast
+import sys
+import copy
+import timeit
+import platform
+
+from ..modules.classes import Variable
+from ..modules.data_types import *
+from ..modules.arithmetic import *
+
+# Loop conditions and arithmetic as they appear in the benchmark programs, with the values they start from
+VALUES = {
+    "Number": ("INTEGER", 27),
+    "Value": ("INTEGER", 82),
+    "Steps": ("INTEGER", 10),
+    "Longest": ("INTEGER", 111),
+    "Row": ("INTEGER", 12),
+    "Column": ("INTEGER", 30),
+    "Total": ("INTEGER", 4500),
+    "Index": ("INTEGER", 7),
+    "Flag": ("BOOLEAN", TRUE),
+    "Name": ("STRING", String("PseudoLang")),
+}
+
+EXPRESSIONS = [
+    "Number < 1000",
+    "Value <> 1",
+    "Value MOD 2 = 0",
+    "Value DIV 2",
+    "3 * Value + 1",
+    "Steps + 1",
+    "Steps > Longest",
+    "Total + Row * Column",
+    "Index <= 10 AND Flag",
+    "NOT (Row = Column)",
+    "Name & \" line \" & str(Index)",
+]
+
+class LinkNames(ast.NodeTransformer):
+    # How names were read by the lambdas the interpreter compiled with eval
+    def __init__(self, addresses):
+        self.addresses = addresses
+    def visit_Name(self, node):
+        lookup = ast.Call(ast.Name("_lookup", ast.Load()), [ast.Constant(node.id)], [])
+        depth, slot = self.addresses[node.id]
+        if slot is None:
+            return lookup
+        frame = ast.Name("_local" if depth == LOCAL else "_global", ast.Load())
+        properties = ast.Subscript(frame, ast.Constant(slot), ast.Load())
+        return ast.IfExp(properties, ast.Attribute(properties, "data", ast.Load()), lookup)
+
+def compiled(tree, addresses):
+    # The eval path: a Python lambda compiled from the same tree, with the same results as the engine
+    constants = {"_TRUE": TRUE, "_FALSE": FALSE, "_join": join}
+    def name(value):
+        key = f"_k{len(constants)}"
+        constants[key] = value
+        return key
+    body = Pythonize(name).visit(LinkNames(addresses).visit(copy.deepcopy(tree.body)))
+    arguments = ast.arguments([], [ast.arg("_global"), ast.arg("_local"), ast.arg("_lookup")], None, [], [], None, [])
+    lambda_ = ast.fix_missing_locations(ast.Expression(ast.Lambda(arguments, body)))
+    return eval(compile(lambda_, "<benchmark>", "eval"), constants)
+
+def frame():
+    addresses = {}
+    values = []
+    for name, (data_type, value) in VALUES.items():
+        addresses[name] = (LOCAL, len(values))
+        values.append(Variable(name, data_type, value))
+    return addresses, values
+
+def lookup(name):
+    return getattr(__builtins__, name) if hasattr(__builtins__, name) else __builtins__[name]
+
+class Runtime:
+    # What the engine is given in place of the program
+    lookup = staticmethod(lookup)
+
+def main(arguments):
+    # python -m pseudolang.benchmarks.expressions [-number N]
+    number = 200000
+    if "-number" in arguments:
+        number = int(arguments[arguments.index("-number") + 1])
+    addresses, values = frame()
+    addresses["str"] = (None, None)
+
+    print(f"Best of 5 runs of {number} evaluations, Python {platform.python_version()}")
+    print(f"{'Expression':<32} {'Engine ns':>10} {'eval ns':>10} {'Ratio':>8}")
+    total = [0, 0]
+    for source in EXPRESSIONS:
+        tree = parse_expression(source)
+        engine = build(tree.body, addresses)
+        reference = compiled(tree, addresses)
+        runtime = Runtime()
+        assert engine(values, values, runtime) == reference(values, values, lookup), source
+        times = []
+        for function, third in ((engine, runtime), (reference, lookup)):
+            runs = timeit.repeat(lambda: function(values, values, third), number=number, repeat=5)
+            times.append(min(runs) / number * 1e9)
+        total[0] += times[0]
+        total[1] += times[1]
+        print(f"{source:<32} {times[0]:>10.1f} {times[1]:>10.1f} {times[0] / times[1]:>8.2f}")
+    print(f"{'All':<32} {total[0]:>10.1f} {total[1]:>10.1f} {total[0] / total[1]:>8.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,206 @@
+import io
+import os
+import sys
+import json
+import glob
+import time
+import platform
+import statistics
+import tracemalloc
+
+from ..modules.program import Program
+from ..modules.batch import run_program
+from ..modules.output import OutputWriter
+from ..modules.inputs import InputReader
+from ..modules.loader import LoadedProgram
+from ..modules.classes import Limits
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(DIRECTORY, "baseline.json")
+
+# Runs are slower than the baseline by more than this fraction before they count as a regression
+THRESHOLD = 0.25
+
+# Phases shorter than this are repeated until a sample lasts this long, a single one is too short to time
+SAMPLE_TIME = 0.05
+
+def large_program(copies = 400):
+    # Thousands of lines for timing the parser, every copy uses its own names
+    lines = []
+    for index in range(copies):
+        lines += [
+            f"DECLARE A{index}, B{index} : INTEGER",
+            f"CONSTANT Limit{index} = {index % 7}",
+            f"A{index} <- {index} * 2 + 1",
+            f"B{index} <- 0",
+            f"// Copy {index}",
+            f"WHILE B{index} < Limit{index}",
+            f"    B{index} <- B{index} + 1",
+            "ENDWHILE",
+            f"IF A{index} % 3 == 0 THEN",
+            f"    B{index} <- B{index} * 2",
+            "ELSE",
+            f"    B{index} <- B{index} - 1",
+            "ENDIF",
+            f"PROCEDURE Show{index}(Value : INTEGER)",
+            f"    A{index} <- Value + B{index}",
+            "ENDPROCEDURE",
+            f"CALL Show{index}(A{index})",
+            "",
+        ]
+    lines.append(f"OUTPUT A{copies - 1}, \" \", B{copies - 1}")
+    return lines
+
+def workloads():
+    programs = {}
+    for path in sorted(glob.glob(os.path.join(DIRECTORY, "*.pseudo"))):
+        with open(path, "r") as file:
+            programs[os.path.basename(path)[:-len(".pseudo")]] = [line.strip() for line in file.readlines()]
+    programs["large"] = large_program()
+    return programs
+
+def parse(lines):
+    program = Program(list(lines), writer=OutputWriter(io.StringIO(), "block"), reader=InputReader(()))
+    program.parse()
+    if program.scope is None:
+        program.resolve()
+    return program
+
+def run(loaded, mode):
+    program = loaded.program(writer=OutputWriter(io.StringIO(), "block"), reader=InputReader(()))
+    run_program(program, mode)
+
+def count(loaded):
+    # Timed runs have no limits, which would slow them down and keep -py on the VM. The instructions are
+    # counted on a run of their own instead, with a limit that is never reached. The interpreter and the
+    # VM count the same instructions, so the count is the same for every mode
+    program = loaded.program(writer=OutputWriter(io.StringIO(), "block"), reader=InputReader(()), limits=Limits(instructions=10**15))
+    run_program(program, "vm")
+    return program.executed + program.interval - program.countdown
+
+def timed(function, repeat):
+    # The median time of a call over repeat samples, so one lucky or unlucky sample does not decide a regression
+    samples = []
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            function()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= SAMPLE_TIME:
+                break
+        samples.append(elapsed / calls)
+    return statistics.median(samples)
+
+def measure(lines, mode, repeat):
+    parse_time = timed(lambda: parse(lines), repeat)
+    loaded = LoadedProgram(parse(lines))
+    run_time = timed(lambda: run(loaded, mode), repeat)
+    instructions = count(loaded)
+
+    # tracemalloc slows everything down, so memory is measured on a run of its own
+    tracemalloc.start()
+    try:
+        run(LoadedProgram(parse(lines)), mode)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "parse": round(parse_time, 6),
+        "run": round(run_time, 6),
+        "instructions": instructions,
+        "ips": round(instructions / run_time) if run_time else 0,
+        "peak": peak,
+    }
+
+def compare(results, baseline, threshold):
+    # Returns (name, phase, ratio) for every phase slower than the baseline allows
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for phase in ("parse", "run"):
+            if baseline[name][phase] > 0:
+                ratio = result[phase] / baseline[name][phase]
+                if ratio > 1 + threshold:
+                    regressions.append((name, phase, ratio))
+    return regressions
+
+def report(results, baseline):
+    report = f"{'Benchmark':<16} {'Parse ms':>10} {'Run ms':>10} {'Instructions':>13} {'Per second':>12} {'Peak KB':>10} {'vs baseline':>12}\n"
+    for name, result in results.items():
+        change = ""
+        if name in baseline and baseline[name]["run"] > 0:
+            change = f"{(result['run'] / baseline[name]['run'] - 1) * 100:+.1f}%"
+        report += (
+            f"{name:<16} {result['parse']*1000:>10.2f} {result['run']*1000:>10.2f} {result['instructions']:>13} "
+            f"{result['ips']:>12} {result['peak']/1024:>10.1f} {change:>12}\n"
+        )
+    return report
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)
+
+def main(arguments):
+    # python -m pseudolang.benchmarks.run [names] [-vm | -py] [-repeat N] [-threshold F] [-baseline FILE] [-save]
+    arguments = list(arguments)
+    mode = "tree"
+    repeat = 5
+    threshold = THRESHOLD
+    path = BASELINE
+    save = False
+    names = []
+    while arguments:
+        argument = arguments.pop(0)
+        if argument == "-vm":
+            mode = "vm"
+        elif argument == "-py":
+            mode = "py"
+        elif argument == "-save":
+            save = True
+        elif argument == "-repeat":
+            repeat = int(arguments.pop(0))
+        elif argument == "-threshold":
+            threshold = float(arguments.pop(0))
+        elif argument == "-baseline":
+            path = arguments.pop(0)
+        else:
+            names.append(argument)
+
+    programs = workloads()
+    for name in names:
+        if name not in programs:
+            print(f"Unknown benchmark '{name}', choose from: {', '.join(programs)}")
+            return 2
+
+    results = {}
+    for name, lines in programs.items():
+        if not names or name in names:
+            results[name] = measure(lines, mode, repeat)
+
+    stored = load_baseline(path)
+    baseline = stored.get("results", {}).get(mode, {})
+    print(f"Mode: {mode}, median of {repeat}, Python {platform.python_version()}")
+    print(report(results, baseline), end="")
+
+    if save:
+        stored["python"] = platform.python_version()
+        stored.setdefault("results", {}).setdefault(mode, {}).update(results)
+        with open(path, "w") as file:
+            json.dump(stored, file, indent=2)
+            file.write("\n")
+        print(f"Saved the baseline to {path}")
+        return 0
+
+    regressions = compare(results, baseline, threshold)
+    for name, phase, ratio in regressions:
+        print(f"Regression: {name} {phase} is {(ratio - 1) * 100:.1f}% slower than the baseline")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
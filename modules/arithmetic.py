@@ -1,42 +1,548 @@
-from .data_types import Stack
-
-def applyOperator(operator, a, b):
-    if operator == "+":
-        return a + b
-    if operator == "-":
-        return a - b
-    if operator == "*":
-        return a * b
-    if operator == "/":
-        return a / b
-
-def precedence(operator):
-    # if operator == "(" or operator == ")":
-    #     return 9
-    if operator == "*" or operator == "/":
-        return 2
-    if operator == "+" or operator == "-":
-        return 1
-    return 0
-
-def evaluate_expression(tokens : str):
-    values = Stack(256)
-    operators = Stack(256)
-    was_digit = False
+import ast
+import operator
 
-    for token in tokens:
-        print(values, operators)
-        if token == "(":
-            operators.push(token)
-        elif token.isdigit():
-            if was_digit:
-                values.top += token
+from .data_types import *
+from .lexer import tokenize
+
+# Where a resolved name lives, see Resolver.address
+GLOBAL = 0
+LOCAL = 1
+
+# Binding powers of the infix operators, higher binds tighter. NOT sits between AND and the comparisons,
+# so "NOT X = 1" is NOT (X = 1), and unary minus binds tighter than "*" but looser than "**".
+# Python's "A if C else B" binds looser than all of them
+CONDITIONAL_POWER = 0
+OR_POWER = 1
+AND_POWER = 2
+NOT_POWER = 3
+COMPARE_POWER = 4
+JOIN_POWER = 5
+SUM_POWER = 6
+PRODUCT_POWER = 7
+UNARY_POWER = 8
+POWER_POWER = 9
+
+# Both the Cambridge spelling and the Python one that older programs use
+OPERATORS = {
+    "+": (SUM_POWER, ast.Add),
+    "-": (SUM_POWER, ast.Sub),
+    "*": (PRODUCT_POWER, ast.Mult),
+    "/": (PRODUCT_POWER, ast.Div),
+    "DIV": (PRODUCT_POWER, ast.FloorDiv),
+    "//": (PRODUCT_POWER, ast.FloorDiv),
+    "MOD": (PRODUCT_POWER, ast.Mod),
+    "%": (PRODUCT_POWER, ast.Mod),
+    "**": (POWER_POWER, ast.Pow),
+    "&": (JOIN_POWER, ast.BitAnd),
+    "=": (COMPARE_POWER, ast.Eq),
+    "==": (COMPARE_POWER, ast.Eq),
+    "<>": (COMPARE_POWER, ast.NotEq),
+    "!=": (COMPARE_POWER, ast.NotEq),
+    "<": (COMPARE_POWER, ast.Lt),
+    "<=": (COMPARE_POWER, ast.LtE),
+    ">": (COMPARE_POWER, ast.Gt),
+    ">=": (COMPARE_POWER, ast.GtE),
+    "AND": (AND_POWER, ast.And),
+    "and": (AND_POWER, ast.And),
+    "OR": (OR_POWER, ast.Or),
+    "or": (OR_POWER, ast.Or),
+}
+
+WORDS = {"AND", "and", "OR", "or", "NOT", "not", "MOD", "DIV", "TRUE", "FALSE", "if", "else"}
+
+def join(left, right):
+    # "&" only joins STRING and CHAR values, "+" is left to add numbers
+    if not isinstance(left, str) or not isinstance(right, str):
+        names = (PYTHON_TO_PSEUDO.get(type(value), type(value).__name__) for value in (left, right))
+        raise TypeError("'&' cannot join {} and {}".format(*names))
+    return left + right
+
+BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.BitAnd: join,
+}
+
+COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+UNARY = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+class ExpressionParser:
+    # Precedence climbing over the lexer's tokens, the result is a Python expression tree
+    # so the optimizer and the translator can work on it
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            previous = self.tokens[-1].text if self.tokens else None
+            raise SyntaxError(f"Expected a value after '{previous}'" if previous else "Expected an expression")
+        self.position += 1
+        return token
+
+    def expect(self, text, opener):
+        token = self.peek()
+        if token is None or token.text != text:
+            raise SyntaxError(f"'{opener}' was never closed")
+        self.position += 1
+
+    def infix(self, token):
+        if token is None or token.kind not in ("OP", "NAME"):
+            return None, None
+        return OPERATORS.get(token.text, (None, None))
+
+    def parse(self):
+        node = self.conditional()
+        token = self.peek()
+        if token is not None:
+            raise SyntaxError(f"Unexpected '{token.text}'")
+        return ast.Expression(node)
+
+    def conditional(self):
+        # A whole expression, which Python's "A if C else B" can wrap
+        node = self.expression(0)
+        if not self.next_word("if"):
+            return node
+        self.position += 1
+        condition = self.expression(0)
+        if not self.next_word("else"):
+            raise SyntaxError("'if' needs an 'else'")
+        self.position += 1
+        return ast.IfExp(condition, node, self.conditional())
+
+    def expression(self, lowest):
+        left = self.operand()
+        chain = None
+        while True:
+            power, operation = self.infix(self.peek())
+            if power is None or power < lowest:
+                return left
+            self.position += 1
+            if power == POWER_POWER:
+                # Right associative, 2 ** 3 ** 2 is 2 ** 9
+                left = ast.BinOp(left, operation(), self.expression(power))
+            elif power == COMPARE_POWER:
+                # Comparisons chain, 1 < X < 5 is 1 < X AND X < 5
+                right = self.expression(power + 1)
+                if chain is left and type(left) == ast.Compare:
+                    left.ops.append(operation())
+                    left.comparators.append(right)
+                else:
+                    left = chain = ast.Compare(left, [operation()], [right])
+            elif power == AND_POWER or power == OR_POWER:
+                right = self.expression(power + 1)
+                if chain is left and type(left) == ast.BoolOp and type(left.op) == operation:
+                    left.values.append(right)
+                else:
+                    left = chain = ast.BoolOp(operation(), [left, right])
+            else:
+                left = ast.BinOp(left, operation(), self.expression(power + 1))
+
+    def operand(self):
+        token = self.take()
+        kind, text = token.kind, token.text
+        if kind == "NUMBER":
+            node = ast.Constant(int(text) if text.isdigit() else float(text))
+        elif kind == "STRING":
+            if len(text) < 2 or not text.endswith("\""):
+                raise SyntaxError("STRING is missing its closing double quote")
+            node = ast.Constant(String(text[1:-1]))
+        elif kind == "CHAR":
+            if len(text) != 3 or not text.endswith("'"):
+                raise SyntaxError("CHAR must be one character between single quotes")
+            node = ast.Constant(Char(text[1]))
+        elif kind == "OP" and text in ("-", "+"):
+            operand = self.expression(UNARY_POWER)
+            if text == "-" and isinstance(operand, ast.Constant) and type(operand.value) in (int, float):
+                # Negative numbers are literals, so "-5" needs no evaluating
+                return ast.Constant(-operand.value)
+            return ast.UnaryOp(ast.USub() if text == "-" else ast.UAdd(), operand)
+        elif kind == "OP" and text == "(":
+            node = self.conditional()
+            self.expect(")", "(")
+        elif kind == "NAME" and (text == "NOT" or text == "not"):
+            return ast.UnaryOp(ast.Not(), self.expression(NOT_POWER))
+        elif kind == "NAME" and text in ("TRUE", "FALSE"):
+            node = ast.Constant(TRUE if text == "TRUE" else FALSE)
+        elif kind == "NAME" and text in ("MOD", "DIV") and self.next_is("("):
+            # MOD(A, B) and DIV(A, B), the function forms of the operators
+            self.position += 1
+            arguments = self.arguments()
+            if len(arguments) != 2:
+                raise SyntaxError(f"{text} takes 2 values, not {len(arguments)}")
+            node = ast.BinOp(arguments[0], OPERATORS[text][1](), arguments[1])
+        elif kind == "NAME" and text not in WORDS:
+            node = ast.Name(text, ast.Load())
+        else:
+            raise SyntaxError(f"Unexpected '{text}'")
+        return self.postfix(node)
+
+    def next_is(self, text):
+        token = self.peek()
+        return token is not None and token.kind == "OP" and token.text == text
+
+    def next_word(self, text):
+        token = self.peek()
+        return token is not None and token.kind == "NAME" and token.text == text
+
+    def arguments(self):
+        # The values of a call, after its "(" has been taken
+        arguments = []
+        if self.next_is(")"):
+            self.position += 1
+            return arguments
+        while True:
+            arguments.append(self.conditional())
+            if self.next_is(","):
+                self.position += 1
+            else:
+                self.expect(")", "(")
+                return arguments
+
+    def postfix(self, node):
+        while True:
+            if self.next_is("("):
+                self.position += 1
+                node = ast.Call(node, self.arguments(), [])
+            elif self.next_is("["):
+                self.position += 1
+                index = self.conditional()
+                self.expect("]", "[")
+                node = ast.Subscript(node, index, ast.Load())
             else:
-                values.push(token)
-            was_digit = True
-        elif token == ")":
-            print("Back")
-    
-    return values.top
-
-print(evaluate_expression("(10+44)/2"))
\ No newline at end of file
+                return node
+
+def parse_expression(source):
+    # source is the text of an expression or the lexer's tokens of it
+    tokens = tokenize(source) if type(source) == str else source
+    if tokens and tokens[0].kind == "COMMENT":
+        raise SyntaxError("Unexpected '//'")
+    for token in tokens:
+        if token.kind == "OTHER":
+            raise SyntaxError(f"Unexpected '{token.text}'")
+    return ExpressionParser(tokens).parse()
+
+# Every evaluator takes the global values, the local values and the running program, which looks up names
+# that were not resolved and runs FUNCTIONs, like the interpreter's own frames, so evaluating never builds a dict or a scope
+
+# FUNCTION and PROCEDURE values are their declarations, calling one asks the program to run it
+METHODS = frozenset((FUNCTION, PROCEDURE))
+
+def fetch(name, addresses):
+    depth, slot = addresses.get(name, (None, None))
+    if slot is None:
+        return lambda g, l, p: p.lookup(name)
+    if depth == LOCAL:
+        def local(g, l, p):
+            properties = l[slot]
+            return properties.data if properties is not None else p.lookup(name)
+        return local
+    def global_(g, l, p):
+        properties = g[slot]
+        return properties.data if properties is not None else p.lookup(name)
+    return global_
+
+def resolved(node, addresses):
+    # (name, is local, slot) of a name with a slot, otherwise None
+    if type(node) != ast.Name:
+        return None
+    depth, slot = addresses.get(node.id, (None, None))
+    if slot is None:
+        return None
+    return node.id, depth == LOCAL, slot
+
+def combine(operation, left, right, addresses, boolean = False):
+    # operation(left, right) in one closure. Names with a slot and constants are read in place,
+    # since a closure call for every operand costs more than the operator itself.
+    # Comparisons are boolean, they give TRUE or FALSE rather than Python's bool so they can be stored
+    first = resolved(left, addresses)
+    second = resolved(right, addresses)
+    constant = type(right) == ast.Constant
+
+    if first is not None and constant:
+        name, here, slot = first
+        value = right.value
+        def name_constant(g, l, p):
+            properties = l[slot] if here else g[slot]
+            result = operation(properties.data if properties is not None else p.lookup(name), value)
+            if boolean:
+                return TRUE if result else FALSE
+            return result
+        return name_constant
+
+    if first is not None and second is not None:
+        name, here, slot = first
+        other, there, other_slot = second
+        def name_name(g, l, p):
+            properties = l[slot] if here else g[slot]
+            others = l[other_slot] if there else g[other_slot]
+            result = operation(properties.data if properties is not None else p.lookup(name), others.data if others is not None else p.lookup(other))
+            if boolean:
+                return TRUE if result else FALSE
+            return result
+        return name_name
+
+    if type(left) == ast.Constant and second is not None:
+        value = left.value
+        other, there, other_slot = second
+        def constant_name(g, l, p):
+            others = l[other_slot] if there else g[other_slot]
+            result = operation(value, others.data if others is not None else p.lookup(other))
+            if boolean:
+                return TRUE if result else FALSE
+            return result
+        return constant_name
+
+    if constant:
+        function = build(left, addresses)
+        value = right.value
+        def closure_constant(g, l, p):
+            result = operation(function(g, l, p), value)
+            if boolean:
+                return TRUE if result else FALSE
+            return result
+        return closure_constant
+
+    if second is not None:
+        function = build(left, addresses)
+        other, there, other_slot = second
+        def closure_name(g, l, p):
+            value = function(g, l, p)
+            others = l[other_slot] if there else g[other_slot]
+            result = operation(value, others.data if others is not None else p.lookup(other))
+            if boolean:
+                return TRUE if result else FALSE
+            return result
+        return closure_name
+
+    other = build(right, addresses)
+
+    if first is not None:
+        name, here, slot = first
+        def name_closure(g, l, p):
+            properties = l[slot] if here else g[slot]
+            result = operation(properties.data if properties is not None else p.lookup(name), other(g, l, p))
+            if boolean:
+                return TRUE if result else FALSE
+            return result
+        return name_closure
+
+    function = build(left, addresses)
+    def closure_closure(g, l, p):
+        result = operation(function(g, l, p), other(g, l, p))
+        if boolean:
+            return TRUE if result else FALSE
+        return result
+    return closure_closure
+
+def build(node, addresses):
+    # Turns an expression tree into nested closures, addresses maps names to their (depth, slot)
+    kind = type(node)
+
+    if kind == ast.Constant:
+        value = node.value
+        return lambda g, l, p: value
+
+    if kind == ast.Name:
+        return fetch(node.id, addresses)
+
+    if kind == ast.BinOp:
+        return combine(BINARY[type(node.op)], node.left, node.right, addresses)
+
+    if kind == ast.Compare:
+        if len(node.ops) == 1:
+            return combine(COMPARISONS[type(node.ops[0])], node.left, node.comparators[0], addresses, True)
+        left = build(node.left, addresses)
+        steps = tuple((COMPARISONS[type(op)], build(comparator, addresses)) for (op, comparator) in zip(node.ops, node.comparators))
+        def chained(g, l, p):
+            value = left(g, l, p)
+            for operation, right in steps:
+                following = right(g, l, p)
+                if not operation(value, following):
+                    return FALSE
+                value = following
+            return TRUE
+        return chained
+
+    if kind == ast.BoolOp:
+        values = tuple(build(value, addresses) for value in node.values)
+        if type(node.op) == ast.And:
+            if len(values) == 2:
+                first, second = values
+                return lambda g, l, p: TRUE if first(g, l, p) and second(g, l, p) else FALSE
+            # A loop rather than all(), which would run the values from C: a FUNCTION called in one
+            # would nest on the C stack, which the recursion limit does not guard
+            def conjunction(g, l, p):
+                for value in values:
+                    if not value(g, l, p):
+                        return FALSE
+                return TRUE
+            return conjunction
+        if len(values) == 2:
+            first, second = values
+            return lambda g, l, p: TRUE if first(g, l, p) or second(g, l, p) else FALSE
+        def disjunction(g, l, p):
+            for value in values:
+                if value(g, l, p):
+                    return TRUE
+            return FALSE
+        return disjunction
+
+    if kind == ast.UnaryOp:
+        operand = build(node.operand, addresses)
+        if type(node.op) == ast.Not:
+            return lambda g, l, p: FALSE if operand(g, l, p) else TRUE
+        operation = UNARY[type(node.op)]
+        return lambda g, l, p: operation(operand(g, l, p))
+
+    if kind == ast.Call:
+        function = build(node.func, addresses)
+        arguments = tuple(build(argument, addresses) for argument in node.args)
+        if len(arguments) == 1:
+            argument, = arguments
+            def call_one(g, l, p):
+                callee = function(g, l, p)
+                value = argument(g, l, p)
+                if type(callee) in METHODS:
+                    return p.invoke(callee, [value])
+                return callee(value)
+            return call_one
+        def call(g, l, p):
+            callee = function(g, l, p)
+            values = [argument(g, l, p) for argument in arguments]
+            if type(callee) in METHODS:
+                return p.invoke(callee, values)
+            return callee(*values)
+        return call
+
+    if kind == ast.Subscript:
+        value = build(node.value, addresses)
+        index = build(node.slice, addresses)
+        return lambda g, l, p: value(g, l, p)[index(g, l, p)]
+
+    if kind == ast.IfExp:
+        test = build(node.test, addresses)
+        body = build(node.body, addresses)
+        orelse = build(node.orelse, addresses)
+        return lambda g, l, p: body(g, l, p) if test(g, l, p) else orelse(g, l, p)
+
+    raise SyntaxError(f"Unsupported expression '{ast.unparse(node)}'")
+
+class Unresolved:
+    # Stands in for the program when there is none, every name is unknown
+    def lookup(self, name):
+        raise NameError(f"name '{name}' is not defined")
+
+def evaluate_tree(node):
+    # The value of a tree without names, used to fold constants with the same rules as at run time
+    return build(node, {})((), (), Unresolved())
+
+# How unparse spells every operator, in the Cambridge style
+SYMBOLS = {
+    ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.FloorDiv: "DIV", ast.Mod: "MOD", ast.Pow: "**",
+    ast.BitAnd: "&", ast.Eq: "=", ast.NotEq: "<>", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=",
+    ast.And: "AND", ast.Or: "OR",
+}
+
+ATOM_POWER = 10
+
+def literal(value):
+    if type(value) == String or type(value) == str:
+        return f"\"{value}\""
+    if type(value) == Char:
+        return f"'{value}'"
+    return repr(value)
+
+def unparse(node, lowest = 0):
+    # The pseudocode of a tree, with brackets only where the binding powers need them
+    kind = type(node)
+    power = ATOM_POWER
+    if kind == ast.Constant:
+        text = literal(node.value)
+        if type(node.value) in (int, float) and node.value < 0:
+            power = UNARY_POWER
+    elif kind == ast.Name:
+        text = node.id
+    elif kind == ast.BinOp:
+        power = OPERATORS[SYMBOLS[type(node.op)]][0]
+        right = power if power == POWER_POWER else power + 1
+        left = power + 1 if power == POWER_POWER else power
+        text = f"{unparse(node.left, left)} {SYMBOLS[type(node.op)]} {unparse(node.right, right)}"
+    elif kind == ast.Compare:
+        power = COMPARE_POWER
+        text = unparse(node.left, power + 1)
+        for op, comparator in zip(node.ops, node.comparators):
+            text += f" {SYMBOLS[type(op)]} {unparse(comparator, power + 1)}"
+    elif kind == ast.BoolOp:
+        power = AND_POWER if type(node.op) == ast.And else OR_POWER
+        text = f" {SYMBOLS[type(node.op)]} ".join(unparse(value, power + 1) for value in node.values)
+    elif kind == ast.UnaryOp and type(node.op) == ast.Not:
+        power = NOT_POWER
+        text = f"NOT {unparse(node.operand, power)}"
+    elif kind == ast.UnaryOp:
+        power = UNARY_POWER
+        text = ("-" if type(node.op) == ast.USub else "+") + unparse(node.operand, power)
+    elif kind == ast.Call:
+        text = f"{unparse(node.func, ATOM_POWER)}({', '.join(unparse(argument) for argument in node.args)})"
+    elif kind == ast.Subscript:
+        text = f"{unparse(node.value, ATOM_POWER)}[{unparse(node.slice)}]"
+    elif kind == ast.IfExp:
+        power = CONDITIONAL_POWER
+        text = f"{unparse(node.body, OR_POWER)} if {unparse(node.test, OR_POWER)} else {unparse(node.orelse, power)}"
+    else:
+        return ast.unparse(node)
+    return f"({text})" if power < lowest else text
+
+class Pythonize(ast.NodeTransformer):
+    # Rewrites a tree into plain Python with the same results as build, for the translator.
+    # name(value) returns the name a value is stored under in the translated program
+    def __init__(self, name):
+        self.name = name
+
+    def boolean(self, node):
+        return ast.IfExp(node, ast.Name("_TRUE", ast.Load()), ast.Name("_FALSE", ast.Load()))
+
+    def visit_Constant(self, node):
+        if type(node.value) in (int, float):
+            return node
+        return ast.Name(self.name(node.value), ast.Load())
+
+    def visit_Compare(self, node):
+        return self.boolean(self.generic_visit(node))
+
+    def visit_BoolOp(self, node):
+        return self.boolean(self.generic_visit(node))
+
+    def visit_UnaryOp(self, node):
+        node = self.generic_visit(node)
+        if type(node.op) == ast.Not:
+            return ast.IfExp(node.operand, ast.Name("_FALSE", ast.Load()), ast.Name("_TRUE", ast.Load()))
+        return node
+
+    def visit_BinOp(self, node):
+        node = self.generic_visit(node)
+        if type(node.op) == ast.BitAnd:
+            return ast.Call(ast.Name("_join", ast.Load()), [node.left, node.right], [])
+        return node
@@ -0,0 +1,143 @@
+import io
+import os
+import glob
+import time
+import signal
+import traceback
+import contextlib
+import multiprocessing
+
+from .program import Program
+from .vm import VirtualMachine
+from .transpiler import Transpiler, TranspileError
+from .output import OutputWriter
+from .inputs import InputReader
+from .cache import ProgramCache
+from .errors import PseudoLangError, LimitError
+from .classes import Limits
+from .trace import ring_buffer, plain
+
+MODES = ("tree", "vm", "py")
+
+class Timeout(BaseException):
+    # Not an Exception, so the interpreter's own error handling cannot swallow it
+    pass
+
+def run_program(program, mode = "tree"):
+    if program.instructions is None:
+        program.parse()
+    # Generated Python code has no instruction counter or trace hooks, so limited and traced programs run on the VM
+    if mode == "py" and program.tracer is None and program.limits is None:
+        transpiler = Transpiler(program)
+        try:
+            transpiler.transpile()
+        except TranspileError:
+            mode = "vm"
+        else:
+            transpiler.run()
+            return
+    if mode == "vm" or mode == "py":
+        VirtualMachine(program).run()
+    else:
+        program.run()
+
+@contextlib.contextmanager
+def time_limit(seconds):
+    if not seconds or not hasattr(signal, "setitimer"):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise Timeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def run_file(path, mode = "tree", timeout = None, values = (), cache = True, limits = None, tail = 0, optimize = 0):
+    # The interpreter enforces the time limit itself, the alarm only catches a single instruction that never ends.
+    # Generated Python code cannot check the time, so without other limits -py is stopped by the alarm alone
+    alarm = timeout + 1 if timeout else None
+    if limits is None and mode == "py" and hasattr(signal, "setitimer"):
+        alarm = timeout
+    else:
+        limits = limits if limits is not None else Limits()
+        if timeout and limits.time is None:
+            limits = limits._replace(time=timeout)
+
+    sink = io.StringIO()
+    status = "ok"
+    message = None
+    start = time.perf_counter()
+
+    # Everything the program prints, error reports included, goes through its own writer
+    writer = OutputWriter(sink, "block")
+    # The last `tail` trace records are kept so failed programs can be debugged afterwards
+    records = ring_buffer(tail) if tail else None
+    try:
+        with time_limit(alarm):
+            with open(path, "r") as file:
+                lines = [line.strip() for line in file.readlines()]
+            program = Program(lines, writer=writer, reader=InputReader(values), cache=ProgramCache() if cache else None, limits=limits, trace=records, optimize=optimize)
+            run_program(program, mode)
+    except PseudoLangError as error:
+        status = "error"
+        if type(error.error) == LimitError:
+            status = "timeout" if error.error.limit == "time" else "limit"
+        writer.write(error.report(writer.paint))
+    except Timeout:
+        status = "timeout"
+    except Exception:
+        status = "crash"
+        message = traceback.format_exc()
+    finally:
+        writer.flush()
+
+    result = {
+        "path": path,
+        "status": status,
+        "output": sink.getvalue(),
+        "message": message,
+        "time": round(time.perf_counter() - start, 6),
+    }
+    if records is not None and status != "ok":
+        result["trace"] = [plain(record) for record in records]
+    return result
+
+def _run_file(arguments):
+    return run_file(*arguments)
+
+def find_programs(directory):
+    return sorted(glob.glob(os.path.join(directory, "**", "*.pseudo"), recursive=True))
+
+def run_many(paths, mode = "tree", timeout = 10, values = (), cache = True, limits = None, tail = 0, processes = None, optimize = 0):
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}'")
+    values = list(values)
+    tasks = [(path, mode, timeout, values, cache, limits, tail, optimize) for path in paths]
+
+    results = []
+    with multiprocessing.Pool(processes) as pool:
+        pending = [pool.apply_async(_run_file, (task,)) for task in tasks]
+        for path, result in zip(paths, pending):
+            try:
+                # The worker enforces the limit itself where SIGALRM exists, this catches the rest
+                results.append(result.get(None if not timeout else timeout + 5))
+            except multiprocessing.TimeoutError:
+                results.append({"path": path, "status": "timeout", "output": "", "message": None, "time": timeout})
+    return results
+
+def summarize(results):
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    return {
+        "total": len(results),
+        "statuses": statuses,
+        "time": round(sum(result["time"] for result in results), 6),
+        "programs": results,
+    }
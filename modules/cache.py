@@ -0,0 +1,100 @@
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+
+MODULES_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+_fingerprint = None
+
+def interpreter_fingerprint():
+    # Any change to the interpreter's own modules (opcodes.py included) or to the
+    # Python version changes the fingerprint, so stale entries are never loaded
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(sys.version.encode())
+        for name in sorted(os.listdir(MODULES_DIRECTORY)):
+            if name.endswith(".py"):
+                with open(os.path.join(MODULES_DIRECTORY, name), "rb") as file:
+                    digest.update(name.encode())
+                    digest.update(file.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+def default_directory():
+    directory = os.environ.get("PSEUDOLANG_CACHE")
+    if directory:
+        return directory
+    return os.path.join(os.path.expanduser("~"), ".cache", "pseudolang")
+
+class ProgramCache:
+    def __init__(self, directory = None, limit = 32 * 1024 * 1024):
+        self.directory = directory if directory is not None else default_directory()
+        self.limit = limit
+
+    def key(self, lines, variant = ""):
+        # variant tells apart entries of the same source parsed differently, such as optimized ones
+        digest = hashlib.sha256(interpreter_fingerprint().encode())
+        digest.update(variant.encode())
+        for line in lines:
+            digest.update(line.encode())
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def path(self, lines, variant = ""):
+        return os.path.join(self.directory, self.key(lines, variant) + ".pickle")
+
+    def load(self, lines, variant = ""):
+        path = self.path(lines, variant)
+        try:
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+            # Touch the entry so eviction removes the least recently used ones first
+            os.utime(path)
+        except Exception:
+            return None
+        return entry
+
+    def store(self, lines, entry, variant = ""):
+        temporary = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written to a temporary file first so concurrent runs never see half an entry
+            handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(handle, "wb") as file:
+                pickle.dump(entry, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path(lines, variant))
+        except Exception:
+            if temporary is not None and os.path.exists(temporary):
+                os.remove(temporary)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        try:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".pickle"):
+                    path = os.path.join(self.directory, name)
+                    status = os.stat(path)
+                    entries.append((status.st_mtime, status.st_size, path))
+        except OSError:
+            return
+        total = sum(size for (_, size, _) in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".pickle") or name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
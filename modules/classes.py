@@ -1,13 +1,79 @@
+from collections import namedtuple
+
+# How deeply calls can nest before a Stack Overflow Error, -limits depth can allow more
+CALL_DEPTH = 100000
+
+# How many Python frames a call nests at most, FUNCTIONs are called from expressions and run in Python's stack
+PYTHON_FRAMES = 16
+
+# Tuples of None by length, a reused call's values are cleared from one in place
+BLANKS = [()]
+
+def blank(size):
+    while len(BLANKS) <= size:
+        BLANKS.append((None,) * len(BLANKS))
+    return BLANKS[size]
+
 class Call:
-    def __init__(self, method, values, line):
+    # result is the value a FUNCTION returned. The call stack keeps returned calls, and reset reuses one
+    # with its values list for the next call at the same depth
+    __slots__ = ("method", "scope", "values", "line", "result")
+    def __init__(self, method, scope, line):
+        self.values = []
+        self.reset(method, scope, line)
+    def reset(self, method, scope, line):
         self.method = method
-        self.values = values
+        self.scope = scope
+        size = len(scope.names)
+        self.values[:] = BLANKS[size] if size < len(BLANKS) else blank(size)
         self.line = line
-        self.exit = False
+        self.result = None
+        return self
     def __repr__(self):
         return f"Call({self.method}, {self.values})"
 
+class Frame:
+    # A block the interpreter is running: kind is the type of the instruction that opened it, numbered its
+    # (line, statement) pairs and index the next one to run. line is where the instruction was, state the
+    # range of a FOR or the branch an IF took, variable the loop variable of a FOR
+    __slots__ = ("kind", "instruction", "numbered", "index", "line", "state", "variable")
+    def __repr__(self):
+        return f"Frame({self.kind.__name__}, {self.line}, {self.index})"
+
+class Scope:
+    # dynamic is only set on the global scope, the names that expressions in methods read from their callers
+    __slots__ = ("names", "dynamic")
+    def __init__(self):
+        self.names = {}
+        self.dynamic = None
+    def add(self, name):
+        if name not in self.names:
+            self.names[name] = len(self.names)
+        return self.names[name]
+    def __len__(self):
+        return len(self.names)
+    def __repr__(self):
+        return f"Scope({self.names})"
+
+class Block(list):
+    # The statements of one block; measure_spans fills in the line before the block, the (line, statement)
+    # pairs that the interpreter loops over and the line that closes it. Blocks that know them keep them.
+    # flat is set when the block only has statements that open no blocks of their own and cannot RETURN
+    __slots__ = ("start", "numbered", "end", "flat")
+    def __init__(self, statements = (), start = None, numbered = None, end = None):
+        super().__init__(statements)
+        self.start = start
+        self.numbered = numbered
+        self.end = end
+        self.flat = False
+
+class Identifier(str):
+    depth = None
+    slot = None
+    scope = None
+
 class IdentifierBased:
+    __slots__ = ("name", "data", "type")
     def __init__(self, name, type, data):
         self.name = name
         self.data = data
@@ -18,14 +84,17 @@ class IdentifierBased:
         return f"{self.__class__.__name__}({self.data})"
 
 class Variable(IdentifierBased):
+    __slots__ = ()
     def __init__(self, name, type, data = None):
         super().__init__(name, type, data)
 
 class Constant(IdentifierBased):
+    __slots__ = ()
     def __init__(self, name, type, data):
         super().__init__(name, type, data)
 
 class Method(IdentifierBased):
+    __slots__ = ("line",)
     def __init__(self, name, statements, line, type_ = None):
         super().__init__(name, type_, statements)
         self.line = line
@@ -33,10 +102,27 @@ class Method(IdentifierBased):
         return f"<{self.__class__.__name__.toupper()} '{self.name}'>"
 
 class Function(Method):
+    __slots__ = ("statements",)
     def __init__(self, name, statements, line, type_):
         super().__init__(name, statements, line, type_)
+        self.statements = statements
 
 class Procedure(Method):
+    __slots__ = ("statements",)
     def __init__(self, name, statements, line, type_ = None):
         super().__init__(name, statements, line, type_)
-        self.statements = statements
\ No newline at end of file
+        self.statements = statements
+
+# Any limit left as None is not enforced; time is in seconds, output in characters
+Limits = namedtuple("Limits", "instructions time output depth", defaults=(None, None, None, None))
+
+def parse_limits(text):
+    # "instructions=1000000,time=5" -> Limits(instructions=1000000, time=5.0)
+    values = {}
+    for pair in text.split(","):
+        name, _, value = pair.partition("=")
+        name = name.strip()
+        if name not in Limits._fields:
+            raise ValueError(f"Unknown limit '{name}'")
+        values[name] = float(value) if name == "time" else int(value)
+    return Limits(**values)
@@ -0,0 +1,157 @@
+from .opcodes import *
+from .helpers import *
+
+# Bytecode instructions are tuples of (opcode, line, a, b, c, counted). Only counted ones count towards
+# an instruction limit: one for every statement and one for every check of a loop, like the interpreter counts
+
+HALT = 0
+DECLARE_VARIABLES = 1
+DECLARE_CONSTANT = 2
+DECLARE_METHOD = 3
+ASSIGN = 4
+READ = 5
+WRITE = 6
+JUMP = 7
+JUMP_UNLESS_TRUE = 8
+JUMP_IF_TRUE = 9
+JUMP_IF_FALSE = 10
+CHECK = 11
+FAIL = 12
+FOR_INIT = 13
+FOR_NEXT = 14
+INVOKE = 15
+END_CALL = 16
+LEAVE = 17
+
+OPCODE_NAMES = dict((value, key) for (key, value) in globals().items() if type(value) == int)
+
+class Code:
+    def __init__(self, name):
+        self.name = name
+        self.instructions = []
+    def emit(self, opcode, line, a = None, b = None, c = None, counted = True):
+        self.instructions.append([opcode, line, a, b, c, counted])
+        return len(self.instructions) - 1
+    def patch(self, index, target):
+        self.instructions[index][3] = target
+    @property
+    def position(self):
+        return len(self.instructions)
+    def seal(self):
+        self.instructions = [tuple(instruction) for instruction in self.instructions]
+    def __repr__(self):
+        lines = [f"<{self.name}>"]
+        for index, (opcode, line, a, b, c, counted) in enumerate(self.instructions):
+            lines.append(f"{index:>5} {line:>5}  {OPCODE_NAMES[opcode]:<18}{'' if a is None else a} {'' if b is None else b}")
+        return "\n".join(lines)
+
+class Compiler:
+    def __init__(self, spans):
+        self.spans = spans
+        self.methods = {}
+
+    def compile(self, instructions):
+        code = Code("MAIN")
+        for line, instruction in instructions.numbered:
+            self.compile_instruction(code, instruction, line)
+        code.emit(HALT, instructions.end - 1, counted=False)
+        code.seal()
+        return code
+
+    def compile_method(self, instruction, line):
+        code = Code(instruction.identifier)
+        self.compile_block(code, instruction.statements)
+        if type(instruction) == FUNCTION:
+            # A FUNCTION can only end with a RETURN, which leaves the call itself
+            end = self.spans[id(instruction)][1]
+            code.emit(FAIL, end, f"FUNCTION '{instruction.identifier}' ended without RETURN", counted=False)
+        else:
+            code.emit(END_CALL, line, counted=False)
+        code.seal()
+        self.methods[id(instruction)] = code
+
+    def compile_block(self, code, statements):
+        for line, instruction in statements.numbered:
+            self.compile_instruction(code, instruction, line)
+
+    def compile_condition(self, code, instruction, index, line):
+        # Every condition of an IF is evaluated, even after a branch was taken. The IF counts once, at its first
+        condition = instruction.conditions[index]
+        if condition != "ELSE":
+            code.emit(CHECK, line, condition, None, "Invalid Condition", index == 0)
+        if len(instruction.statements[index]) == 0:
+            code.emit(FAIL, line, "No Statements Inside Block", counted=False)
+            return False
+        return True
+
+    def compile_instruction(self, code, instruction, line):
+        instruction_type = type(instruction)
+
+        if instruction_type == DECLARE:
+            code.emit(DECLARE_VARIABLES, line, instruction.identifiers, instruction.data_type)
+
+        elif instruction_type == CONSTANT:
+            code.emit(DECLARE_CONSTANT, line, instruction.identifier, instruction.value)
+
+        elif instruction_type == ASSIGNMENT:
+            code.emit(ASSIGN, line, instruction.identifier, instruction.value)
+
+        elif instruction_type == INPUT:
+            code.emit(READ, line, instruction.identifier)
+
+        elif instruction_type == OUTPUT:
+            code.emit(WRITE, line, instruction.exp)
+
+        elif instruction_type == IF:
+            headers = [self.spans[id(block)][0] for block in instruction.statements]
+
+            ends = []
+            for index, condition in enumerate(instruction.conditions):
+                statements = instruction.statements[index]
+                if len(statements) == 0:
+                    self.compile_condition(code, instruction, index, headers[index])
+                    break
+                skip = None
+                if condition != "ELSE":
+                    skip = code.emit(JUMP_UNLESS_TRUE, headers[index], condition, None, "Invalid Condition", index == 0)
+                self.compile_block(code, statements)
+                for later in range(index + 1, len(instruction.conditions)):
+                    if not self.compile_condition(code, instruction, later, headers[later]):
+                        break
+                ends.append(code.emit(JUMP, headers[index], counted=False))
+                if skip is not None:
+                    code.patch(skip, code.position)
+            for index in ends:
+                code.patch(index, code.position)
+
+        elif instruction_type == FOR:
+            code.emit(FOR_INIT, line, instruction)
+            start = code.emit(FOR_NEXT, line, instruction.identifier)
+            self.compile_block(code, instruction.statements)
+            code.emit(JUMP, line, None, start, counted=False)
+            code.patch(start, code.position)
+
+        elif instruction_type == WHILE:
+            skip = code.emit(JUMP_UNLESS_TRUE, line, instruction.condition)
+            start = code.position
+            self.compile_block(code, instruction.statements)
+            code.emit(JUMP_IF_TRUE, line, instruction.condition, start, "Condition could not be evaluated")
+            code.patch(skip, code.position)
+
+        elif instruction_type == REPEAT:
+            # Jumps to the next instruction, only so the REPEAT counts when it starts
+            code.emit(JUMP, line, None, code.position + 1)
+            start = code.position
+            self.compile_block(code, instruction.statements)
+            until = self.spans[id(instruction)][1]
+            code.emit(JUMP_IF_FALSE, until, instruction.condition, start, "Condition could not be evaluated")
+
+        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            code.emit(DECLARE_METHOD, line, instruction)
+            self.compile_method(instruction, line)
+
+        elif instruction_type == CALL:
+            code.emit(INVOKE, line, instruction.identifier, instruction.arguments)
+
+        elif instruction_type == RETURN:
+            code.emit(LEAVE, line, instruction.expression)
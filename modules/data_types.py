@@ -2,51 +2,58 @@ from .opcodes import *
 
 DATA_TYPES = {"STRING", "INTEGER", "CHAR", "REAL", "BOOLEAN"}# , "DATE"}
 
-class Char:
-    def __init__(self, value : str):
+class Char(str):
+    __slots__ = ()
+    def __new__(cls, value : str):
         assert len(value) == 1
-        self.__value = value
+        return super().__new__(cls, value)
     def __repr__(self):
-        return "Char\'" + self.__value + "\'"
-    def __str__(self):
-        return self.__value
+        return "Char\'" + self + "\'"
     
-class String:
-    def __init__(self, value : str):
-        self.__value = value
+class String(str):
+    __slots__ = ()
     def __repr__(self):
-        return "String\"" + self.__value + "\""
-    def __str__(self):
-        return self.__value
+        return "String\"" + self + "\""
 
 class Stack:
-    def __init__(self, size):
-        self.size = size
-        self.items = [None for _ in range(size)]
+    # Grows as items are pushed, up to limit of them. Popped items stay where they were until something
+    # is pushed over them, so spare can hand one out to be reused
+    def __init__(self, limit):
+        self.limit = limit
+        self.items = []
         self.pointer = -1
     def push(self, item):
-        assert self.pointer < self.size - 1, "Stack Overflow Error"
+        assert self.pointer < self.limit - 1, "Stack Overflow Error"
         self.pointer += 1
-        self.items[self.pointer] = item
+        if self.pointer < len(self.items):
+            self.items[self.pointer] = item
+        else:
+            self.items.append(item)
     def pop(self):
-        if len(self) > 0:
-            item = self.top
+        if self.pointer >= 0:
+            item = self.items[self.pointer]
             self.pointer -= 1
             return item
         else:
             print("Stack Empty")
     @property
     def top(self):
-        if len(self) > 0:
+        if self.pointer >= 0:
             return self.items[self.pointer]
         else:
             print("Stack Empty")
     @top.setter
     def top(self, value):
-        if len(self) > 0:  
+        if self.pointer >= 0:
             self.items[self.pointer] = value
         else:
             print("Stack Empty")
+    @property
+    def spare(self):
+        # The item popped last from just above the top, or None
+        if self.pointer + 1 < len(self.items):
+            return self.items[self.pointer + 1]
+        return None
     def __len__(self):
         return self.pointer + 1
     def __repr__(self):
@@ -57,9 +64,13 @@ class Stack:
         return iter(self.items[:self.pointer+1])
     
 class Boolean:
-    def __init__(self, value):
+    # TRUE and FALSE are the only instances, so they can be compared by identity
+    __slots__ = ("value",)
+    def __new__(cls, value):
         assert value in {True, False}
-        self.value = value
+        if value:
+            return TRUE
+        return FALSE
     def __repr__(self):
         if self.value:
             return "TRUE"
@@ -72,9 +83,16 @@ class Boolean:
         if isinstance(other, bool):
             return self.value == other
         return False
+    def __hash__(self):
+        # Equal to True and False, so it hashes like them
+        return hash(self.value)
+    def __reduce__(self):
+        return (Boolean, (self.value,))
 
-TRUE = Boolean(True)
-FALSE = Boolean(False)
+TRUE = object.__new__(Boolean)
+TRUE.value = True
+FALSE = object.__new__(Boolean)
+FALSE.value = False
 
 PSEUDO_TO_PYTHON = {
     "INTEGER" : int,
@@ -86,4 +104,7 @@ PSEUDO_TO_PYTHON = {
     "PROCEDURE": PROCEDURE,
 }
 
-PYTHON_TO_PSEUDO = dict((v, k) for (k, v) in PSEUDO_TO_PYTHON.items())
\ No newline at end of file
+PYTHON_TO_PSEUDO = dict((v, k) for (k, v) in PSEUDO_TO_PYTHON.items())
+
+# String operators return plain str values
+PYTHON_TO_PSEUDO[str] = "STRING"
\ No newline at end of file
@@ -5,18 +5,25 @@ class Error:
         self.type = None
         self.text = text
         self.type = type
-    def throw(self, line : int = None, code : str = ""):
-        print()
-        print(colored("PSEUDOLANG ERROR", "red"), end="")
-        if line:
-            print(colored(f" (Line {line})", "red"), end="")
-        print()
+    def message(self, line : int = None, code : str = "", paint = colored, column : int = None):
+        message = "\n" + paint("PSEUDOLANG ERROR", "red")
+        if line and column:
+            message += paint(f" (Line {line}, Column {column})", "red")
+        elif line:
+            message += paint(f" (Line {line})", "red")
+        message += "\n"
         if self.type:
-            print(colored("\tError Type:\t" + self.type, "red"))
+            message += paint("\tError Type:\t" + self.type, "red") + "\n"
         if code:
-            print(colored("\tProgram Code:\t" + code, "red"))
+            message += paint("\tProgram Code:\t" + code, "red") + "\n"
+            if column:
+                # Lines up under the code, which starts after three tab stops
+                message += paint("\t\t\t" + " " * (column - 1) + "^", "red") + "\n"
         if self.text:
-            print(colored("\tError Message:\t" + self.text, "red"))
+            message += paint("\tError Message:\t" + self.text, "red") + "\n"
+        return message
+    def throw(self, line : int = None, code : str = ""):
+        print(self.message(line, code), end="")
 
 class NoDeclarationError(Error):
     def __init__(self, identifier : str):
@@ -28,4 +35,40 @@ class ReDeclarationError(Error):
 
 class ParseError(Error):
     def __init__(self, text = ""):
-        super().__init__(text, "Parse Error")
\ No newline at end of file
+        super().__init__(text, "Parse Error")
+
+class LimitError(Error):
+    def __init__(self, limit : str, text = ""):
+        super().__init__(text, "Limit Error")
+        self.limit = limit
+
+# How many times the same call is listed in a row before the rest are counted instead
+REPEATS = 3
+
+class PseudoLangError(Exception):
+    # Raised by Program.throw, carries everything needed to print the report later
+    def __init__(self, error, line = None, code = "", calls = (), column = None):
+        super().__init__(f"Line {line}: {error.text}" if line else error.text)
+        self.error = error
+        self.line = line
+        self.code = code
+        self.calls = tuple(calls)
+        self.column = column
+    def report(self, paint = colored):
+        report = ""
+        if self.calls:
+            report += "\n"
+            # Like Python's tracebacks, a call repeated more than REPEATS times in a row is shown once with a count
+            repeated = 0
+            for index, (line, name, code) in enumerate(self.calls):
+                if index >= REPEATS and all(call == self.calls[index] for call in self.calls[index-REPEATS:index]):
+                    repeated += 1
+                    continue
+                if repeated:
+                    report += paint(f"\t[The call above is repeated {repeated} more times]", "yellow") + "\n"
+                    repeated = 0
+                report += paint(f"Line {line} calls {name}", "yellow") + "\n"
+                report += paint(f"\tProgram Code:\t{code}", "yellow") + "\n"
+            if repeated:
+                report += paint(f"\t[The call above is repeated {repeated} more times]", "yellow") + "\n"
+        return report + self.error.message(self.line, self.code, paint, self.column)
@@ -0,0 +1,55 @@
+import ast
+
+from .helpers import *
+from .arithmetic import *
+
+class Expression:
+    def __init__(self, source : str, tokens = None):
+        # tokens are the lexer's tokens of source, when the parser has them already
+        self.source = source
+        self.literal = None
+        self.tree = None
+        self.function = None
+        self.error = None
+        self.addresses = None
+        try:
+            tree = parse_expression(source if tokens is None else tokens)
+        except SyntaxError as e:
+            self.error = e
+            return
+        if type(tree.body) == ast.Constant:
+            self.literal = tree.body.value
+        else:
+            self.tree = tree
+            self.link(lambda name: (None, None))
+    @property
+    def names(self):
+        if self.tree is None:
+            return set()
+        return set(node.id for node in ast.walk(self.tree) if isinstance(node, ast.Name))
+    def link(self, resolve):
+        # resolve(name) gives the (depth, slot) of a name, names without a slot are looked up when evaluated
+        if self.tree is None:
+            return
+        self.addresses = dict((name, resolve(name)) for name in self.names)
+        self.function = build(self.tree.body, self.addresses)
+    def __getstate__(self):
+        # Closures cannot be pickled, they are built again from the tree and the addresses
+        state = dict(self.__dict__)
+        state["function"] = None
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.tree is not None and self.addresses is not None:
+            self.function = build(self.tree.body, self.addresses)
+    def __repr__(self):
+        return repr(self.source)
+    def __str__(self):
+        return self.source
+    def __bool__(self):
+        return len(self.source) > 0
+
+def compile_expression(expression):
+    if type(expression) == Expression:
+        return expression
+    return Expression(expression)
@@ -1,5 +1,10 @@
+import sys
+import contextlib
+
 from termcolor import colored
 from .data_types import *
+from .opcodes import *
+from .classes import *
 
 def printc(color, *args, **kwargs):
     if "sep" in kwargs:
@@ -16,18 +21,76 @@ def convert_literal_to_python(value : str):
     if all([i.isdigit() or i == '-' for i in value]) and len(value) > 0:
         return int(value)
     if value == "TRUE":
-        return Boolean(True)
+        return TRUE
     if value == "FALSE":
-        return Boolean(False)
+        return FALSE
     try:
         return float(value)
     except ValueError:
         return None
     
 
+# The statements that the interpreter runs in a frame of their own, or that leave frames
+OPENERS = {IF, FOR, WHILE, REPEAT, CALL, RETURN}
+
+def measure_spans(instructions, spans, line = 1):
+    # Records the (start, end) lines of every block and IF branch, keyed by id, and numbers every Block.
+    # Optimized blocks have statements missing, so their numbers are kept rather than counted again
+    numbered = getattr(instructions, "numbered", None)
+    if type(instructions) == Block:
+        instructions.flat = not any(type(instruction) in OPENERS for instruction in instructions)
+    first = line
+    measured = []
+    for index, instruction in enumerate(instructions):
+        if numbered is not None:
+            line = numbered[index][0]
+        measured.append(line)
+        start = line
+        if type(instruction) == IF:
+            for block in instruction.statements:
+                header = line if block.start is None else block.start
+                line = measure_spans(block, spans, header + 1)
+                spans[id(block)] = (header, line - 1)
+            spans[id(instruction)] = (start, line)
+        elif hasattr(instruction, "statements"):
+            line = measure_spans(instruction.statements, spans, line + 1)
+            spans[id(instruction)] = (start, line)
+        line += 1
+    if numbered is not None:
+        return instructions.end
+    if type(instructions) == Block:
+        instructions.start = first - 1
+        instructions.numbered = tuple(zip(measured, instructions))
+        instructions.end = line
+    return line
+
 def valid_identifier(identifier : str):
     return len(identifier) > 0 and identifier[0].isalpha() and all([i.isalnum() or i == "_" for i in identifier])
 
+class RecursionLimit:
+    # How many runs have raised Python's recursion limit, and the limit from before the first of them
+    runs = 0
+    previous = None
+
+@contextlib.contextmanager
+def python_frames(calls):
+    # FUNCTIONs run in Python's stack, calls of them need up to PYTHON_FRAMES frames each. Python 3.11 and later
+    # no longer nest C frames for them, so only those raise the limit; older ones keep it and report a
+    # Stack Overflow Error sooner. The last run to finish puts the limit back
+    if sys.version_info < (3, 11):
+        yield
+        return
+    if RecursionLimit.runs == 0:
+        RecursionLimit.previous = sys.getrecursionlimit()
+    RecursionLimit.runs += 1
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), calls * PYTHON_FRAMES))
+    try:
+        yield
+    finally:
+        RecursionLimit.runs -= 1
+        if RecursionLimit.runs == 0:
+            sys.setrecursionlimit(RecursionLimit.previous)
+
 
 # def convert_literal_to_python_with_errors(value : str, data_type : str):
 #     if data_type == "STRING":
@@ -0,0 +1,66 @@
+from .data_types import *
+
+def convert_input(value, data_type):
+    # Returns None when the value does not fit the data type
+    if data_type == "BOOLEAN" and value in ("TRUE", "FALSE"):
+        return TRUE if value == "TRUE" else FALSE
+    try:
+        return PSEUDO_TO_PYTHON[data_type](value)
+    except (ValueError, TypeError, AssertionError):
+        return None
+
+class InputReader:
+    def __init__(self, source = None):
+        # source is None for the terminal, a file object or string read in bulk, or any iterable of values
+        if source is None:
+            self.values = None
+        elif hasattr(source, "read"):
+            self.values = iter(source.read().splitlines())
+        elif isinstance(source, str):
+            self.values = iter(source.splitlines())
+        else:
+            self.values = iter(source)
+
+    def next_value(self):
+        if self.values is None:
+            return input()
+        try:
+            return next(self.values)
+        except StopIteration:
+            raise EOFError("No more input")
+
+    def read(self, data_type):
+        # Values that do not fit the data type are skipped, EOFError is raised once input runs out
+        while True:
+            value = convert_input(self.next_value(), data_type)
+            if value is not None:
+                return value
+
+class AsyncInputReader:
+    def __init__(self, source):
+        # source is an asyncio.Queue, an async iterable or a coroutine function returning the next value
+        # A None value from a queue or function marks the end of input
+        self.source = source
+        self.values = None
+        if hasattr(source, "__aiter__"):
+            self.values = source.__aiter__()
+
+    async def next_value(self):
+        if self.values is not None:
+            try:
+                return await self.values.__anext__()
+            except StopAsyncIteration:
+                raise EOFError("No more input")
+        if hasattr(self.source, "get"):
+            value = await self.source.get()
+        else:
+            value = await self.source()
+        if value is None:
+            raise EOFError("No more input")
+        return value
+
+    async def read(self, data_type):
+        while True:
+            value = convert_input(await self.next_value(), data_type)
+            if value is not None:
+                return value
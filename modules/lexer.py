@@ -0,0 +1,41 @@
+import re
+from collections import namedtuple
+
+# Columns start at 1, like lines
+Token = namedtuple("Token", "kind text line column")
+Line = namedtuple("Line", "number text tokens")
+
+# Longer operators come first so "<-" is never read as "<" and "-"
+TOKEN = re.compile(r"""
+    (?P<SPACE>\s+)
+  | (?P<STRING>"[^"]*"?)
+  | (?P<CHAR>'[^']*'?)
+  | (?P<NUMBER>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+  | (?P<NAME>[A-Za-z_]\w*)
+  | (?P<OP><-|<=|>=|<>|==|!=|//|\*\*|[-+*/%<>=(),:&\[\]])
+  | (?P<OTHER>.)
+""", re.VERBOSE)
+
+def tokenize(text, number = 1):
+    # Unknown characters become OTHER tokens, expressions are checked later from their source text
+    tokens = []
+    position = 0
+    length = len(text)
+    match = TOKEN.match
+    while position < length:
+        found = match(text, position)
+        kind = found.lastgroup
+        if kind != "SPACE":
+            value = found.group()
+            # "//" starts a comment only at the start of a line, elsewhere it is floor division
+            if not tokens and value == "//":
+                tokens.append(Token("COMMENT", text[found.end():].strip(), number, position + 1))
+                break
+            tokens.append(Token(kind, value, number, position + 1))
+        position = found.end()
+    return tokens
+
+def lex(lines):
+    # One pass over the source, one Line of tokens at a time, so a parser can consume it as it goes
+    for number, text in enumerate(lines, 1):
+        yield Line(number, text, tokenize(text, number))
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from .program import Program
+from .batch import run_program
+
+CacheInfo = namedtuple("CacheInfo", "hits misses capacity size")
+
+def source_lines(source):
+    if isinstance(source, str):
+        source = source.splitlines()
+    elif hasattr(source, "read"):
+        source = source.read().splitlines()
+    return tuple(line.strip() for line in source)
+
+class LoadedProgram:
+    # The parsed and resolved form of a program, shared by every run and never changed by one
+    __slots__ = ("lines", "instructions", "scope", "spans")
+
+    def __init__(self, program):
+        object.__setattr__(self, "lines", tuple(program.lines))
+        object.__setattr__(self, "instructions", program.instructions)
+        object.__setattr__(self, "scope", program.scope)
+        object.__setattr__(self, "spans", program.spans)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Loaded programs cannot be changed")
+
+    def program(self, dev = False, writer = None, reader = None, trace = None, memo = None, limits = None):
+        # A fresh Program holds the state of one run: line, block and call stack
+        program = Program(self.lines, dev, writer, reader, limits=limits, trace=trace, memo=memo)
+        program.instructions = self.instructions
+        program.scope = self.scope
+        program.spans = self.spans
+        return program
+
+    def run(self, mode = "tree", dev = False, writer = None, reader = None, trace = None, memo = None, limits = None):
+        # memo is a MemoCache, which can be shared by runs of the same program. A run of another program clears it
+        program = self.program(dev, writer, reader, trace, memo, limits)
+        run_program(program, mode)
+        return program
+
+    async def run_async(self, every = 1000, reader = None, writer = None, dev = False, trace = None, memo = None, limits = None):
+        # Always on the VM, the only one that can stop between instructions to give other tasks a turn
+        program = self.program(dev, writer, None, trace, memo, limits)
+        await program.run_async(every, reader)
+        return program
+
+    def __repr__(self):
+        return f"LoadedProgram({len(self.lines)} lines)"
+
+class LoadCache:
+    def __init__(self, capacity = 128):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, lines, disk_cache = None, optimize = 0):
+        # Programs are optimized as they are parsed, so each optimizer level is loaded separately
+        key = (lines, optimize)
+        with self.lock:
+            loaded = self.entries.get(key)
+            if loaded is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return loaded
+            self.misses += 1
+
+        # Parsed outside the lock, two threads may occasionally parse the same source
+        program = Program(list(lines), cache=disk_cache, optimize=optimize)
+        program.parse()
+        if program.scope is None:
+            program.resolve()
+        loaded = LoadedProgram(program)
+
+        with self.lock:
+            self.entries[key] = loaded
+            self.entries.move_to_end(key)
+            self.trim()
+        return loaded
+
+    def trim(self):
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def resize(self, capacity):
+        with self.lock:
+            self.capacity = capacity
+            self.trim()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.capacity, len(self.entries))
+
+LOAD_CACHE = LoadCache()
+
+def load(source, cache = LOAD_CACHE, disk_cache = None, optimize = 0):
+    # source is the program text, an open file or a list of lines
+    lines = source_lines(source)
+    if cache is None:
+        return LoadCache(0).get(lines, disk_cache, optimize)
+    return cache.get(lines, disk_cache, optimize)
+
+def cache_info():
+    return LOAD_CACHE.info()
@@ -0,0 +1,177 @@
+from collections import OrderedDict, namedtuple
+
+from .opcodes import *
+from .data_types import *
+from .expression import *
+from .resolver import method_names
+
+MemoInfo = namedtuple("MemoInfo", "hits misses")
+
+# Python builtins that give the same result for the same values and change nothing
+PURE_BUILTINS = {"abs", "bool", "chr", "float", "int", "len", "max", "min", "ord", "pow", "round", "str"}
+
+# What MemoCache.get gives for arguments it has no result for
+MISSING = object()
+
+class MemoCache:
+    # Results of pure FUNCTIONs by their arguments, the least recently used go first once there are capacity of them
+    def __init__(self, capacity = 10000):
+        self.capacity = capacity
+        self.results = OrderedDict()
+        self.instructions = None
+        self.hits = {}
+        self.misses = {}
+        self.evicted = 0
+
+    def bind(self, instructions):
+        # Results are keyed by the ids of declarations, so they only hold for the program they came from.
+        # Holding on to its instructions keeps those ids from being reused, runs of another program start afresh
+        if self.instructions is not instructions:
+            self.results.clear()
+            self.instructions = instructions
+
+    def get(self, name, key):
+        result = self.results.get(key, MISSING)
+        if result is MISSING:
+            self.misses[name] = self.misses.get(name, 0) + 1
+        else:
+            self.results.move_to_end(key)
+            self.hits[name] = self.hits.get(name, 0) + 1
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        if len(self.results) > self.capacity:
+            self.results.popitem(last=False)
+            self.evicted += 1
+
+    def clear(self):
+        self.results.clear()
+        self.instructions = None
+        self.hits.clear()
+        self.misses.clear()
+        self.evicted = 0
+
+    def info(self):
+        # MemoInfo(hits, misses) of every FUNCTION that was called
+        names = sorted(set(self.hits) | set(self.misses))
+        return dict((name, MemoInfo(self.hits.get(name, 0), self.misses.get(name, 0))) for name in names)
+
+    def report(self):
+        info = self.info()
+        report = f"\nMemo: {len(self.results)} of {self.capacity} results kept, {self.evicted} evicted\n"
+        report += f"{'Function':<20} {'Hits':>10} {'Misses':>10}\n"
+        for name, (hits, misses) in info.items():
+            report += f"{name:<20} {hits:>10} {misses:>10}\n"
+        return report
+
+def memo_key(instruction, values):
+    # 1 and 1.0 or "A" and 'A' are equal in Python but not to a FUNCTION's parameters, so the types are part of the key
+    return (id(instruction), tuple(values), tuple(type(value) for value in values))
+
+def literal(instruction):
+    # Whether a CONSTANT has the same value in every run, rather than one worked out from what the run did
+    value = instruction.value
+    if type(value) == Expression:
+        return value.literal is not None
+    return type(value) != str and type(value) in PYTHON_TO_PSEUDO
+
+def nested(statements):
+    # Every instruction of a block and the blocks inside it, but not the bodies of methods
+    for instruction in statements:
+        yield instruction
+        if type(instruction) == IF:
+            for block in instruction.statements:
+                yield from nested(block)
+        elif type(instruction) != PROCEDURE and type(instruction) != FUNCTION and hasattr(instruction, "statements"):
+            yield from nested(instruction.statements)
+
+def declared(statements, names):
+    # Every name declared in statements and in the methods among them, parameters included
+    for instruction in nested(statements):
+        instruction_type = type(instruction)
+        if instruction_type == DECLARE:
+            names.update(instruction.identifiers)
+        elif instruction_type == CONSTANT:
+            names.add(instruction.identifier)
+        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            names.add(instruction.identifier)
+            names.update(instruction.parameters)
+            declared(instruction.statements, names)
+    return names
+
+def expressions(instruction):
+    instruction_type = type(instruction)
+    if instruction_type == ASSIGNMENT or instruction_type == CONSTANT:
+        return [instruction.value]
+    if instruction_type == IF:
+        return [condition for condition in instruction.conditions if condition != "ELSE"]
+    if instruction_type == FOR:
+        return [instruction.lower, instruction.upper, instruction.step]
+    if instruction_type == WHILE or instruction_type == REPEAT:
+        return [instruction.condition]
+    if instruction_type == RETURN:
+        return [instruction.expression]
+    return []
+
+def pure_functions(instructions):
+    # The top-level FUNCTIONs whose result only depends on their arguments: they do no INPUT, OUTPUT or CALL,
+    # assign only their own variables and read nothing else but literal CONSTANTs, pure FUNCTIONs and pure builtins
+    names = declared(instructions, set())
+    dynamic = method_names(instructions, set())
+    kinds = {}
+    for instruction in nested(instructions):
+        instruction_type = type(instruction)
+        if instruction_type == DECLARE:
+            for identifier in instruction.identifiers:
+                kinds.setdefault(identifier, []).append(instruction)
+        elif instruction_type == CONSTANT or instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            kinds.setdefault(instruction.identifier, []).append(instruction)
+
+    functions = {}
+    for name, declarations in kinds.items():
+        if len(declarations) == 1 and type(declarations[0]) == FUNCTION:
+            functions[name] = declarations[0]
+
+    calls = {}
+    for name, function in functions.items():
+        local = set(function.parameters) | declared(function.statements, set())
+        called = set()
+        pure = True
+        for instruction in nested(function.statements):
+            instruction_type = type(instruction)
+            if instruction_type in (INPUT, OUTPUT, CALL, PROCEDURE, FUNCTION, UNKNOWN):
+                pure = False
+            elif instruction_type in (ASSIGNMENT, FOR) and instruction.identifier not in local:
+                pure = False
+            for expression in expressions(instruction):
+                if type(expression) != Expression:
+                    continue
+                for used in expression.names:
+                    if used in local:
+                        continue
+                    declarations = kinds.get(used, [])
+                    if used in dynamic:
+                        # Read from whichever caller declares it
+                        pure = False
+                    elif used in functions:
+                        called.add(used)
+                    elif len(declarations) == 1 and type(declarations[0]) == CONSTANT and literal(declarations[0]):
+                        continue
+                    elif used not in names and used in PURE_BUILTINS:
+                        continue
+                    else:
+                        pure = False
+        if pure:
+            calls[name] = called
+
+    # A FUNCTION calling an impure one is impure too, recursion on its own is fine
+    changed = True
+    while changed:
+        changed = False
+        for name in list(calls):
+            if any(callee not in calls for callee in calls[name]):
+                del calls[name]
+                changed = True
+
+    return set(id(functions[name]) for name in calls)
@@ -0,0 +1,490 @@
+import ast
+import copy
+from collections import Counter
+
+from .opcodes import *
+from .data_types import *
+from .classes import *
+from .expression import *
+from .resolver import method_names
+
+# Folded values stay small, so "2 ** 10 ** 9" or a long string repeated is left for run time
+LARGEST = 4096
+
+# Values a folded expression can turn into, anything else keeps its operator
+FOLDED = (int, float, str, String, Char, Boolean)
+
+# Operators whose result can be hoisted into a CONSTANT. They cannot raise on two INTEGERs or two REALs,
+# unlike division and powers, so the hoisted CONSTANT never reports an error the loop would not have.
+# Comparisons are cheap enough to leave
+ARITHMETIC = (ast.Add, ast.Sub, ast.Mult)
+
+NUMERIC = ("INTEGER", "REAL")
+
+def rebuild(block, numbered):
+    # A copy of the block with other statements, the lines before and after it stay the same
+    return Block((instruction for (_, instruction) in numbered), block.start, tuple(numbered), block.end)
+
+def rewritten(expression, tree):
+    # Built directly rather than parsed again, the tree may hold values that have no spelling of their own
+    result = copy.copy(expression) if expression is not None else Expression.__new__(Expression)
+    result.error = None
+    result.function = None
+    result.literal = None
+    result.tree = tree
+    if isinstance(tree.body, ast.Constant) and type(tree.body.value) in FOLDED:
+        result.literal = tree.body.value
+        result.tree = None
+    result.source = unparse(tree.body)
+    return result
+
+def declarations(statements, counts):
+    # How often every name is declared in one scope, nested procedures have their own
+    for instruction in statements:
+        instruction_type = type(instruction)
+        if instruction_type == DECLARE:
+            counts.update(instruction.identifiers)
+        elif instruction_type == CONSTANT or instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            counts[instruction.identifier] += 1
+        elif instruction_type == IF:
+            for block in instruction.statements:
+                declarations(block, counts)
+        elif hasattr(instruction, "statements"):
+            declarations(instruction.statements, counts)
+    return counts
+
+def expressions(instruction):
+    # The expressions an instruction evaluates itself, not those of its blocks
+    instruction_type = type(instruction)
+    if instruction_type == CONSTANT or instruction_type == ASSIGNMENT:
+        return [instruction.value]
+    if instruction_type == OUTPUT:
+        return list(instruction.exp)
+    if instruction_type == IF:
+        return [condition for condition in instruction.conditions if condition != "ELSE"]
+    if instruction_type == FOR:
+        return [instruction.lower, instruction.upper] + ([instruction.step] if instruction.step is not None else [])
+    if instruction_type == WHILE or instruction_type == REPEAT:
+        return [instruction.condition]
+    if instruction_type == CALL:
+        return list(instruction.arguments)
+    if instruction_type == RETURN:
+        return [instruction.expression]
+    return []
+
+def with_expressions(instruction, function):
+    # The instruction with function applied to every expression it evaluates itself
+    instruction_type = type(instruction)
+    if instruction_type == CONSTANT or instruction_type == ASSIGNMENT:
+        return instruction._replace(value=function(instruction.value))
+    if instruction_type == OUTPUT:
+        return instruction._replace(exp=[function(expression) for expression in instruction.exp])
+    if instruction_type == IF:
+        return instruction._replace(conditions=[condition if condition == "ELSE" else function(condition) for condition in instruction.conditions])
+    if instruction_type == FOR:
+        step = function(instruction.step) if instruction.step is not None else None
+        return instruction._replace(lower=function(instruction.lower), upper=function(instruction.upper), step=step)
+    if instruction_type == WHILE or instruction_type == REPEAT:
+        return instruction._replace(condition=function(instruction.condition))
+    if instruction_type == CALL:
+        return instruction._replace(arguments=[function(argument) for argument in instruction.arguments])
+    if instruction_type == RETURN:
+        return instruction._replace(expression=function(instruction.expression))
+    return instruction
+
+def walk(instructions, visit):
+    # Rebuilds every block bottom up, visit(numbered) returns the (line, instruction) pairs the block keeps
+    numbered = []
+    for line, instruction in instructions.numbered:
+        if type(instruction) == IF:
+            instruction = instruction._replace(statements=[walk(block, visit) for block in instruction.statements])
+        elif hasattr(instruction, "statements"):
+            instruction = instruction._replace(statements=walk(instruction.statements, visit))
+        numbered.append((line, instruction))
+    return rebuild(instructions, visit(numbered))
+
+class Fold(ast.NodeTransformer):
+    # Replaces names of known constants and evaluates operators whose operands are all literals
+    def __init__(self, constants):
+        self.constants = constants
+        self.changed = False
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.constants:
+            self.changed = True
+            return ast.copy_location(ast.Constant(self.constants[node.id]), node)
+        return node
+
+    def fold(self, node):
+        node = self.generic_visit(node)
+        operands = [child for child in ast.iter_child_nodes(node) if isinstance(child, ast.expr)]
+        if not all(isinstance(operand, ast.Constant) for operand in operands) or not bounded(node):
+            return node
+        try:
+            value = evaluate_tree(node)
+        except Exception:
+            # Left for run time, which reports the error on the right line
+            return node
+        if type(value) not in FOLDED or (type(value) == int and value.bit_length() > LARGEST) or (isinstance(value, str) and len(value) > LARGEST):
+            return node
+        self.changed = True
+        return ast.copy_location(ast.Constant(value), node)
+
+    visit_BinOp = visit_UnaryOp = visit_Compare = visit_BoolOp = fold
+
+def bounded(node):
+    if not isinstance(node, ast.BinOp):
+        return True
+    left, right = node.left.value, node.right.value
+    if isinstance(node.op, ast.Pow) and type(left) == int and type(right) == int:
+        return abs(left) <= 1 or right <= 256
+    if isinstance(node.op, ast.Mult):
+        for text, count in ((left, right), (right, left)):
+            if isinstance(text, str) and type(count) == int and len(text) * count > LARGEST:
+                return False
+    return True
+
+def fold(expression, constants):
+    if type(expression) != Expression or expression.tree is None:
+        return expression
+    folder = Fold(constants)
+    tree = folder.visit(copy.deepcopy(expression.tree))
+    if not folder.changed:
+        return expression
+    return rewritten(expression, tree)
+
+class ConstantFolder:
+    # A CONSTANT with a number as its value is known to every statement after it in its block,
+    # and to procedures declared after it, as long as nothing else in its scope uses the name
+    # and no method declares it, since a procedure reads that name from its caller
+    def __init__(self, instructions):
+        self.inputs = set()
+        self.find_inputs(instructions)
+        self.dynamic = method_names(instructions, set())
+
+    def find_inputs(self, statements):
+        # INPUT writes into a constant without checking, so those constants are never folded
+        for instruction in statements:
+            if type(instruction) == INPUT:
+                self.inputs.add(instruction.identifier)
+            elif type(instruction) == IF:
+                for block in instruction.statements:
+                    self.find_inputs(block)
+            elif hasattr(instruction, "statements"):
+                self.find_inputs(instruction.statements)
+
+    def fold(self, instructions):
+        return self.block(instructions, {}, declarations(instructions, Counter()), None)
+
+    def block(self, statements, constants, counts, outer):
+        # outer holds the global constants inside procedures, at the top level they are the constants themselves
+        constants = dict(constants)
+        numbered = []
+        for line, instruction in statements.numbered:
+            instruction = with_expressions(instruction, lambda expression: fold(expression, constants))
+            instruction_type = type(instruction)
+            if instruction_type == PROCEDURE or instruction_type == FUNCTION:
+                global_constants = constants if outer is None else outer
+                local_counts = declarations(instruction.statements, Counter(instruction.parameters))
+                visible = dict((name, value) for (name, value) in global_constants.items() if name not in local_counts and name not in self.dynamic)
+                instruction = instruction._replace(statements=self.block(instruction.statements, visible, local_counts, dict(global_constants)))
+            elif instruction_type == IF:
+                instruction = instruction._replace(statements=[self.block(block, constants, counts, outer) for block in instruction.statements])
+            elif hasattr(instruction, "statements"):
+                instruction = instruction._replace(statements=self.block(instruction.statements, constants, counts, outer))
+            elif instruction_type == CONSTANT:
+                identifier = instruction.identifier
+                value = instruction.value.literal if type(instruction.value) == Expression else None
+                if type(value) in (int, float) and counts[identifier] == 1 and identifier not in self.inputs:
+                    constants[identifier] = value
+            numbered.append((line, instruction))
+        return rebuild(statements, numbered)
+
+def fold_constants(instructions):
+    return ConstantFolder(instructions).fold(instructions)
+
+def declares(block):
+    return len(declarations(block, Counter())) > 0
+
+def taken(condition):
+    # Whether a constant condition picks its branch, with the same test the interpreter makes
+    return condition == "ELSE" or condition.literal is True or condition.literal is TRUE
+
+def constant(condition):
+    return condition == "ELSE" or (type(condition) == Expression and condition.literal is not None)
+
+def prune(numbered):
+    # Every condition of an IF is evaluated even after a branch was taken, so only constant ones can go.
+    # Branches that declare names keep their slots, and empty branches keep the IF for its error
+    result = []
+    for line, instruction in numbered:
+        if type(instruction) != IF or any(len(block) == 0 for block in instruction.statements):
+            result.append((line, instruction))
+            continue
+        kept = []
+        decided = False
+        for condition, block in zip(instruction.conditions, instruction.statements):
+            if not constant(condition):
+                kept.append((condition, block))
+            elif not decided and taken(condition):
+                kept.append((condition, block))
+                decided = True
+            elif declares(block):
+                kept.append((condition, block))
+        if len(kept) == 1 and constant(kept[0][0]) and taken(kept[0][0]):
+            # The only branch left always runs, so its statements take the place of the IF
+            result += kept[0][1].numbered
+        elif len(kept) == len(instruction.conditions):
+            result.append((line, instruction))
+        elif kept:
+            result.append((line, IF([condition for (condition, _) in kept], [block for (_, block) in kept])))
+    return result
+
+def prune_branches(instructions):
+    return walk(instructions, prune)
+
+def strip(numbered):
+    # Blank lines and comments do nothing, a block made only of them keeps one so an IF branch is never empty
+    kept = [(line, instruction) for (line, instruction) in numbered if instruction and type(instruction) != COMMENT]
+    if not kept and numbered:
+        return numbered[:1]
+    return kept
+
+def remove_noops(instructions):
+    return walk(instructions, strip)
+
+def names(instructions, found):
+    # Every name the program uses, so hoisted constants get one of their own
+    for instruction in instructions:
+        for field in instruction:
+            if type(field) == Identifier:
+                found.add(field)
+            elif type(field) in (tuple, list) and all(type(item) == Identifier for item in field):
+                found.update(field)
+        for expression in expressions(instruction):
+            if type(expression) == Expression:
+                found |= expression.names
+        if type(instruction) == IF:
+            for block in instruction.statements:
+                names(block, found)
+        elif hasattr(instruction, "statements"):
+            names(instruction.statements, found)
+    return found
+
+def writes(statements, written):
+    # Every name a loop assigns, reads into or declares, and whether it calls anything that could assign more
+    calls = False
+    for instruction in statements:
+        instruction_type = type(instruction)
+        if instruction_type in (ASSIGNMENT, INPUT, CONSTANT, FOR, PROCEDURE, FUNCTION):
+            written.add(instruction.identifier)
+        elif instruction_type == DECLARE:
+            written.update(instruction.identifiers)
+        elif instruction_type == CALL:
+            calls = True
+        for expression in expressions(instruction):
+            if type(expression) == Expression and expression.tree is not None:
+                calls = calls or any(isinstance(node, ast.Call) for node in ast.walk(expression.tree))
+        if instruction_type == IF:
+            for block in instruction.statements:
+                calls = writes(block, written) or calls
+        elif hasattr(instruction, "statements"):
+            calls = writes(instruction.statements, written) or calls
+    return calls
+
+class Hoist(ast.NodeTransformer):
+    # Replaces the largest arithmetic on names the loop never writes with a name for its value.
+    # known maps the numeric variables sure to have a value before the loop to their types
+    def __init__(self, written, known, hoisted, fresh):
+        self.written = written
+        self.known = known
+        self.hoisted = hoisted
+        self.fresh = fresh
+        self.changed = False
+
+    def kind(self, node):
+        # INTEGER or REAL for arithmetic that cannot raise, with every value of that one type, otherwise None
+        if isinstance(node, ast.Constant):
+            return PYTHON_TO_PSEUDO[type(node.value)] if type(node.value) in (int, float) else None
+        if isinstance(node, ast.Name):
+            return self.known.get(node.id) if node.id not in self.written else None
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ARITHMETIC):
+            left = self.kind(node.left)
+            return left if left is not None and left == self.kind(node.right) else None
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            return self.kind(node.operand)
+        return None
+
+    def invariant(self, node):
+        return self.kind(node) is not None
+
+    def visit(self, node):
+        if isinstance(node, (ast.BinOp, ast.UnaryOp)) and self.invariant(node) and any(isinstance(child, ast.Name) for child in ast.walk(node)):
+            source = unparse(node)
+            if source not in self.hoisted:
+                self.hoisted[source] = (self.fresh(), node)
+            self.changed = True
+            return ast.copy_location(ast.Name(self.hoisted[source][0], ast.Load()), node)
+        return self.generic_visit(node)
+
+class Hoister:
+    # Loop-invariant arithmetic is computed once by a CONSTANT declared just before the loop.
+    # Only loops outside other loops are hoisted, since a CONSTANT cannot be declared twice, and only
+    # expressions the first iteration is sure to evaluate, so a loop that never runs evaluates nothing new:
+    # WHILE conditions, the bodies of FOR loops without STEP and of REPEAT loops, up to their first
+    # statement that is not an assignment or OUTPUT. Only arithmetic that cannot raise, on variables sure to hold
+    # a value, is hoisted, so computing it ahead of an OUTPUT changes neither the output nor the error reported
+    def __init__(self, instructions):
+        self.taken = names(instructions, set()) | set(KEYWORDS)
+        self.count = 0
+
+    def fresh(self):
+        self.count += 1
+        while f"Invariant{self.count}" in self.taken:
+            self.count += 1
+        return f"Invariant{self.count}"
+
+    def block(self, statements, known):
+        # A numeric variable is known to have a value once this block has assigned or input it,
+        # or when it is a numeric parameter of the method. Nothing takes a value away again
+        known = dict(known)
+        declared = {}
+        numbered = []
+        for line, instruction in statements.numbered:
+            instruction_type = type(instruction)
+            if instruction_type == WHILE or instruction_type == FOR or instruction_type == REPEAT:
+                numbered += self.loop(line, instruction, known)
+                continue
+            if instruction_type == DECLARE and instruction.data_type in NUMERIC:
+                for identifier in instruction.identifiers:
+                    declared[identifier] = instruction.data_type
+            elif (instruction_type == ASSIGNMENT or instruction_type == INPUT) and instruction.identifier in declared:
+                known[instruction.identifier] = declared[instruction.identifier]
+            elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+                parameters = dict((parameter, data_type) for (parameter, data_type) in zip(instruction.parameters, instruction.data_types) if data_type in NUMERIC)
+                instruction = instruction._replace(statements=self.block(instruction.statements, parameters))
+            elif instruction_type == IF:
+                instruction = instruction._replace(statements=[self.block(block, known) for block in instruction.statements])
+            elif hasattr(instruction, "statements"):
+                instruction = instruction._replace(statements=self.block(instruction.statements, known))
+            numbered.append((line, instruction))
+        return rebuild(statements, numbered)
+
+    def loop(self, line, instruction, known):
+        written = set()
+        if writes((instruction,), written):
+            return [(line, instruction)]
+        hoisted = {}
+
+        def hoist(expression):
+            if type(expression) != Expression or expression.tree is None:
+                return expression
+            hoister = Hoist(written, known, hoisted, self.fresh)
+            tree = hoister.visit(copy.deepcopy(expression.tree))
+            return rewritten(expression, tree) if hoister.changed else expression
+
+        instruction_type = type(instruction)
+        if instruction_type == WHILE:
+            instruction = instruction._replace(condition=hoist(instruction.condition))
+        elif instruction_type == REPEAT or instruction.step is None:
+            numbered = []
+            simple = True
+            for statement_line, statement in instruction.statements.numbered:
+                simple = simple and (not statement or type(statement) in (COMMENT, ASSIGNMENT, OUTPUT))
+                if simple:
+                    statement = with_expressions(statement, hoist)
+                numbered.append((statement_line, statement))
+            instruction = instruction._replace(statements=rebuild(instruction.statements, numbered))
+            if instruction_type == REPEAT and simple:
+                instruction = instruction._replace(condition=hoist(instruction.condition))
+
+        constants = [(line, CONSTANT(Identifier(name), rewritten(None, ast.Expression(node)))) for (name, node) in hoisted.values()]
+        return constants + [(line, instruction)]
+
+def hoist_invariants(instructions):
+    return Hoister(instructions).block(instructions, {})
+
+# (level, name, pass), every pass up to the chosen level runs in this order
+PASSES = [
+    (1, "constants", fold_constants),
+    (1, "branches", prune_branches),
+    (1, "noops", remove_noops),
+    (2, "invariants", hoist_invariants),
+]
+
+LEVELS = (0, 1, 2)
+
+def optimize(instructions, level, show = None):
+    # Takes measured instructions and returns new ones, show(name, instructions) sees the program after every pass
+    for pass_level, name, function in PASSES:
+        if level >= pass_level:
+            instructions = function(instructions)
+            if show is not None:
+                show(name, instructions)
+    return instructions
+
+def text(expression):
+    return str(expression) if expression is not None else ""
+
+def listing(instructions, depth = 0):
+    # The program as the optimizer left it, every statement with the line it came from
+    result = ""
+    indent = "    " * depth
+
+    def add(line, code):
+        nonlocal result
+        result += f"{line:>5}  {indent}{code}".rstrip() + "\n"
+
+    for line, instruction in instructions.numbered:
+        instruction_type = type(instruction)
+        if not instruction:
+            add(line, "")
+        elif instruction_type == COMMENT:
+            add(line, f"// {instruction.value}")
+        elif instruction_type == DECLARE:
+            add(line, f"DECLARE {', '.join(instruction.identifiers)} : {instruction.data_type}")
+        elif instruction_type == CONSTANT:
+            add(line, f"CONSTANT {instruction.identifier} = {text(instruction.value)}")
+        elif instruction_type == ASSIGNMENT:
+            add(line, f"{instruction.identifier} <- {text(instruction.value)}")
+        elif instruction_type == INPUT:
+            add(line, f"INPUT {instruction.identifier}")
+        elif instruction_type == OUTPUT:
+            add(line, f"OUTPUT {', '.join(text(expression) for expression in instruction.exp)}")
+        elif instruction_type == IF:
+            for index, (condition, block) in enumerate(zip(instruction.conditions, instruction.statements)):
+                header = line if index == 0 else block.start
+                if condition == "ELSE":
+                    add(header, "ELSE")
+                else:
+                    add(header, f"{'IF' if index == 0 else 'ELSE IF'} {text(condition)} THEN")
+                result += listing(block, depth + 1)
+            add(instruction.statements[-1].end, "ENDIF")
+        elif instruction_type == FOR:
+            step = f" STEP {text(instruction.step)}" if instruction.step is not None else ""
+            add(line, f"FOR {instruction.identifier} <- {text(instruction.lower)} TO {text(instruction.upper)}{step}")
+            result += listing(instruction.statements, depth + 1)
+            add(instruction.statements.end, f"NEXT {instruction.identifier}")
+        elif instruction_type == WHILE:
+            add(line, f"WHILE {text(instruction.condition)}")
+            result += listing(instruction.statements, depth + 1)
+            add(instruction.statements.end, "ENDWHILE")
+        elif instruction_type == REPEAT:
+            add(line, "REPEAT")
+            result += listing(instruction.statements, depth + 1)
+            add(instruction.statements.end, f"UNTIL {text(instruction.condition)}")
+        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            keyword = instruction_type.__name__
+            parameters = ", ".join(f"{parameter} : {data_type}" for (parameter, data_type) in zip(instruction.parameters, instruction.data_types))
+            returns = f" RETURNS {instruction.return_type}" if instruction_type == FUNCTION else ""
+            add(line, f"{keyword} {instruction.identifier}({parameters}){returns}")
+            result += listing(instruction.statements, depth + 1)
+            add(instruction.statements.end, f"END{keyword}")
+        elif instruction_type == CALL:
+            arguments = f"({', '.join(text(argument) for argument in instruction.arguments)})" if instruction.arguments else ""
+            add(line, f"CALL {instruction.identifier}{arguments}")
+        elif instruction_type == RETURN:
+            add(line, f"RETURN {text(instruction.expression)}")
+        else:
+            add(line, instruction.expression)
+    return result
@@ -0,0 +1,84 @@
+import sys
+
+from termcolor import colored
+
+# unbuffered: every write goes straight to the sink
+# line: flush whenever a line is completed, for interactive use
+# block: flush once the buffer reaches the size limit, for batch runs
+FLUSH_POLICIES = ("unbuffered", "line", "block")
+
+class OutputWriter:
+    def __init__(self, sink = None, policy = None, limit = 65536):
+        self.sink = sink
+        if policy is None:
+            policy = "line" if self.interactive() else "block"
+        if policy not in FLUSH_POLICIES:
+            raise ValueError(f"Unknown flush policy '{policy}'")
+        self.policy = policy
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+        self.written = 0
+
+    @property
+    def stream(self):
+        # Looked up on every flush so a redirected sys.stdout is respected
+        if self.sink is None:
+            return sys.stdout
+        return self.sink
+
+    def interactive(self):
+        try:
+            return self.stream.isatty()
+        except (AttributeError, ValueError):
+            return False
+
+    def paint(self, text, color):
+        # Colours follow the sink rather than the process's stdout
+        if self.sink is None:
+            return colored(text, color)
+        return colored(text, color, no_color=not self.interactive())
+
+    def cprint(self, text, color):
+        self.write(self.paint(str(text), color) + "\n")
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        self.written += len(text)
+        if self.policy == "block":
+            if self.size >= self.limit:
+                self.flush()
+        elif self.policy == "line":
+            if "\n" in text:
+                self.flush()
+        else:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            stream = self.stream
+            stream.write("".join(self.parts))
+            stream.flush()
+            self.parts.clear()
+            self.size = 0
+
+class AsyncOutputWriter(OutputWriter):
+    def __init__(self, send, policy = "line", limit = 65536):
+        # send is a coroutine function such as a websocket's send, called with each flushed chunk
+        super().__init__(None, policy, limit)
+        self.send = send
+        self.pending = []
+
+    def paint(self, text, color):
+        return colored(text, color, no_color=True)
+
+    def flush(self):
+        if self.parts:
+            self.pending.append("".join(self.parts))
+            self.parts.clear()
+            self.size = 0
+
+    async def drain(self):
+        while self.pending:
+            await self.send(self.pending.pop(0))
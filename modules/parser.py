@@ -0,0 +1,332 @@
+from .opcodes import *
+from .data_types import *
+from .classes import *
+from .errors import *
+from .expression import *
+from .lexer import *
+
+# Lines that end a block, with the block they belong to and the error for using them anywhere else
+CLOSERS = {
+    "ELSE": (IF, "ELSE must be used inside IF", ""),
+    "ENDIF": (IF, "ENDIF must be used after IF", ""),
+    "NEXT": (FOR, "NEXT Must Be Used After FOR", ""),
+    "ENDWHILE": (WHILE, "ENDWHILE must be used after WHILE", ""),
+    "UNTIL": (REPEAT, "UNTIL must be used after REPEAT", ""),
+    "ENDPROCEDURE": (PROCEDURE, "ENDPROCEDURE cannot be used without PROCEDURE", ""),
+    "ENDFUNCTION": (FUNCTION, "ENDFUNCTION cannot be used without FUNCTION", "Block Error"),
+}
+
+OPENING = ("(", "[")
+CLOSING = (")", "]")
+
+class Parser:
+    # Recursive descent over the lexer's lines, every block is parsed by the call that opened it
+    def __init__(self, program):
+        self.program = program
+        self.lines = None
+        self.line = None
+
+    def parse(self, lines):
+        return Block(instruction for (_, instruction) in self.stream(lines))
+
+    def stream(self, lines):
+        # Yields (line, instruction) for every top-level instruction as soon as it is complete
+        self.lines = iter(lines)
+        while self.next_line() is not None:
+            tokens = self.line.tokens
+            if tokens and tokens[0].kind == "NAME" and tokens[0].text in CLOSERS and not self.assignment(tokens):
+                self.misplaced(self.line)
+            number = self.line.number
+            instructions = []
+            self.parse_statement(tokens, instructions)
+            yield number, instructions[0]
+
+    def fail(self, column, error_type = Error, *args):
+        self.program.column = column
+        self.program.throw(error_type, *args)
+
+    def trace(self, instruction):
+        if self.program.tracer is not None:
+            self.program.tracer.parsed(instruction)
+
+    def next_line(self):
+        self.line = next(self.lines, None)
+        if self.line is not None:
+            self.program.line = self.line.number
+        return self.line
+
+    def parse_block(self, instructions):
+        # Returns the line that ended the block, or None at the end of the file
+        while self.next_line() is not None:
+            tokens = self.line.tokens
+            if tokens and tokens[0].kind == "NAME" and tokens[0].text in CLOSERS and not self.assignment(tokens):
+                return self.line
+            self.parse_statement(tokens, instructions)
+        return None
+
+    def misplaced(self, line):
+        self.program.line = line.number
+        _, text, error_type = CLOSERS[line.tokens[0].text]
+        if error_type:
+            self.fail(line.tokens[0].column, Error, text, error_type)
+        self.fail(line.tokens[0].column, Error, text)
+
+    def parse_body(self, instructions, opener, header):
+        # Parses a block and returns the line that closed it, which must belong to the opener
+        closer = self.parse_block(instructions)
+        if closer is None:
+            self.program.line = header.number
+            self.fail(header.tokens[0].column, ParseError, f"{opener.__name__} block was not closed")
+        if CLOSERS[closer.tokens[0].text][0] != opener:
+            self.misplaced(closer)
+        return closer
+
+    def source(self, tokens):
+        # The original text of the tokens, so string literals keep their spacing and commas
+        if not tokens:
+            return ""
+        line = self.line.text
+        last = tokens[-1]
+        return line[tokens[0].column - 1:last.column - 1 + len(last.text)]
+
+    def expression(self, tokens):
+        return Expression(self.source(tokens), tokens)
+
+    def split(self, tokens, separator):
+        # Splits on separators outside brackets, "a, max(b, c)" -> a | max(b, c)
+        parts = [[]]
+        depth = 0
+        for token in tokens:
+            if token.kind == "OP":
+                if token.text in OPENING:
+                    depth += 1
+                elif token.text in CLOSING:
+                    depth -= 1
+                elif token.text == separator and depth == 0:
+                    parts.append([])
+                    continue
+            parts[-1].append(token)
+        return parts
+
+    def find(self, tokens, text, start = 0):
+        # Index of the first token with this text outside brackets, or None
+        depth = 0
+        for index in range(start, len(tokens)):
+            token = tokens[index]
+            if token.kind == "OP" and token.text in OPENING:
+                depth += 1
+            elif token.kind == "OP" and token.text in CLOSING:
+                depth -= 1
+            elif depth == 0 and token.text == text and token.kind != "STRING" and token.kind != "CHAR":
+                return index
+        return None
+
+    def matching(self, tokens, start):
+        # Index of the bracket that closes the one at start, or None
+        depth = 0
+        for index in range(start, len(tokens)):
+            token = tokens[index]
+            if token.kind == "OP" and token.text in OPENING:
+                depth += 1
+            elif token.kind == "OP" and token.text in CLOSING:
+                depth -= 1
+                if depth == 0:
+                    return index
+        return None
+
+    def assignment(self, tokens):
+        return len(tokens) > 1 and tokens[1].text == "<-"
+
+    def end_column(self, tokens):
+        if not tokens:
+            return 1
+        return tokens[-1].column + len(tokens[-1].text)
+
+    def parse_statement(self, tokens, instructions):
+        # Blank Line
+        if not tokens:
+            instructions.append(tuple())
+            return
+
+        first = tokens[0]
+        keyword = first.text if first.kind == "NAME" else None
+
+        if self.assignment(tokens):
+            instructions.append(ASSIGNMENT(Identifier(first.text), self.expression(tokens[2:])))
+
+        elif first.kind == "COMMENT":
+            instructions.append(COMMENT(first.text))
+
+        elif keyword == "DECLARE":
+            parts = self.split(tokens[1:], ":")
+            if len(parts) != 2:
+                colons = [token for token in tokens if token.kind == "OP" and token.text == ":"]
+                column = colons[1].column if len(colons) > 1 else self.end_column(tokens)
+                self.fail(column, Error, "Invalid Syntax: Must Use One Colon")
+            identifiers = tuple(Identifier(self.source(part)) for part in self.split(parts[0], ","))
+            instructions.append(DECLARE(identifiers, self.source(parts[1])))
+
+        elif keyword == "CONSTANT":
+            index = self.find(tokens, "=", 1)
+            if index is None:
+                self.fail(self.end_column(tokens), Error, "CONSTANT must be written as CONSTANT <identifier> = <value>", "Syntax Error")
+            instructions.append(CONSTANT(Identifier(self.source(tokens[1:index])), self.expression(tokens[index+1:])))
+
+        elif keyword == "INPUT":
+            if len(tokens) < 2:
+                self.fail(self.end_column(tokens), Error, "Input identifier is missing", "Parse Error")
+            instructions.append(INPUT(Identifier(self.source(tokens[1:]))))
+
+        elif keyword == "OUTPUT":
+            instructions.append(OUTPUT([self.expression(part) for part in self.split(tokens[1:], ",")]))
+
+        elif keyword == "IF":
+            self.parse_if(tokens, instructions)
+            return
+
+        elif keyword == "FOR":
+            self.parse_for(tokens, instructions)
+            return
+
+        elif keyword == "WHILE":
+            instruction = WHILE(self.expression(tokens[1:]), Block())
+            instructions.append(instruction)
+            self.trace(instruction)
+            self.parse_body(instruction.statements, WHILE, self.line)
+
+        elif keyword == "REPEAT":
+            instruction = REPEAT(Block(), "")
+            index = len(instructions)
+            instructions.append(instruction)
+            self.trace(instruction)
+            closer = self.parse_body(instruction.statements, REPEAT, self.line)
+            instructions[index] = REPEAT(instruction.statements, self.expression(closer.tokens[1:]))
+
+        elif keyword == "PROCEDURE":
+            identifier, parameters, data_types = self.parse_method(tokens[1:])
+            instruction = PROCEDURE(identifier, parameters, data_types, Block())
+            instructions.append(instruction)
+            self.trace(instruction)
+            self.parse_body(instruction.statements, PROCEDURE, self.line)
+
+        elif keyword == "FUNCTION":
+            if tokens[-1].text not in DATA_TYPES:
+                self.fail(tokens[-1].column, Error, "Invalid data type", "Type Error")
+            if len(tokens) < 3 or tokens[-2].text != "RETURNS":
+                self.fail(tokens[-2].column, Error, "RETURNS is missing", "Syntax Error")
+            identifier, parameters, data_types = self.parse_method(tokens[1:-2])
+            instruction = FUNCTION(identifier, parameters, data_types, tokens[-1].text, Block())
+            instructions.append(instruction)
+            self.trace(instruction)
+            self.parse_body(instruction.statements, FUNCTION, self.line)
+
+        elif keyword == "CALL":
+            instructions.append(self.parse_call(tokens))
+
+        elif keyword == "RETURN":
+            instructions.append(RETURN(self.expression(tokens[1:])))
+
+        else:
+            instructions.append(UNKNOWN(self.line.text))
+            # self.fail(first.column, ParseError, "Unknown Opcode")
+
+        self.trace(instructions[-1])
+
+    def parse_if(self, tokens, instructions):
+        if tokens[-1].text != "THEN":
+            self.fail(self.end_column(tokens), Error, "THEN missing after IF")
+        instruction = IF([self.expression(tokens[1:-1])], [Block()])
+        instructions.append(instruction)
+        self.trace(instruction)
+
+        header = self.line
+        while True:
+            closer = self.parse_body(instruction.statements[-1], IF, header)
+            closer_tokens = closer.tokens
+            if closer_tokens[0].text == "ENDIF":
+                break
+
+            # ELSE or ELSE IF <condition> THEN
+            if len(closer_tokens) == 1:
+                condition = "ELSE"
+            elif closer_tokens[1].text == "IF":
+                if closer_tokens[-1].text != "THEN":
+                    self.fail(self.end_column(closer_tokens), Error, "THEN missing after IF")
+                condition = self.expression(closer_tokens[2:-1])
+            else:
+                self.fail(closer_tokens[1].column, Error, "ELSE can only be followed by IF", "Syntax Error")
+            instruction.conditions.append(condition)
+            instruction.statements.append(Block())
+            header = closer
+            self.trace(instruction)
+
+        self.trace(instruction)
+
+    def parse_for(self, tokens, instructions):
+        # FOR <identifier> <- <start> TO <end> [STEP <step>]
+        to = self.find(tokens, "TO", 3)
+        step = self.find(tokens, "STEP", to + 1) if to is not None else None
+        end = step if step is not None else len(tokens)
+        if len(tokens) < 3 or tokens[2].text != "<-" or to is None or to == 3 or to + 1 == end or step == len(tokens) - 1:
+            self.fail(first_column(tokens), Error, "FOR must be written as FOR <identifier> <- <start> TO <end> [STEP <step>]", "Syntax Error")
+
+        identifier = Identifier(tokens[1].text)
+        lower = self.expression(tokens[3:to])
+        upper = self.expression(tokens[to+1:end])
+        # Without STEP the loop counts up or down depending on its bounds when it starts
+        step = self.expression(tokens[step+1:]) if step is not None else None
+
+        instruction = FOR(identifier, lower, upper, step, Block())
+        instructions.append(instruction)
+        self.trace(instruction)
+
+        closer = self.parse_body(instruction.statements, FOR, self.line)
+        if len(closer.tokens) > 1 and closer.tokens[1].text != identifier:
+            self.fail(closer.tokens[1].column, Error, f"Identifier Mismatch: {identifier} vs {closer.tokens[1].text}")
+        self.trace(instruction)
+
+    def parse_call(self, tokens):
+        # CALL <identifier>, CALL <identifier>() or CALL <identifier>(<argument>, ...)
+        if len(tokens) < 2 or tokens[1].kind != "NAME":
+            self.fail(self.end_column(tokens[:1]), Error, "Invalid CALL Syntax", "Syntax Error")
+        identifier = Identifier(tokens[1].text)
+        if len(tokens) == 2:
+            return CALL(identifier, [])
+        if tokens[2].text != "(" or self.matching(tokens, 2) != len(tokens) - 1:
+            self.fail(tokens[2].column, Error, "Invalid CALL Syntax", "Syntax Error")
+        inside = tokens[3:-1]
+        arguments = [self.expression(part) for part in self.split(inside, ",")] if inside else []
+        return CALL(identifier, arguments)
+
+    def parse_method(self, tokens):
+        # Name()
+        # Name(x1 : INTEGER, y2 : STRING)
+        # Name(x1, y1 : INTEGER), every name takes the type that follows it
+        if len(tokens) < 3 or tokens[0].kind != "NAME" or tokens[1].text != "(" or self.matching(tokens, 1) != len(tokens) - 1:
+            self.fail(first_column(tokens), Error, "Invalid Header", "Syntax Error")
+
+        identifier = Identifier(tokens[0].text)
+        parameters = []
+        data_types = []
+        inside = tokens[2:-1]
+        if not inside:
+            return identifier, parameters, data_types
+
+        untyped = 0
+        for part in self.split(inside, ","):
+            if len(part) == 1 and part[0].kind == "NAME":
+                untyped += 1
+            elif len(part) == 3 and part[0].kind == "NAME" and part[1].text == ":" and part[2].kind == "NAME":
+                untyped += 1
+                data_types += [part[2].text] * untyped
+                untyped = 0
+            else:
+                self.fail(part[0].column if part else tokens[0].column, Error, "Invalid Header", "Syntax Error")
+            parameters.append(Identifier(part[0].text))
+        if untyped:
+            self.fail(tokens[-1].column, Error, "Invalid Header", "Syntax Error")
+
+        return identifier, parameters, data_types
+
+def first_column(tokens):
+    return tokens[0].column if tokens else 1
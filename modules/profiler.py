@@ -0,0 +1,141 @@
+import json
+import time
+
+from .opcodes import FUNCTION
+
+class Profiler:
+    # Replaces the program's execute with a timed one, so runs without -profile pay nothing. The time between
+    # two statements starting or ending is the self time of whatever was running then. A statement that opens
+    # a block returns before the block runs, so the block keeps running in its place until pop_frame leaves it
+    def __init__(self, program):
+        self.program = program
+        self.lines = {}     # line -> [hits, total time, self time]
+        self.stacks = {}    # "MAIN;SQUARE;line 5" -> self time
+        self.paths = []     # ("MAIN;SQUARE", "SQUARE") for every depth of the call stack
+        self.active = {}    # line -> how many times it is running, so recursion is timed once
+        self.running = []   # [line, stack, start, active, is a block] of the statements and blocks running now
+        self.mark = 0.0
+        self.execute = program.execute
+        self.pop_frame = program.pop_frame
+        self.new_call = program.new_call
+        program.execute = self.profile
+        program.pop_frame = self.popped
+        program.new_call = self.called
+
+    def entry(self, line):
+        entry = self.lines.get(line)
+        if entry is None:
+            entry = self.lines[line] = [0, 0.0, 0.0]
+        return entry
+
+    def switch(self):
+        # The time since the last switch belongs to what is running
+        now = time.perf_counter()
+        if self.running:
+            line, stack = self.running[-1][:2]
+            own = now - self.mark
+            self.entry(line)[2] += own
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + own
+        self.mark = now
+        return now
+
+    def called(self, method, scope, line):
+        call = self.new_call(method, scope, line)
+        # The calls from this depth on are new
+        del self.paths[len(self.program.call_stack) - 1:]
+        return call
+
+    def path(self):
+        # The names of the calls running now, built one depth at a time as the stack grows. A method calling
+        # itself is shown once, so deep recursion keeps the stacks short
+        call_stack = self.program.call_stack
+        paths = self.paths
+        while len(paths) < len(call_stack):
+            name = call_stack[len(paths)].method.name
+            if not paths:
+                paths.append((name, name))
+            elif paths[-1][1] == name:
+                paths.append(paths[-1])
+            else:
+                paths.append((f"{paths[-1][0]};{name}", name))
+        return paths[len(call_stack) - 1][0]
+
+    def profile(self, instruction):
+        if not instruction:
+            return self.execute(instruction)
+
+        program = self.program
+        line = program.line
+        depth = program.frames.pointer
+
+        active = self.active.get(line, 0)
+        self.active[line] = active + 1
+        running = [line, f"{self.path()};line {line}", self.switch(), active, False]
+        self.running.append(running)
+        try:
+            self.execute(instruction)
+        finally:
+            end = self.switch()
+            self.running.pop()
+            entry = self.entry(line)
+            entry[0] += 1
+            if program.frames.pointer > depth:
+                # Its block runs next, and its total is taken once the block is left
+                running[4] = True
+                self.running.append(running)
+            else:
+                self.active[line] = active
+                if not active:
+                    entry[1] += end - running[2]
+
+    def popped(self):
+        frame = self.pop_frame()
+        if frame.kind != FUNCTION:
+            # A RETURN can leave blocks while it is still running itself
+            end = self.switch()
+            index = len(self.running) - 1
+            while not self.running[index][4]:
+                index -= 1
+            line, _, start, active, _ = self.running.pop(index)
+            self.active[line] = active
+            if not active:
+                self.lines[line][1] += end - start
+        return frame
+
+    @property
+    def total(self):
+        return sum(own for (_, _, own) in self.lines.values())
+
+    def code(self, line):
+        return self.program.lines[line-1] if 0 < line <= len(self.program.lines) else ""
+
+    def hot_lines(self):
+        # Sorted by total time, which includes the time of the statements inside a block or call
+        return sorted(self.lines.items(), key=lambda item: (-item[1][1], item[0]))
+
+    def report(self, limit = 20):
+        total = self.total or 1.0
+        report = f"\nProfile: {self.total*1000:.2f} ms in {sum(hits for (hits, _, _) in self.lines.values())} statements\n"
+        report += f"{'Line':>6} {'Hits':>10} {'Total ms':>10} {'Self ms':>10} {'%':>6}  Code\n"
+        for line, (hits, elapsed, own) in self.hot_lines()[:limit]:
+            report += f"{line:>6} {hits:>10} {elapsed*1000:>10.2f} {own*1000:>10.2f} {elapsed/total*100:>6.1f}  {self.code(line)}\n"
+        return report
+
+    def write(self, path):
+        # A .folded file holds collapsed stacks in microseconds for flamegraph tools, anything else is JSON
+        if path.endswith(".folded"):
+            with open(path, "w") as file:
+                for stack, own in sorted(self.stacks.items()):
+                    file.write(f"{stack} {round(own * 1000000)}\n")
+            return
+
+        profile = {
+            "total": self.total,
+            "lines": [
+                {"line": line, "code": self.code(line), "hits": hits, "total": elapsed, "self": own}
+                for line, (hits, elapsed, own) in self.hot_lines()
+            ],
+            "stacks": dict(sorted(self.stacks.items())),
+        }
+        with open(path, "w") as file:
+            json.dump(profile, file, indent=2)
@@ -1,111 +1,267 @@
-import re
-
-from termcolor import cprint
+import sys
+import time
+import builtins
 
 from .data_types import *
 from .opcodes import *
 from .classes import *
 from .helpers import *
 from .errors import *
-from .regex import *
+from .expression import *
+from .resolver import *
+from .output import *
+from .inputs import *
+from .trace import Tracer, PrettyPrinter
+from .vm import VirtualMachine
+from .lexer import lex
+from .parser import Parser
+from .optimizer import optimize
+from .memo import pure_functions, memo_key, MISSING
+from .source import SourceLines
+
+# How many instructions run between two checks of the clock and the instruction limit
+CHECK_INTERVAL = 1024
 
 class Program:
-    def __init__(self, lines, dev = False):
+    def __init__(self, lines, dev = False, writer = None, reader = None, cache = None, limits = None, trace = None, optimize = 0, show_passes = None, memo = None):
         self.line = 1
+        self.column = None
         self.lines = lines
         self.dev = dev
+        self.writer = writer if writer is not None else OutputWriter()
+        self.reader = reader if reader is not None else InputReader()
+        self.cache = cache
+        self.limits = limits
+        # The optimizer level, and show_passes(name, instructions) to see the program after every pass
+        self.optimize = optimize
+        self.show_passes = show_passes
+        # A MemoCache for the results of pure FUNCTIONs, whose declarations are in pure
+        self.memo = memo
+        self.pure = set()
+        self.functions = {}
+        self.countdown = -1
         self.block = 0
         self.instructions = None
+        self.scope = None
+        self.spans = None
         self.call_stack = None
-
-    def new_call(self, call : Call):
+        self.frames = None
+
+        # trace is a sink for trace records, dev mode prints them as they come
+        self.tracer = None
+        if trace is None and dev:
+            trace = PrettyPrinter(self.writer)
+        if trace is not None:
+            self.tracer = Tracer(self, trace)
+
+    def new_call(self, method, scope, line):
+        if self.limits is not None and self.limits.depth is not None and len(self.call_stack) > self.limits.depth:
+            self.throw(LimitError, "depth", f"Call depth limit of {self.limits.depth} reached")
+        # The call that returned last at this depth is reused
+        call = self.call_stack.spare
+        call = call.reset(method, scope, line) if call is not None else Call(method, scope, line)
         try:
             self.call_stack.push(call)
         except AssertionError:
             self.throw(Error, "Call stack has reached maximum capacity", "Stack Overflow Error")
+        return call
+
+    def define(self, identifier, properties):
+        self.var[identifier.slot] = properties
 
     @property
     def var(self):
         return self.call_stack.top.values
 
     def run(self, dev: None = None):
-        if self.instructions is None:
-            self.instructions = self.parse()
+        if dev is not None:
+            self.dev = dev
+
+        self.start()
 
+        try:
+            with python_frames(self.call_stack.limit):
+                numbered = self.instructions.numbered
+                frames = self.frames
+                while self.block < len(self.instructions):
+                    self.line = numbered[self.block][0]
+                    self.execute(self.instructions[self.block])
+                    if frames.pointer >= 0:
+                        self.run_blocks(0)
+                    self.block += 1
+        finally:
+            self.writer.flush()
+
+    def run_stream(self):
+        # Parses and runs one top-level instruction at a time, so the program starts before the rest
+        # of it is read, and instructions that have run are not kept. The lines can also come from a generator
+        # or an open file, which can only be read once, so the lines read from them are kept for error messages
+        if not hasattr(self.lines, "__getitem__"):
+            self.lines = SourceLines(self.lines)
+        resolver = Resolver()
+        self.scope = resolver.global_scope = Scope()
+        self.instructions = []
+        self.spans = {}
+        self.start()
+
+        main = self.call_stack[0]
+        try:
+            with python_frames(self.call_stack.limit):
+                for line, instruction in Parser(self).stream(lex(self.lines)):
+                    resolver.resolve_next(instruction)
+                    if len(main.values) < len(self.scope):
+                        main.values.extend([None] * (len(self.scope) - len(main.values)))
+                    measure_spans((instruction,), self.spans, line)
+                    self.line = line
+                    self.execute(instruction)
+                    if self.frames.pointer >= 0:
+                        self.run_blocks(0)
+                    self.block += 1
+        finally:
+            self.writer.flush()
+
+    async def run_async(self, every = 1000, reader = None, dev = None):
+        # Runs on the bytecode VM, whose flat loop can stop and resume between instructions
         if dev is not None:
             self.dev = dev
+        await VirtualMachine(self).run_async(every, reader)
 
-        self.call_stack = Stack(256)
-        self.new_call(Call(Procedure("MAIN", self.instructions, 1), {}, 1))
+    def start(self):
+        if self.instructions is None:
+            self.instructions = self.parse()
+        if self.scope is None:
+            self.resolve()
+
+        if self.dev:
+            # Show the developer trace as it happens
+            self.writer.policy = "unbuffered"
+            if self.tracer is None:
+                self.tracer = Tracer(self, PrettyPrinter(self.writer))
+
+        # Both stacks grow as they are used, MAIN and CALL_DEPTH calls fit on the call stack
+        size = CALL_DEPTH + 1
+        if self.limits is not None and self.limits.depth is not None:
+            size = max(size, self.limits.depth + 2)
+        self.call_stack = Stack(size)
+        # Blocks can only nest as deep as the calls they are in, which the call stack limits
+        self.frames = Stack(sys.maxsize)
+        self.new_call(Procedure("MAIN", self.instructions, 1), self.scope, 1)
+
+        self.functions = {}
+        self.pure = set()
+        if self.memo is not None:
+            self.memo.bind(self.instructions)
+            self.pure = pure_functions(self.instructions)
 
         self.line = 1
         self.block = 0
 
-        while self.block < len(self.instructions):
-            self.execute(self.instructions[self.block])
-            self.line += 1
-            self.block += 1
-
-    def count_lines(self, instruction):
-        instruction_type = type(instruction)
-
-        if hasattr(instruction, "statements"):
-            lines = 2
-            if instruction_type == IF:
-                lines += len(instruction.conditions)-1
-                for statement in instruction.statements:
-                    for statement2 in statement:
-                        lines += self.count_lines(statement2)
-            else:
-                for statement in instruction.statements:
-                    lines += self.count_lines(statement)
-            return lines
-        else:
-            return 1
+        # A countdown of -1 never reaches 0, so unlimited runs never call tick
+        self.executed = 0
+        self.started = time.perf_counter()
+        self.interval = -1
+        if self.limits is not None and (self.limits.instructions is not None or self.limits.time is not None):
+            self.interval = CHECK_INTERVAL
+            if self.limits.instructions is not None:
+                self.interval = max(1, min(CHECK_INTERVAL, self.limits.instructions))
+        self.countdown = self.interval
+
+    def tick(self):
+        # Called once the countdown runs out, so the clock is read only every CHECK_INTERVAL instructions
+        limits = self.limits
+        self.executed += self.interval
+        if limits.instructions is not None and self.executed >= limits.instructions:
+            self.throw(LimitError, "instructions", f"Instruction limit of {limits.instructions} reached")
+        if limits.time is not None and time.perf_counter() - self.started > limits.time:
+            self.throw(LimitError, "time", f"Time limit of {limits.time} seconds reached")
+        self.interval = CHECK_INTERVAL
+        if limits.instructions is not None:
+            self.interval = min(CHECK_INTERVAL, limits.instructions - self.executed)
+        return self.interval
+
+    def span(self, instruction):
+        return self.spans[id(instruction)]
+
+    def resolve(self):
+        self.scope = Resolver().resolve(self.instructions)
+        return self.scope
+
+    def frame_values(self, call):
+        return dict((key, call.values[slot].data) for (key, slot) in call.scope.names.items() if call.values[slot] is not None)
 
     def global_values(self):
-        return dict(((key, self.call_stack[0].values[key].data) for key in self.call_stack[0].values))
+        return self.frame_values(self.call_stack[0])
 
     def local_values(self):
-        return dict(((key, self.var[key].data) for key in self.var))
+        return self.frame_values(self.call_stack.top)
     
     def scope_values(self):
         values = {}
         for i in range(self.call_stack.pointer+1):
-            values = values | dict(((key, self.call_stack[i].values[key].data) for key in self.call_stack[i].values))
+            values = values | self.frame_values(self.call_stack[i])
         return values
+
+    def lookup(self, identifier):
+        # Only names some method declares can come from a caller, the others are globals or builtins
+        dynamic = self.scope.dynamic
+        top = self.call_stack.pointer if dynamic is None or identifier in dynamic else 0
+        for i in range(top, -1, -1):
+            call = self.call_stack[i]
+            slot = call.scope.names.get(identifier)
+            if slot is not None and call.values[slot] is not None:
+                return call.values[slot].data
+        if hasattr(builtins, identifier):
+            return getattr(builtins, identifier)
+        raise NameError(f"name '{identifier}' is not defined")
     
     def evaluate(self, expression : str):
-        if type(expression) in PYTHON_TO_PSEUDO:
+        # Plain strings are source code, every other Python value is already evaluated
+        if type(expression) != str and type(expression) in PYTHON_TO_PSEUDO:
             return expression
-        literal = convert_literal_to_python(expression)
-        if literal is not None:
-            return literal
+        expression = compile_expression(expression)
+        if expression.literal is not None:
+            return expression.literal
+        if expression.function is None:
+            self.writer.cprint(f"{expression.error.__class__.__name__}: {expression.error}", "red")
+            return None
 
-        global_ = self.global_values()
-        scope = self.scope_values()
-        
         try:
-            return eval(expression, global_, scope)
-        except NameError as e:
-            identifier = str(e).split("'")[1]
-            self.throw(Error, f"Invalid identifier '{identifier}'", "Name Error")
+            return expression.function(self.call_stack[0].values, self.var, self)
         except Exception as e:
-            cprint(f"{e.__class__.__name__}: {e}", "red")
-        
+            return self.failed(e)
+
+    def failed(self, error):
+        # What an expression that raised error evaluates to, the virtual machine shares it
+        if isinstance(error, PseudoLangError):
+            # From a FUNCTION the expression called
+            raise error
+        if isinstance(error, NameError):
+            identifier = str(error).split("'")[1]
+            self.throw(Error, f"Invalid identifier '{identifier}'", "Name Error")
+        if isinstance(error, RecursionError):
+            # FUNCTIONs nested deeper than Python's stack allows, see python_frames
+            self.throw(Error, "Call stack has reached maximum capacity", "Stack Overflow Error")
+        self.writer.cprint(f"{error.__class__.__name__}: {error}", "red")
+        return None
+
         # if expression in var:
         #     value = var[expression].data
         #     noerrorif(value is not None, "Value Not Initialized")
         #     return value
         
     def get_properties(self, identifier):
-        if identifier in self.var:
-            return self.var[identifier]
-        elif identifier in self.call_stack[0].values:
-            return self.call_stack[0].values[identifier]
+        if identifier.slot is None:
+            # A global declared after the procedure using it, when the program was parsed as a stream
+            slot = self.scope.names.get(identifier)
+            if slot is None:
+                return None
+            return self.call_stack[0].values[slot]
+        if identifier.depth == LOCAL:
+            return self.var[identifier.slot]
+        return self.call_stack[0].values[identifier.slot]
 
     def identifier_present(self, identifier):
-        return identifier in self.var or identifier in self.call_stack[0].values
+        return self.get_properties(identifier) is not None
 
     def assign(self, identifier, expression : str):
 
@@ -120,10 +276,12 @@ class Program:
         if type(properties) == Constant:
             self.throw(Error, f"Value cannot be reassigned to constant '{identifier}'")
 
-        value = self.evaluate(expression)
+        self.store(properties, self.evaluate(expression), expression)
 
+    def store(self, properties, value, expression):
+        # The end of assign, for a value that has been evaluated already
         if value is None:
-            self.throw(Error, "Invalid Expression, " + expression)
+            self.throw(Error, f"Invalid Expression, {expression}")
 
         value_data_type = PYTHON_TO_PSEUDO[type(value)]
         data_type = properties.type
@@ -133,362 +291,102 @@ class Program:
         
         properties.data = value
 
-        if self.dev:
-            cprint(f"{identifier} has been assigned value {value}", "blue")
-
     def declare_variables(self, identifiers, data_type):
         if data_type not in DATA_TYPES:
             self.throw(Error, "Invalid Data Type", "Type Error")
         for identifier in identifiers:
             if identifier in KEYWORDS:
                 self.throw(Error, f"{identifier} is a keyword", "Name Error")
-            if identifier in self.var:
+            if self.var[identifier.slot] is not None:
                 self.throw(ReDeclarationError, identifier)
             if not valid_identifier(identifier):
                 self.throw(Error, "Invalid Identifier", "Name Error")
                 
-            self.var[identifier] = Variable(identifier, data_type)
-
-        if self.dev:
-            if len(identifiers) == 0:
-                return
-            if len(identifiers) == 1:
-                cprint(f"Declared variable '{identifiers[0]}' with type {data_type}", "blue")
-            else:
-                cprint(f"Declared variables {identifiers.__repr__()[1:-1]} with type {data_type}", "blue")
+            self.define(identifier, Variable(identifier, data_type))
 
     def declare_constant(self, identifier, expression):
         value = self.evaluate(expression)
         if value is None:
             self.throw(Error, "Invalid Expression")
-        if identifier in self.var:
+        if self.var[identifier.slot] is not None:
             self.throw(ReDeclarationError, identifier)
         if identifier in KEYWORDS:
             self.throw(Error, f"{identifier} is a keyword", "Name Error")
         if not valid_identifier(identifier):
             self.throw(Error, "Invalid Identifier", "Name Error")
         data_type = PYTHON_TO_PSEUDO[type(value)]
-        self.var[identifier] = Constant(identifier, data_type, value)
-
-        if self.dev:
-            cprint(f"Declared constant '{identifier}' with type {data_type} and value {value}", "blue")
+        self.define(identifier, Constant(identifier, data_type, value))
 
     def declare_method(self, instruction):
         identifier = instruction.identifier
         parameters = instruction.parameters
         statements = instruction.statements
 
-        if self.dev:
-            for index in range(self.count_lines(instruction)-1):
-                cprint(self.lines[self.line + index], "magenta")
+        start, end = self.span(instruction)
 
-        if identifier in self.var:
+        if self.var[identifier.slot] is not None:
             self.throw(Error, f"Identifier '{identifier}' is already used", "Name Error")
 
         if hasattr(instruction, "return_type"):
             return_type = instruction.return_type
-            self.var[identifier] = Function(identifier, instruction, self.line, return_type)
+            function = Function(identifier, instruction, start, return_type)
+            self.define(identifier, function)
+            # Expressions hold the declaration, invoke finds the Function for its call from it
+            self.functions[id(instruction)] = function
         else:
-            self.var[identifier] = Procedure(identifier, instruction, self.line)
-
-        # self.line += len(instruction.statements) + 1 # +1 for ENDPROCEDURE
-        self.line += self.count_lines(instruction)-1
-        
-        if self.dev:
-            cprint(f"Procedure '{identifier}' has been created", "blue")
-
-    def parse_method(self, string):
-        # Name()
-        # Name(x1 : INTEGER)
-        # Name(x1 : INTEGER, y2 : STRING)
-        match1 = re.match(METHOD_DECLARATION_1, string)
-
-        # Name(x1, y1 : INTEGER)
-        # Name(x1, y1, z1 : INTEGER)
-        match2 = re.match(METHOD_DECLARATION_2, string)
-
-        if match1 is None and match2 is None:
-            self.throw(Error, "Invalid Header", "Syntax Error")
-
-        if match1:
-            string = match1.group(2)
-            parameters = []
-            data_types = []
-            declarations = []
-
-            if string is not None:
-                pairs = string.split(",")
-
-                for pair in pairs:
-                    pair_split = pair.split(":")
-                    identifier = pair_split[0].strip()
-                    data_type = pair_split[1].strip()
-                    parameters.append(identifier)
-                    data_types.append(data_type)
-                    declarations.append(DECLARE((identifier,), data_type))
-                
-            identifier = match1.group(1).strip()
-
-        elif match2:
-
-            parameters = [var.strip() for var in match2.group(2).split(",")]
-
-            data_types = [match2.group(3).strip() for _ in range(len(parameters))]
-
-            identifier = match2.group(1).strip()
-            declarations = (DECLARE(parameters, data_type),)
-        
-        return identifier, parameters, data_types
+            self.define(identifier, Procedure(identifier, instruction, start))
 
+        self.line = end
 
     def parse(self):
 
-        self.line = 1
-
-        stack = Stack(256)
-        stack.push([])
-
-        stack2 = Stack(256)
-
-        for file_line in self.lines:
-            instructions = stack.top
-            parts = file_line.split()
-
-            # Blank Line
-            if not parts:
-                self.line += 1
-                instructions.append(tuple())
-                continue
-
-            if len(parts) > 1 and parts[1] == "<-":
-                opcode = "ASSIGNMENT"
-            else:
-                opcode = parts[0]
-
-            if opcode == "DECLARE":
-                value = " ".join(parts[1:])
-                value_split = [i.strip() for i in value.split(":")]
-                if len(value_split) != 2:
-                    self.throw(Error, "Invalid Syntax: Must Use One Colon")
-
-                identifiers = tuple(i.strip() for i in value_split[0].split(","))
-                data_type = value_split[1]
-
-                instructions.append(DECLARE(identifiers, data_type))
-
-            elif opcode == "CONSTANT":
-                value_split = " ".join(parts[1:]).split("=")
-                identifier = value_split[0].strip()
-                value = value_split[1].strip()
-                instructions.append(CONSTANT(identifier, value))
-
-            elif opcode.startswith("//"):
-                value = " ".join(parts[1:])
-                instructions.append(COMMENT(value))
-
-            elif opcode == "ASSIGNMENT":
-                identifier = parts[0]
-                value = " ".join(parts[2:])
-                instructions.append(ASSIGNMENT(identifier, value))
-
-            elif opcode == "INPUT":
-                if len(parts) < 2:
-                    self.throw(Error, "Input identifier is missing", "Parse Error")
-                identifier = parts[1]
-                instructions.append(INPUT(identifier))
-
-            elif opcode == "OUTPUT":
-                values = " ".join(parts[1:]).split(",")
-                values = [i.strip() for i in values]
-                instructions.append(OUTPUT(values))
-
-            elif opcode == "IF":
-                if parts[-1] != "THEN":
-                    self.throw(Error, "THEN missing after IF")
-                condition = " ".join(parts[1:-1])
-                instructions.append(IF([condition], [[]]))
-                stack.push(instructions[-1][-1][-1])
-                stack2.push((self.line, instructions[-1]))
-
-            elif opcode == "ELSE":
-                if not(len(parts) == 1 or parts[1] == "IF"):
-                    self.throw()
-                stack.pop()
-                instructions = stack.top
-                if len(parts) > 1 and parts[1] == "IF":
-                    if parts[-1] != "THEN":
-                        self.throw(Error, "THEN missing after IF")
-                    condition = " ".join(parts[2:-1])
-                else:
-                    condition = "ELSE"
-                instructions[-1][0].append(condition)
-                instructions[-1][1].append([])
-                stack.push(instructions[-1][-1][-1])
-                stack2.push((self.line, instructions[-1]))
-
-            elif opcode == "ENDIF":
-                stack.pop()
-                stack2.pop()
-
-                instructions = stack.top
-
-                if instructions is None or type(instructions[-1]) != IF:
-                    self.throw(Error, "ENDIF must be used after IF")
-
-            elif opcode == "FOR":
-                if parts[2] != "<-":
-                    self.throw()
-                if parts[4] != "TO":
-                    self.throw()
-                if not(len(parts) == 6 or parts[6] == "STEP"):
-                    self.throw()
-
-                identifier = parts[1]
-                lower = parts[3]
-                upper = parts[5]
-                step = parts[7] if len(parts) > 6 else "1" if upper >= lower else "-1"
-
-                instructions.append(FOR(identifier, lower, upper, step, []))
-                stack.push(instructions[-1][-1])
-                stack2.push((self.line, instructions[-1]))
-
-            elif opcode == "NEXT":
-                identifier = parts[1]
-
-                stack.pop()
-                stack2.pop()
-
-                instructions = stack.top
-
-                if instructions is None or type(instructions[-1]) != FOR:
-                    self.throw(Error, "NEXT Must Be Used After FOR")
-                if instructions[-1].identifier != identifier:
-                    self.throw(Error, f"Identifier Mismatch: {instructions[-1].identifier} vs {identifier}")
-
-            elif opcode == "WHILE":
-                condition = " ".join(parts[1:])
-                instructions.append(WHILE(condition, []))
-                stack.push(instructions[-1][-1])
-                stack2.push((self.line, instructions[-1]))
-
-            elif opcode == "ENDWHILE":
-                stack.pop()
-                stack2.pop()
-
-                instructions = stack.top
-
-                if instructions is None or type(instructions[-1]) != WHILE:
-                    self.throw(Error, "ENDWHILE must be used after WHILE")
-
-            elif opcode == "REPEAT":
-                instructions.append(REPEAT([], ""))
-                stack.push(instructions[-1].statements)
-                stack2.push((self.line, instructions[-1]))
-
-            elif opcode == "UNTIL":
-                stack.pop()
-                stack2.pop()
-
-                instructions = stack.top
-
-                if instructions is None or type(instructions[-1]) != REPEAT:
-                    self.throw(Error, "UNTIL must be used after REPEAT")
-
-                condition = " ".join(parts[1:])
-                instructions[-1] = REPEAT(instructions[-1][0], condition)
-
-            elif opcode == "PROCEDURE":
-                string = " ".join(parts[1:])
-                identifier, parameters, data_types = self.parse_method(string)
-                instructions.append(PROCEDURE(identifier, parameters, data_types, []))
-                stack.push(instructions[-1].statements)
-                stack2.push((self.line, instructions[-1]))
-
-            elif opcode == "ENDPROCEDURE":
-                stack.pop()
-                stack2.pop()
-
-                instructions = stack.top
-
-                if instructions is None or type(instructions[-1]) != PROCEDURE:
-                    self.throw(Error, "ENDPROCEDURE cannot be used without PROCEDURE")
-
-            elif opcode == "CALL":
-                string = " ".join(parts[1:])
-                regex1 = r"^(\w+)\s*\(((?:[^,]+,)*(?:[^,]+)?)\)$"
-                
-                match1 = re.match(regex1, string)
-
-                if match1 is not None:
-                    identifier = match1.group(1).strip()
-                    arguments = [a.strip() for a in match1.group(2).split(",")]
-                    instructions.append(CALL(identifier, arguments))
-                else:
-                    self.throw(Error, "Invalid CALL Syntax", "Syntax Error")
-                
-            elif opcode == "FUNCTION":
-                return_type = parts[-1]
-
-                if return_type not in DATA_TYPES:
-                    self.throw(Error, "Invalid data type", "Type Error")
-                if parts[-2] != "RETURNS":
-                    self.throw(Error, "RETURNS is missing", "Syntax Error")
-
-                string = " ".join(parts[1:-2])
-                identifier, parameters, data_types = self.parse_method(string)
-                instructions.append(FUNCTION(identifier, parameters, data_types, return_type, []))
-                stack.push(instructions[-1].statements)
-                stack2.push((self.line, instructions[-1]))
-
-                print(string)
-            
-            elif opcode == "ENDFUNCTION":
-                stack.pop()
-                stack2.pop()
+        # Traced runs record the instructions while parsing, so they always parse, as do runs showing the passes
+        cached = self.cache is not None and self.tracer is None and self.show_passes is None
+        variant = f"O{self.optimize}" if self.optimize else ""
+        if cached:
+            entry = self.cache.load(self.lines, variant)
+            if entry is not None:
+                self.instructions, self.scope = entry
+                self.spans = {}
+                measure_spans(self.instructions, self.spans)
+                return self.instructions
 
-                instructions = stack.top
-
-                if instructions is None or type(instructions[-1]) != FUNCTION:
-                    self.throw(Error, "ENDFUNCTION cannot be used without FUNCTION", "Block Error")
+        self.line = 1
+        self.column = None
+        self.scope = None
 
-            elif opcode == "RETURN":
-                expression = " ".join(parts[1:])
-                instructions.append(RETURN(expression))
+        instructions = Parser(self).parse(lex(self.lines))
 
-            else:
-                instructions.append(UNKNOWN(file_line))
-                # self.throw(ParseError, "Unknown Opcode")
+        self.spans = {}
+        measure_spans(instructions, self.spans)
 
-            self.line += 1
+        if self.optimize:
+            # Before resolving, so the slots and compiled expressions are those of the optimized program
+            instructions = optimize(instructions, self.optimize, self.show_passes)
+            self.spans = {}
+            measure_spans(instructions, self.spans)
 
-            if self.dev:
-                cprint(instructions[-1], "green")
+        self.instructions = instructions
 
-        if len(stack) > 1:
-            self.line = stack2.top[0]
-            instruction = stack2.top[1]
-            self.throw(ParseError, f"{instruction.__class__.__name__} block was not closed")
+        if cached:
+            self.resolve()
+            self.cache.store(self.lines, (self.instructions, self.scope), variant)
 
-        self.instructions = stack.top
-        return stack.top
+        return instructions
     
     def execute(self, instruction):
-
-        if self.dev:
-            print()
-            cprint(f"Block {self.block+1} • Line {self.line}", "yellow")
-            if len(self.call_stack) > 1:
-                cprint(tuple(i.method.name for i in self.call_stack), "yellow")
-            if self.lines[self.line-1]:
-                cprint(self.lines[self.line-1], "magenta")
-            if instruction:
-                cprint(instruction, "green")
-
         # Blank Line
         if not instruction:
             return
 
         instruction_type = type(instruction)
+        # Comments and lines that are not statements do not count as instructions, the VM has no code for them
+        if instruction_type == COMMENT or instruction_type == UNKNOWN:
+            return
+
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.countdown = self.tick()
 
         if instruction_type == DECLARE:
             identifiers = instruction.identifiers
@@ -507,195 +405,372 @@ class Program:
             self.assign(identifier, value)
 
         elif instruction_type == INPUT:
-            identifier = instruction.identifier
-            if identifier not in self.var:
-                self.throw(NoDeclarationError, identifier)
-            python_type = PSEUDO_TO_PYTHON[self.var[identifier].type]
-
-            value = None
-            while value is None:
-                try:
-                    value = python_type(input())
-                except:
-                    value = None
-
-            variable = self.var[identifier]
-            variable.data = value
+            self.read_input(instruction.identifier)
 
         elif instruction_type == OUTPUT:
-            expressions = instruction[0]
-            for expression in expressions:
-                if expression:
-                    result = self.evaluate(expression)
-                    if result is None:
-                        self.throw(Error, f"Cannot evaluate the expression, {expression}")
-                    print(result, end="")
-                else:
-                    self.throw(Error, "Output expression is missing")
-            print()
+            self.output(instruction.exp)
 
+        # Blocks are opened here and run by run_blocks once the statement that opened them returns,
+        # flat blocks run here and now
         elif instruction_type == IF:
-            index = 0
-            net_result = False
-            while index < len(instruction.conditions):
-                condition = instruction.conditions[index]
-                if condition == "ELSE":
-                    result = True
-                else:
-                    result = self.evaluate(condition)
-                    if result is None:
-                        self.throw(Error, "Invalid Condition")
-                
-                result = (not net_result) and (result == TRUE)
-                statements = instruction.statements[index]
-                if len(statements) == 0:
-                    self.throw(Error, "No Statements Inside Block")
-                for statement in statements:
-                    if self.call_stack.top.exit:
-                        self.call_stack.top.exit = False
-                        break
-                    self.line += 1
-                    if result == TRUE:
-                        self.execute(statement)
-                net_result = net_result or (result == TRUE)
-                index += 1
-                self.line += 1
+            line = self.line
+            index = self.branch(instruction, 0, False)
+            if index is None:
+                self.line = self.span(instruction)[1]
+            elif instruction.statements[index].flat:
+                self.run_statements(instruction.statements[index].numbered)
+                self.branch(instruction, index + 1, True)
+                self.line = self.span(instruction)[1]
+            else:
+                self.open(IF, instruction, instruction.statements[index], line, index)
 
         elif instruction_type == FOR:
-            identifier = instruction.identifier
-            lower = self.evaluate(instruction.lower)
-            upper = self.evaluate(instruction.upper)
-            step = self.evaluate(instruction.step)
-            statements = instruction.statements
-
-            if lower is None:
-                self.throw(Error, "Invalid lower bound")
-            if upper is None:
-                self.throw(Error, "Invalid upper bound")
-            if step is None:
-                self.throw(Error, "Invalid step")
-
-            if upper >= lower:
-                upper += 1
+            indexes = iter(self.for_range(instruction))
+            self.count_pass()
+            index = next(indexes, None)
+            if index is not None:
+                frame = self.open(FOR, instruction, instruction.statements, self.line, indexes)
+                self.set_index(frame, index)
+                if instruction.statements.flat:
+                    self.run_loop(frame)
             else:
-                upper -= 1
-
-            for index in range(lower, upper, step):
-                self.assign(identifier, str(index))
-                self.execute_statements(statements)
-            self.line += self.count_lines(instruction)-1
+                self.line = self.span(instruction)[1]
 
         elif instruction_type == WHILE:
-            condition = instruction.condition
-            statements = instruction.statements
+            result = self.evaluate(instruction.condition)
+            if result is True or result is TRUE:
+                frame = self.open(WHILE, instruction, instruction.statements, self.line)
+                if instruction.statements.flat:
+                    self.run_loop(frame)
+            else:
+                self.line = self.span(instruction)[1]
 
-            result = self.evaluate(condition)
+        elif instruction_type == REPEAT:
+            frame = self.open(REPEAT, instruction, instruction.statements, self.line)
+            if instruction.statements.flat:
+                self.run_loop(frame)
 
-            line_old = self.line
-            while result == TRUE:
-                self.execute_statements(statements)
-                result = self.evaluate(condition)
-                if result is None:
-                    self.throw(Error, "Condition could not be evaluated")
-            self.line += self.count_lines(instruction)-1
+        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            self.declare_method(instruction)
 
-        elif instruction_type == REPEAT:
-            condition = instruction.condition
-            statements = instruction.statements
+        elif instruction_type == CALL:
+            line = self.line
+            procedure = self.enter_call(instruction.identifier, instruction.arguments)
+            statements = procedure.statements.statements
+            if statements.flat:
+                self.run_statements(statements.numbered)
+                self.call_stack.pop()
+                self.line = line
+            else:
+                self.open(CALL, procedure.statements, statements, line, push = True)
+        
+        elif instruction_type == RETURN:
+            self.leave(instruction.expression)
+            # The blocks the RETURN is in are left along with the call
+            frame = self.pop_frame()
+            while frame.kind != CALL and frame.kind != FUNCTION:
+                frame = self.pop_frame()
+            self.call_stack.pop()
 
-            result = FALSE
+    def open(self, kind, instruction, block, line, state = None, push = False):
+        # Starts a block in a frame, pushed in place of one that was left unless the block is flat.
+        # A flat loop goes round in run_loop, so its frame is only ever used there
+        frames = self.frames
+        push = push or not block.flat
+        frame = frames.spare if push else None
+        if frame is None:
+            frame = Frame()
+        frame.kind = kind
+        frame.instruction = instruction
+        frame.numbered = block.numbered
+        frame.index = 0
+        frame.line = line
+        frame.state = state
+        frame.variable = None
+        if push:
+            frames.push(frame)
+        return frame
+
+    def pop_frame(self):
+        return self.frames.pop()
+
+    def run_statements(self, numbered):
+        # A flat block opens no blocks and cannot RETURN, so it runs straight through
+        execute = self.execute
+        for line, statement in numbered:
+            self.line = line
+            execute(statement)
+
+    def run_loop(self, frame):
+        numbered = frame.numbered
+        execute = self.execute
+        while True:
+            for line, statement in numbered:
+                self.line = line
+                execute(statement)
+            if not self.close(frame):
+                return
 
-            while result == FALSE:
-                self.execute_statements(statements)
+    def run_blocks(self, depth):
+        # Runs the statements of the open blocks until only depth of them are left. A statement that opens
+        # a block returns straight away, so CALLs and loops never nest Python calls however deep they go
+        frames = self.frames
+        items = frames.items
+        execute = self.execute
+        while frames.pointer >= depth:
+            pointer = frames.pointer
+            frame = items[pointer]
+            numbered = frame.numbered
+            index = frame.index
+            while index < len(numbered):
+                self.line, statement = numbered[index]
+                index += 1
+                execute(statement)
+                if frames.pointer != pointer:
+                    # A block was opened, or a RETURN left this one
+                    frame.index = index
+                    break
+            else:
+                if not self.close(frame):
+                    self.pop_frame()
+
+    def close(self, frame):
+        # A block ran its last statement. Gives True when a loop runs it again, otherwise the block is left
+        kind = frame.kind
+        instruction = frame.instruction
+
+        if kind == IF:
+            self.branch(instruction, frame.state + 1, True)
+
+        elif kind == FOR:
+            self.line = frame.line
+            self.count_pass()
+            index = next(frame.state, None)
+            if index is not None:
+                self.set_index(frame, index)
+                frame.index = 0
+                return True
+
+        elif kind == WHILE:
+            self.line = frame.line
+            self.count_pass()
+            result = self.evaluate(instruction.condition)
+            if result is None:
+                self.throw(Error, "Condition could not be evaluated")
+            if result is True or result is TRUE:
+                frame.index = 0
+                return True
+
+        elif kind == REPEAT:
+            start, end = self.span(instruction)
+            self.line = end
+            self.count_pass()
+            result = self.evaluate(instruction.condition)
+            if result is None:
+                self.throw(Error, "Condition could not be evaluated")
+            self.line = start
+            if result is False or result is FALSE:
+                frame.index = 0
+                return True
+
+        elif kind == CALL:
+            self.call_stack.pop()
+            self.line = frame.line
+            return False
+
+        elif kind == FUNCTION:
+            self.line = self.span(instruction)[1]
+            self.throw(Error, f"FUNCTION '{instruction.identifier}' ended without RETURN")
+
+        self.line = self.span(instruction)[1]
+        return False
+
+    def branch(self, instruction, index, taken):
+        # Evaluates the conditions of an IF from index on and gives the first branch to run. Every condition
+        # is evaluated, even after a branch was taken
+        conditions = instruction.conditions
+        while index < len(conditions):
+            condition = conditions[index]
+            statements = instruction.statements[index]
+            self.line = self.span(statements)[0]
+            if condition == "ELSE":
+                result = True
+            else:
                 result = self.evaluate(condition)
-                line_old = self.line
-                self.line += self.count_lines(instruction)-1
                 if result is None:
-                    self.throw(Error, "Condition could not be evaluated")
-                self.line = line_old
-            self.line += self.count_lines(instruction)-1
+                    self.throw(Error, "Invalid Condition")
+            if len(statements) == 0:
+                self.throw(Error, "No Statements Inside Block")
+            if not taken and (result is True or result is TRUE):
+                return index
+            index += 1
+        return None
+
+    def set_index(self, frame, index):
+        # The next pass of a FOR: the first assignment checks the loop variable, the rest store the int directly
+        variable = frame.variable
+        if variable is None:
+            identifier = frame.instruction.identifier
+            self.assign(identifier, index)
+            if self.tracer is None:
+                frame.variable = self.get_properties(identifier)
+        else:
+            variable.data = index
+
+    def count_pass(self):
+        # Every check of whether a loop goes round again counts as an instruction, so empty loops are limited too.
+        # They are counted where the VM's loop instructions are, so both stop at the same line
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.countdown = self.tick()
+
+    def input_target(self, identifier):
+        variable = self.get_properties(identifier)
+        if variable is None:
+            self.throw(NoDeclarationError, identifier)
+        return variable
 
-        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
-            self.declare_method(instruction)
+    def read_input(self, identifier):
+        variable = self.input_target(identifier)
 
-        elif instruction_type == CALL:
-            identifier = instruction.identifier
-            arguments = instruction.arguments
+        self.writer.flush()
+        try:
+            variable.data = self.reader.read(variable.type)
+        except EOFError:
+            self.throw(Error, f"No input left for '{identifier}'", "Input Error")
+
+    def output(self, expressions):
+        write = self.writer.write
+        for expression in expressions:
+            if expression:
+                result = self.evaluate(expression)
+                if result is None:
+                    self.throw(Error, f"Cannot evaluate the expression, {expression}")
+                write(str(result))
+            else:
+                self.throw(Error, "Output expression is missing")
+        write("\n")
+
+        if self.limits is not None and self.limits.output is not None and self.writer.written > self.limits.output:
+            self.throw(LimitError, "output", f"Output limit of {self.limits.output} characters reached")
+
+    def for_range(self, instruction):
+        lower = self.evaluate(instruction.lower)
+        upper = self.evaluate(instruction.upper)
+        step = self.evaluate(instruction.step) if instruction.step is not None else None
+
+        if lower is None:
+            self.throw(Error, "Invalid lower bound")
+        if upper is None:
+            self.throw(Error, "Invalid upper bound")
+        if step is None:
+            if instruction.step is not None:
+                self.throw(Error, "Invalid step")
+            # Without STEP the loop counts towards its upper bound
+            if type(lower) == int and type(upper) == int:
+                step = 1 if upper >= lower else -1
 
-            if not self.identifier_present(identifier):
-                self.throw(Error, f"Unknown identifier '{identifier}'")
+        if type(lower) != int or type(upper) != int or type(step) != int:
+            self.throw(Error, "FOR bounds and step must be INTEGER", "Type Error")
+        if step == 0:
+            self.throw(Error, "FOR step cannot be zero")
 
-            procedure = self.get_properties(identifier)
+        if upper >= lower:
+            upper += 1
+        else:
+            upper -= 1
 
-            if type(procedure) != Procedure:
-                self.throw(Error, f"CALL cannot be used with {PYTHON_TO_PSEUDO[procedure.data.__class__]} '{identifier}'", "Syntax Error")
+        return range(lower, upper, step)
 
-            instruction = procedure.statements
+    def enter_call(self, identifier, arguments):
+        if not self.identifier_present(identifier):
+            self.throw(Error, f"Unknown identifier '{identifier}'")
 
-            parameters = instruction.parameters
-            data_types = instruction.data_types
+        procedure = self.get_properties(identifier)
 
-            statements = instruction.statements
+        if type(procedure) != Procedure:
+            self.throw(Error, f"CALL cannot be used with {PYTHON_TO_PSEUDO[procedure.data.__class__]} '{identifier}'", "Syntax Error")
 
-            if len(parameters) != len(arguments):
-                self.throw(Error, "Number of arguments must match number of parameters", "Temp Error")
+        if len(procedure.statements.parameters) != len(arguments):
+            self.throw(Error, "Number of arguments must match number of parameters", "Temp Error")
 
-            call = Call(procedure, {}, self.line)
-            self.new_call(call)
+        self.enter(procedure, [self.evaluate(argument) for argument in arguments])
+        return procedure
 
-            for index in range(len(parameters)):
-                self.declare_variables((parameters[index],), data_types[index])
-                self.call_stack.pop()
-                value = self.evaluate(arguments[index])
-                self.new_call(call)
-                self.assign(parameters[index], value)
-
-            if self.dev:
-                cprint(f"Global: {dict((k,v) for (k,v) in self.global_values().items() if type(v) != PROCEDURE)}", "blue")
-                cprint(f"Local: {dict((k,v) for (k,v) in self.local_values().items() if type(v) != PROCEDURE)}", "blue")
-                cprint(f"Scope: {dict((k,v) for (k,v) in self.scope_values().items() if type(v) != PROCEDURE)}", "blue")
-
-            line_old = self.line
-            self.line = procedure.line
-            for statement in statements:
-                if self.call_stack.top.exit:
-                    self.call_stack.top.exit = False
-                    break
-                self.line += 1
-                self.execute(statement)
-            self.call_stack.pop()
-            self.line = line_old
-        
-        elif instruction_type == RETURN:
-            expression = instruction.expression
-            self.call_stack.top.exit = True
-
-            if self.dev:
-                cprint("Returned to previous scope", "blue")
-
-    def execute_statements(self, statements):
-        line_old = self.line
-        for statement in statements:
-            if self.call_stack.top.exit:
-                self.call_stack.top.exit = False
-                break
-            self.line += 1
-            self.execute(statement)
-        self.line = line_old
+    def enter(self, method, values):
+        # Starts a call of a PROCEDURE or FUNCTION with the values of its arguments
+        instruction = method.statements
+
+        parameters = instruction.parameters
+        data_types = instruction.data_types
+
+        if len(parameters) != len(values):
+            self.throw(Error, "Number of arguments must match number of parameters", "Temp Error")
+
+        values = [String(value) if type(value) == str else value for value in values]
+
+        self.new_call(method, instruction.identifier.scope, self.line)
+
+        for index in range(len(parameters)):
+            self.declare_variables((parameters[index],), data_types[index])
+            self.assign(parameters[index], values[index])
+
+    def invoke(self, instruction, values):
+        # A FUNCTION called from an expression, pure ones are looked up in the memo first
+        if type(instruction) != FUNCTION:
+            self.throw(Error, f"PROCEDURE '{instruction.identifier}' cannot be used in an expression", "Syntax Error")
+        if self.memo is None or id(instruction) not in self.pure:
+            return self.run_function(instruction, values)
+        key = memo_key(instruction, values)
+        result = self.memo.get(instruction.identifier, key)
+        if result is MISSING:
+            result = self.run_function(instruction, values)
+            self.memo.put(key, result)
+        return result
+
+    def run_function(self, instruction, values):
+        # The expression that called the FUNCTION is only part way through, so its blocks run in a loop of
+        # their own. The virtual machine runs FUNCTIONs with its own run_function
+        self.enter(self.functions[id(instruction)], values)
+        call = self.call_stack.top
+        line = self.line
+        depth = len(self.frames)
+        self.open(FUNCTION, instruction, instruction.statements, line, push = True)
+        self.run_blocks(depth)
+        self.line = line
+        return call.result
+
+    def leave(self, expression):
+        # RETURN, whoever runs the call leaves it afterwards
+        call = self.call_stack.top
+        if len(self.call_stack) == 1:
+            self.throw(Error, "RETURN can only be used inside a FUNCTION or PROCEDURE", "Syntax Error")
+        if type(call.method) == Function:
+            if not expression:
+                self.throw(Error, f"FUNCTION '{call.method.name}' must RETURN a value", "Syntax Error")
+            value = self.evaluate(expression)
+            if value is None:
+                self.throw(Error, f"Invalid Expression, {expression}")
+            value_data_type = PYTHON_TO_PSEUDO.get(type(value), type(value).__name__)
+            if value_data_type != call.method.type:
+                self.throw(Error, f"Data Type Mismatch: {call.method.type} <- {value_data_type}")
+            call.result = value
+        elif expression:
+            self.throw(Error, "A PROCEDURE cannot RETURN a value", "Syntax Error")
 
     def throw(self, error_type = Error, *args):
+        self.writer.flush()
 
-        if self.call_stack:
-            print()
-            for call in self.call_stack:
-                cprint(f"Line {call.line} calls {call.method.name}", "yellow")
-                cprint(f"\tProgram Code:\t{self.lines[call.line-1]}", "yellow")
+        # Only the parser knows the column, runtime errors point at the whole line
+        column, self.column = self.column, None
 
-        error_type(*args).throw(self.line, self.lines[self.line-1])
+        # Parse errors show no calls, even when a streamed program is already running
+        calls = []
+        if self.call_stack and column is None:
+            calls = [(call.line, call.method.name, self.lines[call.line-1]) for call in self.call_stack]
 
-        # print([[j for j in i.values] for i in self.call_stack])
+        raise PseudoLangError(error_type(*args), self.line, self.lines[self.line-1], calls, column)
 
-        if self.dev:
-            print()
-            raise AssertionError()
-        exit()
\ No newline at end of file
+    def report(self, error):
+        self.writer.write(error.report(self.writer.paint))
+        self.writer.flush()
@@ -1,2 +0,0 @@
-METHOD_DECLARATION_1 = r"^(\w+)\s*\(\s*((?:\w+\s*:\s*\w+\s*,\s*)*(?:\w+\s*:\s*\w+)\s*)?\)$"
-METHOD_DECLARATION_2 = r"^(\w+)\s*\(\s*((?:\w+\s*,\s*)*\w+)\s*:\s*(\w+)\s*\)$"
\ No newline at end of file
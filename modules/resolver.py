@@ -0,0 +1,152 @@
+from .opcodes import *
+from .classes import *
+from .expression import *
+
+def method_names(statements, names):
+    # Every name a PROCEDURE or FUNCTION declares for itself, parameters included
+    for instruction in statements:
+        instruction_type = type(instruction)
+        if instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            scope = Scope()
+            Resolver().declare(instruction.statements, scope)
+            names.update(instruction.parameters)
+            names.update(scope.names)
+            method_names(instruction.statements, names)
+        elif instruction_type == IF:
+            for block in instruction.statements:
+                method_names(block, names)
+        elif hasattr(instruction, "statements"):
+            method_names(instruction.statements, names)
+    return names
+
+class Resolver:
+    def __init__(self):
+        self.global_scope = None
+        # Expressions in a method read a name it does not declare from the latest call that has it, when some
+        # method declares that name, so a caller's variable hides the global one
+        self.dynamic = set()
+        # When streaming, the expressions in methods that read a global, by name, to link again
+        # once a method declared later makes that name dynamic
+        self.free = None
+
+    def resolve(self, instructions):
+        self.global_scope = Scope()
+        self.dynamic = self.global_scope.dynamic = method_names(instructions, set())
+        self.resolve_block(instructions, self.global_scope, GLOBAL)
+        return self.global_scope
+
+    def resolve_next(self, instruction):
+        # Resolves one more top-level instruction of a program that is still being parsed
+        if self.free is None:
+            self.free = {}
+        names = method_names((instruction,), set()) - self.dynamic
+        self.dynamic |= names
+        self.global_scope.dynamic = self.dynamic
+        for name in names:
+            for expression, scope in self.free.pop(name, ()):
+                self.resolve_expression(expression, scope, LOCAL)
+        self.resolve_block((instruction,), self.global_scope, GLOBAL)
+        return self.global_scope
+
+    def address(self, name, scope, depth):
+        if name in scope.names:
+            return depth, scope.names[name]
+        if name in self.global_scope.names:
+            return GLOBAL, self.global_scope.names[name]
+        return None, None
+
+    def read(self, name, scope, depth):
+        # The address an expression reads a name from, see dynamic
+        if depth == LOCAL and name not in scope.names and name in self.dynamic:
+            return None, None
+        return self.address(name, scope, depth)
+
+    def bind(self, identifier, scope, depth):
+        identifier.depth, identifier.slot = self.address(identifier, scope, depth)
+
+    def declare(self, statements, scope):
+        # Collect every identifier declared in this scope before resolving any use,
+        # so that a reference can be resolved ahead of its DECLARE.
+        for instruction in statements:
+            instruction_type = type(instruction)
+            if instruction_type == DECLARE:
+                for identifier in instruction.identifiers:
+                    scope.add(identifier)
+            elif instruction_type == CONSTANT:
+                scope.add(instruction.identifier)
+            elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+                scope.add(instruction.identifier)
+            elif instruction_type == IF:
+                for block in instruction.statements:
+                    self.declare(block, scope)
+            elif hasattr(instruction, "statements"):
+                self.declare(instruction.statements, scope)
+
+    def resolve_block(self, statements, scope, depth):
+        self.declare(statements, scope)
+        for instruction in statements:
+            self.resolve_instruction(instruction, scope, depth)
+
+    def resolve_expression(self, expression, scope, depth):
+        if type(expression) == Expression:
+            expression.link(lambda name: self.read(name, scope, depth))
+            if self.free is not None and depth == LOCAL:
+                for name in expression.names:
+                    if name not in scope.names and name not in self.dynamic:
+                        self.free.setdefault(name, []).append((expression, scope))
+
+    def resolve_instruction(self, instruction, scope, depth):
+        instruction_type = type(instruction)
+
+        if instruction_type == DECLARE:
+            for identifier in instruction.identifiers:
+                self.bind(identifier, scope, depth)
+
+        elif instruction_type == CONSTANT or instruction_type == ASSIGNMENT:
+            self.bind(instruction.identifier, scope, depth)
+            self.resolve_expression(instruction.value, scope, depth)
+
+        elif instruction_type == INPUT:
+            self.bind(instruction.identifier, scope, depth)
+
+        elif instruction_type == OUTPUT:
+            for expression in instruction.exp:
+                self.resolve_expression(expression, scope, depth)
+
+        elif instruction_type == IF:
+            for condition in instruction.conditions:
+                self.resolve_expression(condition, scope, depth)
+            for block in instruction.statements:
+                for statement in block:
+                    self.resolve_instruction(statement, scope, depth)
+
+        elif instruction_type == FOR:
+            self.bind(instruction.identifier, scope, depth)
+            self.resolve_expression(instruction.lower, scope, depth)
+            self.resolve_expression(instruction.upper, scope, depth)
+            self.resolve_expression(instruction.step, scope, depth)
+            for statement in instruction.statements:
+                self.resolve_instruction(statement, scope, depth)
+
+        elif instruction_type == WHILE or instruction_type == REPEAT:
+            self.resolve_expression(instruction.condition, scope, depth)
+            for statement in instruction.statements:
+                self.resolve_instruction(statement, scope, depth)
+
+        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            self.bind(instruction.identifier, scope, depth)
+            method_scope = Scope()
+            for parameter in instruction.parameters:
+                method_scope.add(parameter)
+            for parameter in instruction.parameters:
+                self.bind(parameter, method_scope, LOCAL)
+            self.resolve_block(instruction.statements, method_scope, LOCAL)
+            instruction.identifier.scope = method_scope
+
+        elif instruction_type == CALL:
+            self.bind(instruction.identifier, scope, depth)
+            for argument in instruction.arguments:
+                self.resolve_expression(argument, scope, depth)
+
+        elif instruction_type == RETURN:
+            self.resolve_expression(instruction.expression, scope, depth)
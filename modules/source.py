@@ -0,0 +1,62 @@
+import mmap
+from array import array
+
+class SourceFile:
+    # The lines of a file read through mmap. Only where each line starts is kept,
+    # a line's text is read again when an error message or a trace needs it
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self.data = b""
+        self.offsets = array("Q")
+
+    def __iter__(self):
+        self.offsets = array("Q")
+        data = self.data
+        position = 0
+        end = len(data)
+        while position < end:
+            newline = data.find(b"\n", position)
+            if newline == -1:
+                newline = end
+            self.offsets.append(position)
+            yield data[position:newline].decode("utf-8", "replace").strip()
+            position = newline + 1
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start = self.offsets[index]
+        newline = self.data.find(b"\n", start)
+        if newline == -1:
+            newline = len(self.data)
+        return self.data[start:newline].decode("utf-8", "replace").strip()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+class SourceLines:
+    # Any iterable of lines, such as a generator, kept as they are read since they cannot be read again
+    def __init__(self, lines):
+        self.source = iter(lines)
+        self.lines = []
+
+    def __iter__(self):
+        for line in self.source:
+            line = line.strip()
+            self.lines.append(line)
+            yield line
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        return self.lines[index]
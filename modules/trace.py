@@ -0,0 +1,157 @@
+import json
+from collections import deque
+
+from .opcodes import *
+
+# Trace records are plain tuples, formatted only when a sink decides to show them:
+# ("parsed", line, instruction)
+# ("statement", line, block, calls, code, instruction)
+# ("assigned", line, identifier, value)
+# ("declared", line, identifiers, data_type)
+# ("constant", line, identifier, data_type, value)
+# ("source", line, lines)
+# ("method", line, identifier)
+# ("call", line, global_values, local_values, scope_values)
+# ("returned", line)
+# A sink is anything with append, such as a list, a deque used as a ring buffer or a TraceFile
+
+class Tracer:
+    # Installed on a program once, so untraced runs never check whether tracing is on
+    def __init__(self, program, sink):
+        self.program = program
+        self.sink = sink
+        self.emit = sink.append
+
+        self._execute = program.execute
+        self._assign = program.assign
+        self._declare_variables = program.declare_variables
+        self._declare_constant = program.declare_constant
+        self._declare_method = program.declare_method
+        self._enter = program.enter
+
+        program.execute = self.execute
+        program.assign = self.assign
+        program.declare_variables = self.declare_variables
+        program.declare_constant = self.declare_constant
+        program.declare_method = self.declare_method
+        program.enter = self.enter
+
+    def parsed(self, instruction):
+        self.emit(("parsed", self.program.line, instruction))
+
+    def execute(self, instruction):
+        program = self.program
+        call_stack = program.call_stack
+        calls = tuple(call.method.name for call in call_stack) if len(call_stack) > 1 else ()
+        self.emit(("statement", program.line, program.block, calls, program.lines[program.line-1], instruction))
+        self._execute(instruction)
+        if type(instruction) == RETURN:
+            self.emit(("returned", program.line))
+
+    def assign(self, identifier, expression):
+        self._assign(identifier, expression)
+        self.emit(("assigned", self.program.line, identifier, self.program.get_properties(identifier).data))
+
+    def declare_variables(self, identifiers, data_type):
+        self._declare_variables(identifiers, data_type)
+        self.emit(("declared", self.program.line, tuple(identifiers), data_type))
+
+    def declare_constant(self, identifier, expression):
+        self._declare_constant(identifier, expression)
+        constant = self.program.get_properties(identifier)
+        self.emit(("constant", self.program.line, identifier, constant.type, constant.data))
+
+    def declare_method(self, instruction):
+        program = self.program
+        start, end = program.span(instruction)
+        self.emit(("source", program.line, tuple(program.lines[start:end])))
+        self._declare_method(instruction)
+        self.emit(("method", program.line, instruction.identifier))
+
+    def enter(self, method, values):
+        program = self.program
+        self._enter(method, values)
+        values = [
+            dict((k, v) for (k, v) in values.items() if type(v) != PROCEDURE and type(v) != FUNCTION)
+            for values in (program.global_values(), program.local_values(), program.scope_values())
+        ]
+        self.emit(("call", program.line, *values))
+
+class PrettyPrinter:
+    # Renders records as the coloured -dev trace
+    def __init__(self, writer):
+        self.writer = writer
+
+    def append(self, record):
+        getattr(self, record[0])(*record[1:])
+
+    def parsed(self, line, instruction):
+        self.writer.cprint(instruction, "green")
+
+    def statement(self, line, block, calls, code, instruction):
+        self.writer.write("\n")
+        self.writer.cprint(f"Block {block+1} • Line {line}", "yellow")
+        if calls:
+            self.writer.cprint(tuple(calls), "yellow")
+        if code:
+            self.writer.cprint(code, "magenta")
+        if instruction:
+            self.writer.cprint(instruction, "green")
+
+    def assigned(self, line, identifier, value):
+        self.writer.cprint(f"{identifier} has been assigned value {value}", "blue")
+
+    def declared(self, line, identifiers, data_type):
+        if len(identifiers) == 1:
+            self.writer.cprint(f"Declared variable '{identifiers[0]}' with type {data_type}", "blue")
+        elif len(identifiers) > 1:
+            self.writer.cprint(f"Declared variables {list(identifiers).__repr__()[1:-1]} with type {data_type}", "blue")
+
+    def constant(self, line, identifier, data_type, value):
+        self.writer.cprint(f"Declared constant '{identifier}' with type {data_type} and value {value}", "blue")
+
+    def source(self, line, lines):
+        for code in lines:
+            self.writer.cprint(code, "magenta")
+
+    def method(self, line, identifier):
+        self.writer.cprint(f"Procedure '{identifier}' has been created", "blue")
+
+    def call(self, line, global_values, local_values, scope_values):
+        self.writer.cprint(f"Global: {global_values}", "blue")
+        self.writer.cprint(f"Local: {local_values}", "blue")
+        self.writer.cprint(f"Scope: {scope_values}", "blue")
+
+    def returned(self, line):
+        self.writer.cprint("Returned to previous scope", "blue")
+
+def plain(field):
+    # Keeps what JSON can hold and turns everything else into the text the trace would show
+    if type(field) in (tuple, list):
+        return [plain(item) for item in field]
+    if field is None or type(field) in (int, float, str, bool):
+        return field
+    return str(field)
+
+class TraceFile:
+    # Writes one JSON list per record, rendered later with render(read_trace(file), writer)
+    def __init__(self, file):
+        self.file = file
+
+    def append(self, record):
+        self.file.write(json.dumps(plain(record)) + "\n")
+
+def read_trace(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+def render(records, writer):
+    printer = PrettyPrinter(writer)
+    for record in records:
+        printer.append(record)
+    writer.flush()
+
+def ring_buffer(size):
+    # Keeps only the last `size` records, cheap enough to leave on for every run
+    return deque(maxlen=size)
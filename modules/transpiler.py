@@ -0,0 +1,713 @@
+import ast
+import copy
+import keyword
+import traceback
+
+from .opcodes import *
+from .data_types import *
+from .classes import *
+from .errors import *
+from .helpers import *
+from .arithmetic import Pythonize, join
+from .memo import pure_functions, memo_key, MISSING
+
+FILENAME = "<pseudolang>"
+
+PYTHON_TYPES = {
+    "INTEGER": "_INTEGER",
+    "REAL": "_REAL",
+    "STRING": "_STRING",
+    "CHAR": "_CHAR",
+    "BOOLEAN": "_BOOLEAN",
+}
+
+class TranspileError(Exception):
+    pass
+
+# The line_map message of a FUNCTION's stack check, whose call never started when it fails
+OVERFLOW = "overflow"
+
+class Failure(Exception):
+    def __init__(self, error_type, *arguments):
+        super().__init__(*arguments)
+        self.error_type = error_type
+        self.arguments = arguments
+
+class Declaration:
+    def __init__(self, kind, data_type, instruction):
+        self.kind = kind
+        self.data_type = data_type
+        self.instruction = instruction
+        self.count = 1
+
+def collect(statements, table):
+    for instruction in statements:
+        instruction_type = type(instruction)
+        declarations = []
+        if instruction_type == DECLARE:
+            declarations = [(identifier, "VARIABLE", instruction.data_type) for identifier in instruction.identifiers]
+        elif instruction_type == CONSTANT:
+            literal = instruction.value.literal
+            data_type = PYTHON_TO_PSEUDO.get(type(literal)) if literal is not None else None
+            declarations = [(instruction.identifier, "CONSTANT", data_type)]
+        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            declarations = [(instruction.identifier, instruction_type.__name__, None)]
+        elif instruction_type == IF:
+            for block in instruction.statements:
+                collect(block, table)
+        elif hasattr(instruction, "statements"):
+            collect(instruction.statements, table)
+
+        for identifier, kind, data_type in declarations:
+            if identifier in table:
+                declaration = table[identifier]
+                declaration.count += 1
+                if declaration.kind != kind or declaration.data_type != data_type:
+                    declaration.data_type = None
+            else:
+                table[identifier] = Declaration(kind, data_type, instruction)
+    return table
+
+class Transpiler:
+    def __init__(self, program):
+        self.program = program
+        self.source = None
+        self.code = None
+        self.constants = {}
+        self.line_map = []
+        self.output = program.writer
+
+    # Code generation
+
+    def emit(self, text, line = None, message = None, prefix = ()):
+        self.source_lines.append("    " * self.indent + text)
+        self.line_map.append((line, message, prefix))
+
+    def constant(self, value):
+        name = f"_k{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def fail(self, line, error_type, *arguments):
+        arguments = ", ".join(repr(argument) for argument in arguments)
+        self.emit(f"_fail({error_type.__name__}, {arguments})", line)
+
+    def find(self, name):
+        if name in self.locals:
+            return self.locals[name]
+        if name in self.globals:
+            return self.globals[name]
+        return None
+
+    def is_declared(self, name):
+        return name in self.declared
+
+    def transpile(self):
+        program = self.program
+        if program.instructions is None:
+            program.parse()
+
+        self.source_lines = []
+        self.line_map = []
+        self.constants = {}
+        self.indent = 0
+
+        self.globals = collect(program.instructions, {})
+        self.locals = self.globals
+        self.others = set()
+        for instruction in program.instructions:
+            if type(instruction) == PROCEDURE or type(instruction) == FUNCTION:
+                self.others |= set(collect(instruction.statements, {})) | set(instruction.parameters)
+        self.declared = set()
+        self.in_method = False
+        self.method = None
+        self.loops = 0
+        self.pure = pure_functions(program.instructions) if program.memo is not None else set()
+
+        self.emit("def _main():")
+        self.indent += 1
+        self.emit("_calls = 0")
+        for line, instruction in program.instructions.numbered:
+            self.transpile_instruction(instruction, line)
+        self.indent -= 1
+
+        self.source = "\n".join(self.source_lines) + "\n"
+        try:
+            self.code = compile(self.source, FILENAME, "exec")
+        except SyntaxError as e:
+            raise TranspileError(f"Generated code is invalid: {e}")
+        return self.source
+
+    def transpile_block(self, statements):
+        declared = set(self.declared)
+        start = len(self.source_lines)
+        for line, instruction in statements.numbered:
+            self.transpile_instruction(instruction, line)
+        if len(self.source_lines) == start:
+            self.emit("pass")
+        self.declared = declared
+
+    def transpile_loop(self, statements):
+        self.loops += 1
+        self.transpile_block(statements)
+        self.loops -= 1
+
+    def expression(self, expression):
+        if expression.literal is not None:
+            if type(expression.literal) in (int, float):
+                return repr(expression.literal)
+            return self.constant(expression.literal)
+        if expression.tree is None:
+            return f"_raise({self.constant(expression.error)})"
+        for node in ast.walk(expression.tree):
+            if isinstance(node, ast.Name):
+                if keyword.iskeyword(node.id):
+                    raise TranspileError(f"'{node.id}' is a Python keyword")
+                if self.in_method and node.id not in self.locals and node.id in self.others:
+                    # The tree-walker would find this name in a caller's frame
+                    raise TranspileError(f"'{node.id}' relies on dynamic scope")
+                if not isinstance(node.ctx, ast.Load):
+                    raise TranspileError("Expressions cannot bind names")
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                declaration = self.find(node.func.id)
+                if declaration is not None and declaration.kind == "PROCEDURE":
+                    raise TranspileError(f"PROCEDURE '{node.func.id}' is used in an expression")
+                if declaration is not None and declaration.kind == "FUNCTION" and len(node.args) != len(declaration.instruction.parameters):
+                    raise TranspileError(f"FUNCTION '{node.func.id}' is given the wrong number of arguments")
+        called = set(id(node.func) for node in ast.walk(expression.tree) if isinstance(node, ast.Call))
+        for node in ast.walk(expression.tree):
+            if isinstance(node, ast.Name) and id(node) not in called:
+                declaration = self.find(node.id)
+                if declaration is not None and declaration.kind in ("FUNCTION", "PROCEDURE"):
+                    raise TranspileError(f"'{node.id}' is used as a value")
+        return f"({ast.unparse(Pythonize(self.constant).visit(copy.deepcopy(expression.tree.body)))})"
+
+    def calls_function(self, expression):
+        if expression.tree is None:
+            return False
+        for node in ast.walk(expression.tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                declaration = self.find(node.func.id)
+                if declaration is not None and declaration.kind == "FUNCTION":
+                    return True
+        return False
+
+    def infer(self, node):
+        # Returns (data type, may be None) for the value of an expression tree
+        if isinstance(node, ast.Constant):
+            return PYTHON_TO_PSEUDO.get(type(node.value)), False
+        if isinstance(node, ast.Name):
+            declaration = self.find(node.id)
+            if declaration is not None and declaration.kind in ("VARIABLE", "CONSTANT"):
+                return declaration.data_type, True
+            return None, True
+        if isinstance(node, (ast.Compare, ast.BoolOp)) or (isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not)):
+            return "BOOLEAN", False
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            declaration = self.find(node.func.id)
+            if declaration is not None and declaration.kind == "FUNCTION":
+                # Its RETURN checked the value already
+                return declaration.instruction.return_type, False
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            data_type, _ = self.infer(node.operand)
+            if data_type in ("INTEGER", "REAL"):
+                return data_type, False
+        if isinstance(node, ast.BinOp):
+            left, _ = self.infer(node.left)
+            right, _ = self.infer(node.right)
+            if left in ("INTEGER", "REAL") and right in ("INTEGER", "REAL"):
+                if isinstance(node.op, ast.Div):
+                    return "REAL", False
+                if isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod)):
+                    if left == "INTEGER" and right == "INTEGER":
+                        return "INTEGER", False
+                    return "REAL", False
+        return None, True
+
+    def infer_expression(self, expression):
+        if expression.literal is not None:
+            return PYTHON_TO_PSEUDO.get(type(expression.literal)), False
+        if expression.tree is None:
+            return None, True
+        return self.infer(expression.tree.body)
+
+    def null_check(self, name, expression, message, line, prefix = ()):
+        if self.infer_expression(expression)[1]:
+            self.emit(f"if {name} is None: _fail(Error, {message!r})", line, None, prefix)
+
+    def target(self, identifier, line):
+        # Emits the checks Program.assign makes before evaluating, returns the declaration
+        declaration = self.find(identifier)
+        if declaration is None:
+            self.fail(line, NoDeclarationError, identifier)
+            return None
+        if declaration.kind == "CONSTANT":
+            self.fail(line, Error, f"Value cannot be reassigned to constant '{identifier}'")
+            return None
+        if declaration.kind != "VARIABLE" or declaration.data_type is None:
+            raise TranspileError(f"Cannot assign to '{identifier}'")
+        if not self.is_declared(identifier):
+            self.emit("try:", line)
+            self.indent += 1
+            self.emit(identifier, line)
+            self.indent -= 1
+            self.emit("except NameError:", line)
+            self.indent += 1
+            self.fail(line, NoDeclarationError, identifier)
+            self.indent -= 1
+        return declaration
+
+    def assign(self, identifier, code, data_type, nullable, source, line):
+        declaration = self.target(identifier, line)
+        if declaration is None:
+            return
+        message = f"Invalid Expression, {source}"
+        if data_type == declaration.data_type and not nullable:
+            self.emit(f"{identifier} = {code}", line, message)
+        elif data_type == declaration.data_type:
+            self.emit(f"{identifier} = {code}", line, message)
+            self.emit(f"if {identifier} is None: _fail(Error, {message!r})", line)
+        else:
+            self.emit(f"{identifier} = _check({code}, {declaration.data_type!r}, {source!r})", line, message)
+
+    def declare(self, identifier, line):
+        if identifier in KEYWORDS:
+            self.fail(line, Error, f"{identifier} is a keyword", "Name Error")
+            return False
+        if keyword.iskeyword(identifier):
+            raise TranspileError(f"'{identifier}' is a Python keyword")
+        if self.loops > 0 or self.find(identifier).count > 1:
+            self.emit("try:", line)
+            self.indent += 1
+            self.emit(identifier, line)
+            self.indent -= 1
+            self.emit("except NameError:", line)
+            self.indent += 1
+            self.emit("pass", line)
+            self.indent -= 1
+            self.emit("else:", line)
+            self.indent += 1
+            self.fail(line, ReDeclarationError, identifier)
+            self.indent -= 1
+        if not valid_identifier(identifier):
+            self.fail(line, Error, "Invalid Identifier", "Name Error")
+            return False
+        self.declared.add(identifier)
+        return True
+
+    def condition(self, expression, message):
+        code = self.expression(expression)
+        return f"(_t := {code}) is True or _t is _TRUE or (_t is None and _truth(_t, {message!r}))"
+
+    def transpile_instruction(self, instruction, line):
+        instruction_type = type(instruction)
+
+        if instruction_type == DECLARE:
+            if instruction.data_type not in DATA_TYPES:
+                self.fail(line, Error, "Invalid Data Type", "Type Error")
+                return
+            for identifier in instruction.identifiers:
+                if not self.declare(identifier, line):
+                    return
+                self.emit(f"{identifier} = None", line)
+
+        elif instruction_type == CONSTANT:
+            identifier = instruction.identifier
+            code = self.expression(instruction.value)
+            self.emit(f"_t = {code}", line, "Invalid Expression")
+            self.null_check("_t", instruction.value, "Invalid Expression", line)
+            if self.declare(identifier, line):
+                self.emit(f"{identifier} = _t", line)
+
+        elif instruction_type == ASSIGNMENT:
+            data_type, nullable = self.infer_expression(instruction.value)
+            code = self.expression(instruction.value)
+            self.assign(instruction.identifier, code, data_type, nullable, str(instruction.value), line)
+
+        elif instruction_type == INPUT:
+            identifier = instruction.identifier
+            declaration = self.target(identifier, line)
+            if declaration is not None:
+                self.emit(f"{identifier} = _input({declaration.data_type!r}, {identifier!r})", line)
+
+        elif instruction_type == OUTPUT:
+            parts = []
+            for index, expression in enumerate(instruction.exp):
+                if not expression:
+                    self.fail(line, Error, "Output expression is missing")
+                    return
+                if parts and self.calls_function(expression):
+                    # The FUNCTION may OUTPUT too, so what comes before it is written first
+                    self.emit(f"_write({ast.unparse(ast.JoinedStr(parts))})", line)
+                    parts = []
+                # Values before a failing expression have already been printed by the interpreter
+                prefix = tuple(parts)
+                if expression.literal is not None:
+                    parts.append(ast.Constant(str(expression.literal)))
+                else:
+                    message = f"Cannot evaluate the expression, {expression}"
+                    self.emit(f"_o{index} = {self.expression(expression)}", line, message, prefix)
+                    self.null_check(f"_o{index}", expression, message, line, prefix)
+                    parts.append(ast.FormattedValue(ast.Name(f"_o{index}", ast.Load()), -1, None))
+            parts.append(ast.Constant("\n"))
+            self.emit(f"_write({ast.unparse(ast.JoinedStr(parts))})", line)
+
+        elif instruction_type == IF:
+            if any(len(block) == 0 for block in instruction.statements):
+                raise TranspileError("IF has an empty block")
+            headers = [self.program.spans[id(block)][0] for block in instruction.statements]
+
+            for index, condition in enumerate(instruction.conditions):
+                if condition == "ELSE":
+                    self.emit("else:", headers[index])
+                else:
+                    keyword_ = "if" if index == 0 else "elif"
+                    self.emit(f"{keyword_} {self.condition(condition, 'Invalid Condition')}:", headers[index], "Invalid Condition")
+                self.indent += 1
+                self.transpile_block(instruction.statements[index])
+                # The interpreter evaluates every condition of an IF, even after a branch was taken
+                for later in range(index + 1, len(instruction.conditions)):
+                    condition = instruction.conditions[later]
+                    if condition != "ELSE" and self.infer_expression(condition)[1]:
+                        code = self.expression(condition)
+                        self.emit(f"if {code} is None: _fail(Error, 'Invalid Condition')", headers[later], "Invalid Condition")
+                    elif condition != "ELSE":
+                        self.emit(self.expression(condition), headers[later], "Invalid Condition")
+                self.indent -= 1
+
+        elif instruction_type == FOR:
+            identifier = instruction.identifier
+            for name, message, expression in (
+                ("_lower", "Invalid lower bound", instruction.lower),
+                ("_upper", "Invalid upper bound", instruction.upper),
+                ("_step", "Invalid step", instruction.step),
+            ):
+                if expression is None:
+                    # No STEP, _range picks 1 or -1 from the bounds
+                    self.emit(f"{name} = None", line)
+                    continue
+                self.emit(f"{name} = {self.expression(expression)}", line, message)
+                self.null_check(name, expression, message, line)
+            declaration = self.find(identifier)
+            direct = declaration is not None and declaration.kind == "VARIABLE" and declaration.data_type == "INTEGER" and self.is_declared(identifier)
+            bounds = "_range(_lower, _upper, _step)"
+            if direct:
+                self.emit(f"for {identifier} in {bounds}:", line)
+                self.indent += 1
+            else:
+                self.emit(f"for _index in {bounds}:", line)
+                self.indent += 1
+                self.assign(identifier, "_index", "INTEGER", False, "_index", line)
+            self.transpile_loop(instruction.statements)
+            self.indent -= 1
+
+        elif instruction_type == WHILE:
+            code = self.expression(instruction.condition)
+            self.emit("try:", line)
+            self.indent += 1
+            self.emit(f"_t = {code}", line)
+            self.indent -= 1
+            self.emit("except NameError:", line)
+            self.indent += 1
+            self.emit("raise", line)
+            self.indent -= 1
+            self.emit("except Exception as _e:", line)
+            self.indent += 1
+            self.emit("_t = _swallow(_e)", line)
+            self.indent -= 1
+            self.emit("while _t is True or _t is _TRUE:", line)
+            self.indent += 1
+            self.transpile_loop(instruction.statements)
+            message = "Condition could not be evaluated"
+            self.emit(f"_t = {code}", line, message)
+            self.null_check("_t", instruction.condition, message, line)
+            self.indent -= 1
+
+        elif instruction_type == REPEAT:
+            until = self.program.spans[id(instruction)][1]
+            message = "Condition could not be evaluated"
+            self.emit("while True:", line)
+            self.indent += 1
+            self.transpile_loop(instruction.statements)
+            self.emit(f"_t = {self.expression(instruction.condition)}", until, message)
+            self.null_check("_t", instruction.condition, message, until)
+            self.emit("if not (_t is False or _t is _FALSE): break", until)
+            self.indent -= 1
+
+        elif instruction_type == PROCEDURE or instruction_type == FUNCTION:
+            self.transpile_method(instruction, line)
+
+        elif instruction_type == CALL:
+            identifier = instruction.identifier
+            declaration = self.find(identifier)
+            if declaration is None:
+                self.fail(line, Error, f"Unknown identifier '{identifier}'")
+                return
+            if declaration.kind == "FUNCTION":
+                self.fail(line, Error, f"CALL cannot be used with FUNCTION '{identifier}'", "Syntax Error")
+                return
+            if declaration.kind != "PROCEDURE":
+                raise TranspileError(f"CALL of non-procedure '{identifier}'")
+            if len(declaration.instruction.parameters) != len(instruction.arguments):
+                self.fail(line, Error, "Number of arguments must match number of parameters", "Temp Error")
+                return
+            if not self.is_declared(identifier):
+                self.emit("try:", line)
+                self.indent += 1
+                self.emit(identifier, line)
+                self.indent -= 1
+                self.emit("except NameError:", line)
+                self.indent += 1
+                self.fail(line, Error, f"Unknown identifier '{identifier}'")
+                self.indent -= 1
+            arguments = ", ".join(self.expression(argument) for argument in instruction.arguments)
+            self.emit("_calls += 1", line)
+            self.emit(f"if _calls > {CALL_DEPTH}: _fail(Error, 'Call stack has reached maximum capacity', 'Stack Overflow Error')", line)
+            self.emit(f"{identifier}({arguments})", line)
+            self.emit("_calls -= 1", line)
+
+        elif instruction_type == RETURN:
+            expression = instruction.expression
+            if not self.in_method:
+                self.fail(line, Error, "RETURN can only be used inside a FUNCTION or PROCEDURE", "Syntax Error")
+            elif type(self.method) == PROCEDURE and expression:
+                self.fail(line, Error, "A PROCEDURE cannot RETURN a value", "Syntax Error")
+            elif type(self.method) == PROCEDURE:
+                self.emit("return", line)
+            elif not expression:
+                self.fail(line, Error, f"FUNCTION '{self.method.identifier}' must RETURN a value", "Syntax Error")
+            else:
+                source = str(expression)
+                code = self.expression(expression)
+                self.emit(f"return _check({code}, {self.method.return_type!r}, {source!r})", line, f"Invalid Expression, {source}")
+
+    def transpile_method(self, instruction, line):
+        identifier = instruction.identifier
+        kind = type(instruction).__name__
+        if self.in_method or self.loops > 0 or self.find(identifier).count > 1:
+            raise TranspileError(f"{kind} must be declared once at the top level")
+        if keyword.iskeyword(identifier):
+            raise TranspileError(f"'{identifier}' is a Python keyword")
+
+        outer = (self.locals, self.declared)
+        self.in_method = True
+        self.locals = collect(instruction.statements, {})
+        for parameter, data_type in zip(instruction.parameters, instruction.data_types):
+            if keyword.iskeyword(parameter):
+                raise TranspileError(f"'{parameter}' is a Python keyword")
+            if parameter in self.locals:
+                raise TranspileError(f"Parameter '{parameter}' is declared again")
+            self.locals[parameter] = Declaration("VARIABLE", data_type, instruction)
+        # Globals declared before the PROCEDURE are declared whenever it can be called
+        self.declared = set(self.declared) | set(instruction.parameters) | {identifier}
+
+        assigned = set()
+        for node in walk(instruction.statements):
+            if type(node) in (ASSIGNMENT, INPUT, FOR) and node.identifier not in self.locals:
+                assigned.add(node.identifier)
+        nonlocals = ", ".join(["_calls"] + sorted(name for name in assigned if name in self.globals))
+
+        self.emit(f"def {identifier}({', '.join(instruction.parameters)}):", line)
+        self.indent += 1
+        self.emit(f"nonlocal {nonlocals}", line)
+        self.method = instruction
+        if kind == "FUNCTION":
+            # Called from expressions, so the stack is counted here rather than at every call
+            self.emit("_calls += 1", line)
+            self.emit(f"if _calls > {CALL_DEPTH}: _fail(Error, 'Call stack has reached maximum capacity', 'Stack Overflow Error')", None, OVERFLOW)
+            self.emit("try:", line)
+            self.indent += 1
+        for parameter, data_type in zip(instruction.parameters, instruction.data_types):
+            # Parameters are checked against the line of the CALL, like Program.enter_call
+            if data_type not in DATA_TYPES:
+                self.fail(None, Error, "Invalid Data Type", "Type Error")
+                break
+            if parameter in KEYWORDS:
+                self.fail(None, Error, f"{parameter} is a keyword", "Name Error")
+                break
+            if not valid_identifier(parameter):
+                self.fail(None, Error, "Invalid Identifier", "Name Error")
+                break
+            self.emit(f"if type({parameter}) is not {PYTHON_TYPES[data_type]}: _check({parameter}, {data_type!r}, '')", None)
+
+        start = len(self.source_lines)
+        for statement_line, statement in instruction.statements.numbered:
+            self.transpile_instruction(statement, statement_line)
+        if kind == "FUNCTION":
+            end = self.program.spans[id(instruction)][1]
+            self.fail(end, Error, f"FUNCTION '{identifier}' ended without RETURN")
+            self.indent -= 1
+            self.emit("finally:", line)
+            self.indent += 1
+            self.emit("_calls -= 1", line)
+            self.indent -= 1
+        if len(self.source_lines) == start:
+            self.emit("pass", line)
+        self.indent -= 1
+        if id(instruction) in self.pure:
+            # Written out with the FUNCTION's own parameters, a call through *values would nest on the C stack
+            parameters = ", ".join(instruction.parameters)
+            key = f"_memo_key({self.constant(instruction)}, ({parameters}{',' if len(instruction.parameters) == 1 else ''}))"
+            self.emit(f"_unmemoized_{identifier} = {identifier}", line)
+            self.emit(f"def {identifier}({parameters}):", line)
+            self.indent += 1
+            self.emit(f"_key = {key}", line)
+            self.emit(f"_result = _memo_get({identifier!r}, _key)", line)
+            self.emit("if _result is _MISSING:", line)
+            self.indent += 1
+            self.emit(f"_result = _unmemoized_{identifier}({parameters})", line)
+            self.emit("_memo_put(_key, _result)", line)
+            self.indent -= 1
+            self.emit("return _result", line)
+            self.indent -= 1
+
+        self.locals, self.declared = outer
+        self.in_method = False
+        self.method = None
+        self.declared.add(identifier)
+
+    # Execution
+
+    def namespace(self):
+        output = self.output
+        reader = self.program.reader
+
+        def fail(error_type, *arguments):
+            raise Failure(error_type, *arguments)
+
+        def truth(value, message):
+            if value is None:
+                if message is not None:
+                    raise Failure(Error, message)
+                return False
+            return value is True or value is TRUE
+
+        def check(value, data_type, source):
+            if value is None:
+                raise Failure(Error, f"Invalid Expression, {source}")
+            value_data_type = PYTHON_TO_PSEUDO[type(value)]
+            if value_data_type != data_type:
+                raise Failure(Error, f"Data Type Mismatch: {data_type} <- {value_data_type}")
+            return value
+
+        def read(data_type, identifier):
+            output.flush()
+            try:
+                return reader.read(data_type)
+            except EOFError:
+                raise Failure(Error, f"No input left for '{identifier}'", "Input Error")
+
+        def range_(lower, upper, step):
+            if step is None and type(lower) == int and type(upper) == int:
+                step = 1 if upper >= lower else -1
+            if type(lower) != int or type(upper) != int or type(step) != int:
+                raise Failure(Error, "FOR bounds and step must be INTEGER", "Type Error")
+            if step == 0:
+                raise Failure(Error, "FOR step cannot be zero")
+            if upper >= lower:
+                return range(lower, upper + 1, step)
+            return range(lower, upper - 1, step)
+
+        def swallow(error):
+            if type(error) == Failure:
+                # From a FUNCTION the expression called
+                raise error
+            output.cprint(f"{error.__class__.__name__}: {error}", "red")
+            return None
+
+        def raise_(error):
+            raise error
+
+        memo = self.program.memo
+
+        namespace = {
+            "_fail": fail,
+            "_truth": truth,
+            "_check": check,
+            "_input": read,
+            "_swallow": swallow,
+            "_raise": raise_,
+            "_memo_key": memo_key,
+            "_memo_get": memo.get if memo is not None else None,
+            "_memo_put": memo.put if memo is not None else None,
+            "_MISSING": MISSING,
+            "_join": join,
+            "_write": output.write,
+            "_range": range_,
+            "_TRUE": TRUE,
+            "_FALSE": FALSE,
+            "Error": Error,
+            "NoDeclarationError": NoDeclarationError,
+            "ReDeclarationError": ReDeclarationError,
+        }
+        for data_type, name in PYTHON_TYPES.items():
+            namespace[name] = PSEUDO_TO_PYTHON[data_type]
+        namespace.update(self.constants)
+        return namespace
+
+    def run(self):
+        if self.code is None:
+            self.transpile()
+        if self.program.memo is not None:
+            self.program.memo.bind(self.program.instructions)
+        namespace = self.namespace()
+        exec(self.code, namespace)
+        try:
+            # PROCEDUREs and FUNCTIONs are Python functions, so deep recursion needs as many Python frames
+            with python_frames(CALL_DEPTH + 1):
+                namespace["_main"]()
+        except Exception as error:
+            self.output.flush()
+            self.report(error)
+        self.output.flush()
+
+    def report(self, error):
+        program = self.program
+        frames = [(frame, line) for (frame, line) in traceback.walk_tb(error.__traceback__) if frame.f_code.co_filename == FILENAME]
+        if not frames:
+            raise error
+
+        calls = [Call(Procedure("MAIN", None, 1), Scope(), 1)]
+        for index in range(1, len(frames)):
+            line = self.line_map[frames[index-1][1]-1][0]
+            calls.append(Call(Procedure(frames[index][0].f_code.co_name, None, line), Scope(), line))
+
+        if self.line_map[frames[-1][1]-1][1] == OVERFLOW:
+            # Like Program.new_call, the call that would overflow the stack never started
+            frames = frames[:-1]
+            calls = calls[:-1]
+
+        line, message, prefix = self.line_map[frames[-1][1]-1]
+        if line is None:
+            line = calls[-1].line
+        for part in prefix:
+            if type(part) == ast.Constant:
+                self.output.write(str(part.value))
+            else:
+                self.output.write(str(frames[-1][0].f_locals[part.value.id]))
+
+        program.call_stack = Stack(len(calls))
+        for call in calls:
+            program.call_stack.push(call)
+        program.line = line
+
+        if type(error) == Failure:
+            program.throw(error.error_type, *error.arguments)
+        elif isinstance(error, NameError):
+            identifier = str(error).split("'")[1]
+            program.throw(Error, f"Invalid identifier '{identifier}'", "Name Error")
+        elif isinstance(error, RecursionError):
+            program.throw(Error, "Call stack has reached maximum capacity", "Stack Overflow Error")
+        elif message is not None:
+            self.output.cprint(f"{error.__class__.__name__}: {error}", "red")
+            program.throw(Error, message)
+        raise error
+
+def walk(statements):
+    for instruction in statements:
+        yield instruction
+        if type(instruction) == IF:
+            for block in instruction.statements:
+                yield from walk(block)
+        elif type(instruction) != PROCEDURE and type(instruction) != FUNCTION and hasattr(instruction, "statements"):
+            yield from walk(instruction.statements)
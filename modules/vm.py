@@ -0,0 +1,264 @@
+import time
+
+from .compiler import *
+from .data_types import *
+from .classes import *
+from .errors import *
+from .expression import *
+from .helpers import *
+
+# FUNCTIONs called from an expression cannot give the event loop a turn, so asynchronous runs stop an expression
+# whose FUNCTIONs hold it for longer than this many seconds
+ASYNC_FUNCTION_TIME = 1
+
+class VirtualMachine:
+    def __init__(self, program):
+        self.program = program
+        self.code = None
+        self.methods = None
+        self.state = None
+        self.asynchronous = False
+        self.every = -1
+        self.deadline = None
+
+    def compile(self):
+        program = self.program
+        if program.instructions is None:
+            program.parse()
+        compiler = Compiler(program.spans)
+        self.code = compiler.compile(program.instructions)
+        self.methods = compiler.methods
+        return self.code
+
+    def start(self):
+        if self.code is None:
+            self.compile()
+        self.program.start()
+        # FUNCTIONs called from expressions run on the VM too
+        self.program.run_function = self.run_function
+        self.state = (self.code.instructions, 0, [], [])
+        self.asynchronous = False
+
+    def save(self, code, pc):
+        self.state = (code, pc, self.state[2], self.state[3])
+
+    def run(self):
+        self.start()
+        try:
+            with python_frames(self.program.call_stack.limit):
+                self.step()
+        finally:
+            self.program.writer.flush()
+
+    async def run_async(self, every = 1000, reader = None):
+        # Gives the event loop a turn every `every` instructions and awaits INPUT from an async reader
+        # asyncio is imported here so plain runs do not pay for importing it
+        import asyncio
+
+        program = self.program
+        writer = program.writer
+        self.start()
+        self.asynchronous = True
+        self.every = every
+        try:
+            with python_frames(program.call_stack.limit):
+                while True:
+                    status = self.step(every, reader is not None)
+                    if hasattr(writer, "drain"):
+                        await writer.drain()
+                    if status == HALT:
+                        break
+                    if status == READ:
+                        identifier = self.state[0][self.state[1] - 1][2]
+                        variable = program.input_target(identifier)
+                        writer.flush()
+                        if hasattr(writer, "drain"):
+                            await writer.drain()
+                        try:
+                            variable.data = await reader.read(variable.type)
+                        except EOFError:
+                            program.throw(Error, f"No input left for '{identifier}'", "Input Error")
+                    else:
+                        await asyncio.sleep(0)
+        finally:
+            writer.flush()
+            if hasattr(writer, "drain"):
+                await writer.drain()
+
+    def run_function(self, instruction, values):
+        # The expression that called the FUNCTION is only part way through, so it runs in a step loop of its own.
+        # Returning to None stops that loop with LEAVE
+        program = self.program
+        program.enter(program.functions[id(instruction)], values)
+        call = program.call_stack.top
+        line = program.line
+        state = self.state
+        self.state = (self.methods[id(instruction)].instructions, 0, [], [(None, 0, 0)])
+        if self.asynchronous:
+            # The event loop only gets a turn once the expression is done, and INPUT can only be awaited there.
+            # The outermost FUNCTION starts the clock, the FUNCTIONs it calls share its time
+            outermost = self.deadline is None
+            if outermost:
+                self.deadline = time.monotonic() + ASYNC_FUNCTION_TIME
+            try:
+                while True:
+                    status = self.step(self.every, True)
+                    if status == READ:
+                        program.throw(Error, "INPUT cannot be used in a FUNCTION called from an expression in an asynchronous run", "Input Error")
+                    if time.monotonic() > self.deadline:
+                        program.throw(LimitError, "time", f"FUNCTION '{instruction.identifier}' held up every other task for more than {ASYNC_FUNCTION_TIME} second")
+                    if status == LEAVE:
+                        break
+            finally:
+                if outermost:
+                    self.deadline = None
+        else:
+            self.step()
+        self.state = state
+        program.line = line
+        return call.result
+
+    def step(self, budget = -1, suspend = False):
+        # Runs until HALT, or a FUNCTION's own loop until LEAVE. Returns None once `budget` instructions have run,
+        # and READ at an INPUT when suspending
+        program = self.program
+
+        evaluate = program.evaluate
+        call_stack = program.call_stack
+        methods = self.methods
+        tracer = program.tracer
+        fast = tracer is None
+
+        global_ = call_stack[0].values
+        local = call_stack.top.values
+        code, pc, loops, returns = self.state
+        # The countdown stays on the program, FUNCTIONs run in step loops of their own and count towards it too
+        limited = program.interval != -1
+
+        while True:
+            budget -= 1
+            if budget == 0:
+                self.save(code, pc)
+                return None
+
+            opcode, line, a, b, c, counted = code[pc]
+            pc += 1
+            program.line = line
+
+            if limited and counted:
+                program.countdown -= 1
+                if program.countdown == 0:
+                    program.countdown = program.tick()
+
+            if opcode == FOR_NEXT:
+                index = next(loops[-1], None)
+                if index is None:
+                    loops.pop()
+                    pc = b
+                    continue
+                properties = local[a.slot] if a.depth == LOCAL else global_[a.slot] if a.slot is not None else None
+                if fast and type(properties) == Variable and properties.type == "INTEGER":
+                    properties.data = index
+                else:
+                    program.assign(a, index)
+
+            elif opcode == ASSIGN:
+                properties = local[a.slot] if a.depth == LOCAL else global_[a.slot] if a.slot is not None else None
+                if fast and type(properties) == Variable:
+                    function = b.function
+                    value = b.literal
+                    if function is not None:
+                        try:
+                            value = function(global_, local, program)
+                        except Exception as error:
+                            value = program.failed(error)
+                    if value is not None and PYTHON_TO_PSEUDO.get(type(value)) == properties.type:
+                        properties.data = value
+                    elif function is None:
+                        # Let the interpreter report the error exactly as it would
+                        program.assign(a, b)
+                    else:
+                        # Without evaluating again, a FUNCTION in the expression would run twice
+                        program.store(properties, value, b)
+                else:
+                    program.assign(a, b)
+
+            elif opcode == JUMP:
+                pc = b
+
+            elif opcode == JUMP_UNLESS_TRUE or opcode == JUMP_IF_TRUE or opcode == JUMP_IF_FALSE:
+                function = a.function
+                if function is not None:
+                    try:
+                        result = function(global_, local, program)
+                    except Exception as error:
+                        result = program.failed(error)
+                else:
+                    result = evaluate(a)
+                if result is None and c is not None:
+                    program.throw(Error, c)
+                if opcode == JUMP_UNLESS_TRUE:
+                    if not (result is True or result is TRUE):
+                        pc = b
+                elif opcode == JUMP_IF_TRUE:
+                    if result is True or result is TRUE:
+                        pc = b
+                elif result is False or result is FALSE:
+                    pc = b
+
+            elif opcode == WRITE:
+                program.output(a)
+
+            elif opcode == CHECK:
+                if evaluate(a) is None:
+                    program.throw(Error, c)
+
+            elif opcode == FOR_INIT:
+                loops.append(iter(program.for_range(a)))
+
+            elif opcode == INVOKE:
+                procedure = program.enter_call(a, b)
+                returns.append((code, pc, len(loops)))
+                code = methods[id(procedure.statements)].instructions
+                pc = 0
+                local = call_stack.top.values
+
+            elif opcode == END_CALL:
+                call_stack.pop()
+                code, pc, _ = returns.pop()
+                local = call_stack.top.values
+
+            elif opcode == LEAVE:
+                program.leave(a)
+                if tracer is not None:
+                    tracer.emit(("returned", line))
+                call_stack.pop()
+                code, pc, depth = returns.pop()
+                # The loops the RETURN was in are left with it
+                del loops[depth:]
+                if code is None:
+                    return LEAVE
+                local = call_stack.top.values
+
+            elif opcode == DECLARE_VARIABLES:
+                program.declare_variables(a, b)
+
+            elif opcode == DECLARE_CONSTANT:
+                program.declare_constant(a, b)
+
+            elif opcode == DECLARE_METHOD:
+                program.declare_method(a)
+
+            elif opcode == READ:
+                if suspend:
+                    # The caller reads the value and resumes at the next instruction
+                    self.save(code, pc)
+                    return READ
+                program.read_input(a)
+
+            elif opcode == FAIL:
+                program.throw(Error, a)
+
+            elif opcode == HALT:
+                self.save(code, pc - 1)
+                return HALT
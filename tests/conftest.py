@@ -0,0 +1,36 @@
+import io
+import sys
+import importlib.util
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The checkout itself is the pseudolang package, whatever its folder is called
+if "pseudolang" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("pseudolang", ROOT / "__init__.py", submodule_search_locations=[str(ROOT)])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["pseudolang"] = package
+    spec.loader.exec_module(package)
+
+from pseudolang.modules.program import Program
+from pseudolang.modules.batch import run_program
+from pseudolang.modules.output import OutputWriter
+from pseudolang.modules.inputs import InputReader
+from pseudolang.modules.errors import PseudoLangError
+
+def lines(source):
+    return [line.strip() for line in source.splitlines()]
+
+def run(source, mode = "tree", inputs = "", **options):
+    # Everything a run prints, with the report of the error that stopped it. mode is tree, vm, py or stream
+    sink = io.StringIO()
+    program = Program(lines(source), writer=OutputWriter(sink, "block"), reader=InputReader(inputs), **options)
+    try:
+        if mode == "stream":
+            program.run_stream()
+        else:
+            program.parse()
+            run_program(program, mode)
+    except PseudoLangError as error:
+        program.report(error)
+    return sink.getvalue()
@@ -0,0 +1,91 @@
+import functools
+
+import pytest
+
+from conftest import ROOT, run
+
+PROGRAMS = sorted(ROOT.glob("examples/*.pseudo")) + sorted(ROOT.glob("benchmarks/*.pseudo"))
+INPUTS = "\n".join(["7"] * 20)
+
+# Programs stopped by an error, the report has to name the same line and error everywhere
+ERRORS = {
+    "division": """
+        DECLARE A : REAL
+        OUTPUT "before"
+        A <- 1 / 0
+        OUTPUT "after"
+    """,
+    "undeclared": """
+        DECLARE A : INTEGER
+        A <- B + 1
+    """,
+    "type": """
+        DECLARE A : INTEGER
+        A <- "text"
+    """,
+    "loop": """
+        DECLARE I : INTEGER
+        DECLARE A : INTEGER
+        FOR I <- 1 TO 5
+            OUTPUT I
+            A <- I DIV (3 - I)
+        NEXT I
+    """,
+    "condition": """
+        DECLARE A : INTEGER
+        A <- 1
+        WHILE A < 3
+            A <- A + 1
+            OUTPUT A
+        ENDWHILE
+        WHILE A < Missing
+            A <- A + 1
+        ENDWHILE
+    """,
+    "procedure": """
+        PROCEDURE Inner(N : INTEGER)
+            OUTPUT N
+            OUTPUT N / 0
+        ENDPROCEDURE
+        PROCEDURE Outer()
+            CALL Inner(3)
+        ENDPROCEDURE
+        CALL Outer()
+    """,
+    "function": """
+        FUNCTION Half(N : INTEGER) RETURNS INTEGER
+            IF N > 0 THEN
+                RETURN N DIV 2
+            ENDIF
+        ENDFUNCTION
+        OUTPUT Half(4)
+        OUTPUT Half(0)
+    """,
+    "argument": """
+        FUNCTION Twice(N : INTEGER) RETURNS INTEGER
+            RETURN N * 2
+        ENDFUNCTION
+        OUTPUT Twice(1.5)
+    """,
+}
+
+# Every way of running a program besides the interpreter, as (mode, optimizer level)
+BACKENDS = [("vm", 0), ("py", 0), ("tree", 2), ("vm", 2), ("stream", 0)]
+
+@functools.lru_cache(maxsize=None)
+def interpreted(source):
+    return run(source, "tree", INPUTS)
+
+@pytest.mark.parametrize("mode, optimize", BACKENDS)
+@pytest.mark.parametrize("path", PROGRAMS, ids=lambda path: f"{path.parent.name}/{path.stem}")
+def test_programs(path, mode, optimize):
+    source = path.read_text()
+    assert run(source, mode, INPUTS, optimize=optimize) == interpreted(source)
+
+@pytest.mark.parametrize("mode, optimize", BACKENDS)
+@pytest.mark.parametrize("name", ERRORS)
+def test_errors(name, mode, optimize):
+    source = ERRORS[name]
+    expected = interpreted(source)
+    assert "PSEUDOLANG ERROR" in expected
+    assert run(source, mode, INPUTS, optimize=optimize) == expected
@@ -0,0 +1,58 @@
+import io
+
+from conftest import ROOT, OutputWriter, InputReader, lines, run
+from pseudolang.modules.cache import ProgramCache
+from pseudolang.modules.loader import LoadCache, load
+
+SOURCE = (ROOT / "examples" / "multiplication.pseudo").read_text()
+
+def output(source, mode = "tree", **options):
+    # The example asks for a number
+    return run(source, mode, "7", **options)
+
+def test_program_cache_round_trip(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    assert cache.load(lines(SOURCE)) is None
+    expected = output(SOURCE)
+
+    # The first run parses and stores, the second loads what was stored
+    assert output(SOURCE, cache=cache) == expected
+    assert len(list(tmp_path.glob("*.pickle"))) == 1
+    assert cache.load(lines(SOURCE)) is not None
+    assert output(SOURCE, cache=cache) == expected
+    assert output(SOURCE, "vm", cache=cache) == expected
+
+    # Optimized programs are kept apart from unoptimized ones
+    assert output(SOURCE, cache=cache, optimize=2) == expected
+    assert len(list(tmp_path.glob("*.pickle"))) == 2
+    assert output(SOURCE, cache=cache, optimize=2) == expected
+
+def test_changed_source_is_parsed_again(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    output(SOURCE, cache=cache)
+    changed = SOURCE + "\nOUTPUT \"changed\"\n"
+    assert cache.load(lines(changed)) is None
+    assert output(changed, cache=cache).endswith("changed\n")
+
+def test_broken_entries_are_ignored(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    output(SOURCE, cache=cache)
+    for path in tmp_path.glob("*.pickle"):
+        path.write_bytes(b"not a pickle")
+    assert cache.load(lines(SOURCE)) is None
+    assert output(SOURCE, cache=cache) == output(SOURCE)
+
+def test_load_cache_reuses_programs():
+    cache = LoadCache(2)
+    first = load(SOURCE, cache)
+    assert load(SOURCE, cache) is first
+    assert load(SOURCE, cache, optimize=2) is not first
+    assert cache.info().hits == 1 and cache.info().size == 2
+
+    # Runs of a loaded program start afresh and never change it
+    outputs = []
+    for mode in ("tree", "vm", "py"):
+        sink = io.StringIO()
+        first.run(mode, writer=OutputWriter(sink, "block"), reader=InputReader("7"))
+        outputs.append(sink.getvalue())
+    assert outputs == [output(SOURCE)] * 3
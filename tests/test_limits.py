@@ -0,0 +1,93 @@
+import io
+
+import pytest
+
+import pseudolang
+from conftest import OutputWriter, PseudoLangError, run
+from pseudolang import Limits
+
+LOOP = """
+DECLARE A : INTEGER
+A <- 0
+WHILE TRUE
+    A <- A + 1
+ENDWHILE
+"""
+
+# Every kind of statement and loop, to check both backends count instructions at the same places
+MIXED = """
+DECLARE A : INTEGER
+DECLARE I : INTEGER
+A <- 0
+PROCEDURE Bump(N : INTEGER)
+    // a comment
+    A <- A + N
+ENDPROCEDURE
+FUNCTION Twice(N : INTEGER) RETURNS INTEGER
+    RETURN N * 2
+ENDFUNCTION
+REPEAT
+    FOR I <- 1 TO 3
+        IF I = 1 THEN
+            A <- A + 1
+        ELSE IF I = 2 THEN
+            CALL Bump(Twice(I))
+        ELSE
+            A <- A - 1
+        ENDIF
+    NEXT I
+    FOR I <- 5 TO 1
+        A <- 0
+    NEXT I
+    WHILE A < 0
+        A <- 1
+    ENDWHILE
+UNTIL A < 0
+"""
+
+RECURSION = """
+PROCEDURE Down(N : INTEGER)
+    CALL Down(N + 1)
+ENDPROCEDURE
+CALL Down(1)
+"""
+
+OUTPUT = """
+WHILE TRUE
+    OUTPUT "spam"
+ENDWHILE
+"""
+
+@pytest.mark.parametrize("source", [LOOP, MIXED], ids=["loop", "mixed"])
+def test_instruction_limit_stops_at_the_same_line(source):
+    for instructions in list(range(1, 80)) + [1000, 1001, 1002]:
+        limits = Limits(instructions=instructions)
+        expected = run(source, "tree", limits=limits)
+        assert f"Instruction limit of {instructions} reached" in expected
+        assert run(source, "vm", limits=limits) == expected
+        assert run(source, "py", limits=limits) == expected
+
+def test_loop_checks_count():
+    # DECLARE, A <- 0 and WHILE on lines 2 to 4, then the body and the WHILE's check in turn
+    assert "ERROR (Line 5)" in run(LOOP, limits=Limits(instructions=1000))
+    assert "ERROR (Line 4)" in run(LOOP, limits=Limits(instructions=1001))
+
+@pytest.mark.parametrize("mode", ["tree", "vm", "py"])
+def test_depth_limit(mode):
+    assert "Call depth limit of 50 reached" in run(RECURSION, mode, limits=Limits(depth=50))
+
+@pytest.mark.parametrize("mode", ["tree", "vm", "py"])
+def test_output_limit(mode):
+    output = run(OUTPUT, mode, limits=Limits(output=100))
+    assert "Output limit of 100 characters reached" in output
+    assert output.count("spam") <= 25
+
+@pytest.mark.parametrize("mode", ["tree", "vm"])
+def test_time_limit(mode):
+    assert "Time limit of 0.2 seconds reached" in run(LOOP, mode, limits=Limits(time=0.2))
+
+def test_loaded_programs_take_limits():
+    loaded = pseudolang.load(LOOP)
+    for mode in ("tree", "vm", "py"):
+        with pytest.raises(PseudoLangError, match="Instruction limit of 100 reached"):
+            loaded.run(mode, writer=OutputWriter(io.StringIO(), "block"), limits=Limits(instructions=100))
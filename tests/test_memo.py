@@ -0,0 +1,62 @@
+import pytest
+
+from conftest import Program, lines, run
+from pseudolang.modules.memo import MemoCache, pure_functions
+
+# Only Fib and Square may be remembered: Shout prints, Peek reads a global that changes and Ask reads input
+SOURCE = """
+DECLARE Counter : INTEGER
+DECLARE I : INTEGER
+Counter <- 0
+FUNCTION Fib(N : INTEGER) RETURNS INTEGER
+    IF N < 2 THEN
+        RETURN N
+    ENDIF
+    RETURN Fib(N - 1) + Fib(N - 2)
+ENDFUNCTION
+FUNCTION Square(N : INTEGER) RETURNS INTEGER
+    DECLARE S : INTEGER
+    S <- N * N
+    RETURN S
+ENDFUNCTION
+FUNCTION Shout(N : INTEGER) RETURNS INTEGER
+    OUTPUT "shout ", N
+    RETURN N
+ENDFUNCTION
+FUNCTION Peek(N : INTEGER) RETURNS INTEGER
+    RETURN N + Counter
+ENDFUNCTION
+FUNCTION Ask(N : INTEGER) RETURNS INTEGER
+    DECLARE V : INTEGER
+    INPUT V
+    RETURN N + V
+ENDFUNCTION
+FOR I <- 1 TO 3
+    Counter <- Counter + 1
+    OUTPUT Fib(18), " ", Square(4), " ", Shout(1), " ", Peek(1), " ", Ask(1)
+NEXT I
+"""
+
+INPUTS = "1\n2\n3"
+
+def test_only_pure_functions_are_found():
+    program = Program(lines(SOURCE))
+    instructions = program.parse()
+    names = set(instruction.identifier for instruction in instructions if id(instruction) in pure_functions(instructions))
+    assert names == {"Fib", "Square"}
+
+@pytest.mark.parametrize("mode", ["tree", "vm", "py"])
+def test_impure_functions_run_every_time(mode):
+    memo = MemoCache(1000)
+    output = run(SOURCE, mode, INPUTS, memo=memo)
+    assert output == run(SOURCE, mode, INPUTS)
+    assert output.count("shout 1") == 3
+    info = memo.info()
+    assert set(info) == {"Fib", "Square"}
+    assert info["Fib"].hits > 0 and info["Square"].hits == 2
+
+def test_results_are_not_shared_between_programs():
+    memo = MemoCache(1000)
+    run(SOURCE, "tree", INPUTS, memo=memo)
+    other = SOURCE.replace("RETURN N\n", "RETURN N + 1\n", 1)
+    assert run(other, "tree", INPUTS, memo=memo) == run(other, "tree", INPUTS)
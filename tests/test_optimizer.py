@@ -0,0 +1,73 @@
+import pytest
+
+from conftest import Program, lines, run
+from pseudolang.modules.optimizer import listing
+
+# Hoisting B / 0 or an uninitialised B ahead of the loop would lose the OUTPUT before it and
+# report the error at the FOR line
+DIVISION = """
+DECLARE A : REAL
+DECLARE B : REAL
+DECLARE I : INTEGER
+B <- 1.0
+A <- 0.0
+FOR I <- 1 TO 3
+    OUTPUT "iter ", I
+    A <- B / 0 + I
+NEXT I
+"""
+
+UNINITIALISED = """
+DECLARE A : INTEGER
+DECLARE B : INTEGER
+DECLARE I : INTEGER
+FOR I <- 1 TO 3
+    OUTPUT "iter ", I
+    A <- B * 2 + I
+NEXT I
+"""
+
+INVARIANT = """
+DECLARE A : INTEGER
+DECLARE B : INTEGER
+DECLARE I : INTEGER
+B <- 4
+A <- 0
+FOR I <- 1 TO 3
+    OUTPUT "iter ", I
+    A <- A + B * 2 + I
+NEXT I
+OUTPUT A
+PROCEDURE P(N : INTEGER, R : REAL)
+    DECLARE J : INTEGER
+    DECLARE S : REAL
+    S <- 0.0
+    FOR J <- 1 TO 2
+        S <- S + R * 2.0 + N * 3
+    NEXT J
+    OUTPUT S
+ENDPROCEDURE
+CALL P(2, 1.5)
+"""
+
+def optimized(source):
+    program = Program(lines(source), optimize=2)
+    return listing(program.parse())
+
+@pytest.mark.parametrize("mode", ["tree", "vm", "py"])
+@pytest.mark.parametrize("source", [DIVISION, UNINITIALISED], ids=["division", "uninitialised"])
+def test_hoisting_keeps_output_and_errors(source, mode):
+    expected = run(source, mode)
+    assert "iter 1" in expected and "PSEUDOLANG ERROR (Line" in expected
+    assert run(source, mode, optimize=2) == expected
+
+def test_arithmetic_that_can_raise_stays_in_the_loop():
+    assert "Invariant" not in optimized(DIVISION)
+    assert "Invariant" not in optimized(UNINITIALISED)
+
+def test_invariant_arithmetic_is_hoisted():
+    text = optimized(INVARIANT)
+    assert "CONSTANT Invariant1 = B * 2" in text
+    assert "R * 2.0" in text and "N * 3" in text
+    for mode in ("tree", "vm", "py"):
+        assert run(INVARIANT, mode, optimize=2) == run(INVARIANT, mode)
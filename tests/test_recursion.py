@@ -0,0 +1,70 @@
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from pseudolang.modules.classes import CALL_DEPTH
+
+# A crash takes the whole process with it, so every program runs in a process of its own
+SCRIPT = """
+import sys
+sys.path.insert(0, {tests!r})
+from conftest import run
+from pseudolang.modules.memo import MemoCache
+memo = MemoCache(100) if {memo!r} else None
+print(run(sys.stdin.read(), {mode!r}, memo=memo))
+"""
+
+# The AND chain evaluates its operands in a loop of its own, where FUNCTIONs once nested on the C stack
+CHAIN = """
+FUNCTION Ok(N : INTEGER) RETURNS BOOLEAN
+    IF N = 0 THEN
+        RETURN TRUE
+    ENDIF
+    RETURN TRUE AND TRUE AND Ok(N - 1)
+ENDFUNCTION
+OUTPUT "start"
+OUTPUT Ok({depth})
+"""
+
+SUM = """
+FUNCTION Sum(N : INTEGER) RETURNS INTEGER
+    IF N = 0 THEN
+        RETURN 0
+    ENDIF
+    RETURN int(Sum(N - 1)) + 1
+ENDFUNCTION
+OUTPUT "start"
+OUTPUT Sum({depth})
+"""
+
+PROCEDURE = """
+PROCEDURE Down(N : INTEGER)
+    IF N > 0 THEN
+        CALL Down(N - 1)
+    ENDIF
+ENDPROCEDURE
+OUTPUT "start"
+CALL Down({depth})
+OUTPUT "done"
+"""
+
+def run_apart(source, mode, memo = False):
+    script = SCRIPT.format(tests=str(Path(__file__).parent), mode=mode, memo=memo)
+    result = subprocess.run([sys.executable, "-c", script], input=source, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result.stdout
+
+MODES = [("tree", False), ("vm", False), ("py", False), ("py", True)]
+
+@pytest.mark.parametrize("mode, memo", MODES)
+@pytest.mark.parametrize("source", [CHAIN, SUM, PROCEDURE], ids=["chain", "sum", "procedure"])
+def test_too_deep_is_a_stack_overflow(source, mode, memo):
+    output = run_apart(source.format(depth=CALL_DEPTH + 10), mode, memo)
+    assert output.startswith("start\n")
+    assert "Stack Overflow Error" in output
+
+@pytest.mark.parametrize("mode, memo", MODES)
+def test_deep_chain_finishes(mode, memo):
+    assert run_apart(CHAIN.format(depth=20000), mode, memo) == "start\nTRUE\n\n"